@@ -0,0 +1,2 @@
+from .suite import BENCHMARKS, run_benchmarks
+from .compare import compare_results, read_results, write_results
@@ -0,0 +1,80 @@
+import argparse
+import os
+import sys
+
+from gpnet_sim.AutoGraspSimpleShapeCore import WORLD_MODES
+
+from .compare import DEFAULT_TOLERANCE, compare_results, read_results, write_results
+from .suite import BENCHMARKS, DEFAULT_TEST_FILE, run_benchmarks
+
+BENCHMARK_DIR = os.path.dirname(__file__)
+
+
+def parser():
+    benchParser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='throughput benchmarks of the simulator on the bundled predictions. Results are written to a json '
+                    'file and compared against a stored baseline, the exit code is 1 if a metric has regressed.')
+    benchParser.add_argument('--only', nargs='+', default=BENCHMARKS, choices=BENCHMARKS, metavar='NAME',
+                             help=f'benchmarks to run, some of {BENCHMARKS}')
+    benchParser.add_argument('-t', '--testFile', type=str, default=DEFAULT_TEST_FILE,
+                             help='file with grasp predictions')
+    benchParser.add_argument('-r', '--repeats', type=int, default=5,
+                             help='runs of parser and aggregation, of which the median time is taken')
+    benchParser.add_argument('--worldModes', nargs='+', default=WORLD_MODES, choices=WORLD_MODES,
+                             help='world modes of the phases benchmark')
+    benchParser.add_argument('--grasps', type=int, default=None,
+                             help='number of grasps of the phases benchmark, all grasps if not given')
+    benchParser.add_argument('--logCopies', type=int, default=100,
+                             help='copies of all grasps in the log file of the aggregation benchmark')
+    benchParser.add_argument('-p', '--processNums', nargs='+', type=int, default=[1, 2, 4],
+                             help='numbers of processes of the end-to-end benchmark')
+    benchParser.add_argument('--worldMode', default='fresh', choices=WORLD_MODES,
+                             help='world mode of the end-to-end benchmark')
+    benchParser.add_argument('-o', '--output', type=str, default=os.path.join(BENCHMARK_DIR, 'results.json'),
+                             help='json file the results are written to')
+    benchParser.add_argument('-b', '--baseline', type=str, default=os.path.join(BENCHMARK_DIR, 'baseline.json'),
+                             help='json file with the baseline results')
+    benchParser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                             help='relative change in the worse direction above which a metric counts as regression')
+    benchParser.add_argument('--saveBaseline', action='store_true',
+                             help='writes the results to the baseline file instead of comparing against it')
+    benchParser.add_argument('--compare', type=str, default=None, metavar='RESULTS',
+                             help='compares an existing results file against the baseline without running benchmarks')
+    return benchParser
+
+
+def main(args=None):
+    cfg = parser().parse_args(args)
+    if cfg.compare is not None:
+        results = read_results(cfg.compare)
+    else:
+        config = {
+            'testFile': os.path.relpath(cfg.testFile, os.path.join(BENCHMARK_DIR, '..')),
+            'repeats': cfg.repeats,
+            'worldModes': cfg.worldModes,
+            'grasps': cfg.grasps,
+            'logCopies': cfg.logCopies,
+            'processNums': cfg.processNums,
+            'worldMode': cfg.worldMode,
+        }
+        metrics = run_benchmarks(cfg.only, cfg.testFile, cfg.repeats, cfg.worldModes, cfg.grasps, cfg.logCopies,
+                                 cfg.processNums, cfg.worldMode)
+        outputFile = cfg.baseline if cfg.saveBaseline else cfg.output
+        write_results(outputFile, metrics, config)
+        print(f'results written to {outputFile}')
+        if cfg.saveBaseline:
+            return 0
+        results = read_results(outputFile)
+
+    if not os.path.isfile(cfg.baseline):
+        print(f'no baseline {cfg.baseline}, create one with --saveBaseline')
+        return 0
+    regressions = compare_results(results, read_results(cfg.baseline), cfg.tolerance)
+    if regressions:
+        print(f'{len(regressions)} metrics regressed by more than {cfg.tolerance:.0%}: {", ".join(regressions)}')
+        return 1
+    return 0
+
+
+sys.exit(main())
@@ -0,0 +1,92 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+import numpy as np
+import pybullet
+
+# relative change of a metric in its worse direction above which it counts as a regression
+DEFAULT_TOLERANCE = 0.15
+
+
+def machine_info():
+    """
+    :return: dict describing the machine and versions the benchmarks ran with
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(__file__),
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pybullet api': pybullet.getAPIVersion(),
+        'commit': commit,
+    }
+
+
+def write_results(filename, metrics, config):
+    """
+    Writes the metrics together with machine info and benchmark config to a json file.
+    """
+    with open(filename, 'w') as f:
+        json.dump({'date': datetime.now().isoformat(timespec='seconds'), 'machine': machine_info(), 'config': config,
+                   'metrics': metrics}, f, indent=2)
+
+
+def read_results(filename):
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def relative_change(current, baseline):
+    """
+    :return: relative change of the current value of a metric against the baseline, positive if it got worse
+    """
+    change = (current['value'] - baseline['value']) / baseline['value'] if baseline['value'] != 0 else 0.0
+    return change if baseline['better'] == 'lower' else -change
+
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares all metrics of the results which are also in the baseline and prints them.
+
+    :param results: dict as written by write_results()
+    :param baseline: dict as written by write_results()
+    :param tolerance: relative change in the worse direction above which a metric counts as a regression
+
+    :return: list of names of the regressed metrics
+    """
+    for key in ['cpus', 'python', 'pybullet api']:
+        if results['machine'].get(key) != baseline['machine'].get(key):
+            print(f'warning: {key} differs from the baseline ({results["machine"].get(key)} vs '
+                  f'{baseline["machine"].get(key)}), timings are not comparable')
+    if results['config'] != baseline['config']:
+        print('warning: benchmark config differs from the baseline')
+
+    regressions = []
+    print(f'{"metric":<45} {"baseline":>12} {"current":>12} {"change":>8}')
+    for name, current in results['metrics'].items():
+        if name not in baseline['metrics']:
+            continue
+        change = relative_change(current, baseline['metrics'][name])
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = 'REGRESSION'
+        elif change < -tolerance:
+            flag = 'improved'
+        # the printed change is that of the value, whatever the better direction
+        valueChange = change if current['better'] == 'lower' else -change
+        print(f'{name:<45} {baseline["metrics"][name]["value"]:>12.3f} {current["value"]:>12.3f} '
+              f'{valueChange:>+8.1%} {flag}')
+    missing = sorted(set(baseline['metrics'].keys()) - set(results['metrics'].keys()))
+    if missing:
+        print(f'{len(missing)} metrics of the baseline have not been measured', file=sys.stderr)
+    return regressions
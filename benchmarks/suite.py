@@ -0,0 +1,201 @@
+import os
+import tempfile
+from time import perf_counter
+
+import numpy as np
+import pybullet
+
+from gpnet_sim.AutoGraspShapeCoreUtil import AutoGraspUtil
+from gpnet_sim.AutoGraspSimpleShapeCore import PHASES, WORLD_MODES, AutoGraspSimple
+from gpnet_sim.results import format_log_line, load_results, write_results_store
+from gpnet_sim.simulator import getObjStatusAndAnnotation, z_move
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+DEFAULT_TEST_FILE = os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt')
+OBJ_MESH_ROOT = os.path.join(PROJECT_DIR, 'gpnet_data/urdf')
+GRIPPER_FILE = os.path.join(PROJECT_DIR, 'gpnet_data/gripper/parallel_simple.urdf')
+
+# parser:       parsing the prediction file
+# phases:       simulation of single grasps in one process, with time and steps of each phase (see PHASES of
+#               AutoGraspSimpleShapeCore), including the per-grasp world setup, for each world mode
+# aggregation:  reading a log file and computing all statistics of simulate(), from csv and from the results store
+# end-to-end:   parallelSimulation of all grasps for each number of processes
+BENCHMARKS = ['parser', 'phases', 'aggregation', 'end-to-end']
+
+
+def metric(value, unit, better='lower'):
+    """
+    :param better: 'lower' or 'higher', direction in which the value improves
+    :return: dict of a metric as stored in the results json
+    """
+    return {'value': float(value), 'unit': unit, 'better': better}
+
+
+def median_time(fn, repeats):
+    """
+    :return: median wall time of repeats calls of fn in s
+    """
+    times = []
+    for _ in range(repeats):
+        startTime = perf_counter()
+        fn()
+        times.append(perf_counter() - startTime)
+    return float(np.median(times))
+
+
+def load_grasps(testFile):
+    """
+    Parses the prediction file and prepares the annotations as simulate() does (with z move).
+
+    :return: AutoGraspUtil with all grasps added, list of objIds
+    """
+    quaternionDict, centerDict, objIdList = getObjStatusAndAnnotation(testFile)
+    simulator = AutoGraspUtil()
+    for objId in objIdList:
+        simulator.addObject2(objId, quaternionDict[objId], z_move(centerDict[objId], quaternionDict[objId]))
+    return simulator, objIdList
+
+
+def bench_parser(testFile, repeats):
+    graspNum = sum(len(centers) for centers in getObjStatusAndAnnotation(testFile)[1].values())
+    seconds = median_time(lambda: getObjStatusAndAnnotation(testFile), repeats)
+    return {
+        'parser/time per file': metric(seconds * 1000, 'ms'),
+        'parser/throughput': metric(graspNum / seconds, 'grasps/s', 'higher'),
+    }
+
+
+def simulate_phases(grasps, worldMode):
+    """
+    Simulates the grasps one after the other in this process, as annotationSimulation() does.
+
+    :param grasps: list of (objId, annotation)
+    :return: dicts with time in s and simulation steps of each phase, summed over all grasps
+    """
+    recorder = None
+    autoGraspInstance = None
+    for objId, annotation in grasps:
+        objectURDFFile = os.path.join(OBJ_MESH_ROOT, objId + '.urdf')
+        if autoGraspInstance is None or worldMode == 'fresh':
+            autoGraspInstance = AutoGraspSimple(objectURDFFile, GRIPPER_FILE, annotation[0], annotation[1:4],
+                                                annotation[4:8], serverMode=pybullet.DIRECT, worldMode=worldMode)
+            if recorder is None:
+                autoGraspInstance.recordPhases()
+                recorder = autoGraspInstance
+            else:
+                # a fresh world needs a new instance for each grasp, which adds to the same records
+                autoGraspInstance.phaseTimes = recorder.phaseTimes
+                autoGraspInstance.phaseSteps = recorder.phaseSteps
+        else:
+            autoGraspInstance.resetGrasp(objectURDFFile, annotation[0], annotation[1:4], annotation[4:8])
+        autoGraspInstance.startSimulation()
+    autoGraspInstance.closeWorld()
+    return recorder.phaseTimes, recorder.phaseSteps
+
+
+def bench_phases(testFile, worldModes, graspNum=None):
+    simulator, objIdList = load_grasps(testFile)
+    grasps = [(objId, annotation) for objId in objIdList for annotation in simulator.annotationDict[objId]]
+    if graspNum is not None and graspNum < len(grasps):
+        # evenly spaced, so that all objects are included
+        grasps = [grasps[i] for i in np.linspace(0, len(grasps) - 1, graspNum).astype(int)]
+
+    metrics = {}
+    for worldMode in worldModes:
+        phaseTimes, phaseSteps = simulate_phases(grasps, worldMode)
+        for phase in PHASES:
+            metrics[f'phases/{worldMode}/{phase} time'] = metric(phaseTimes[phase] / len(grasps) * 1000, 'ms/grasp')
+            if phase != 'setup' and phase != 'evaluation':
+                metrics[f'phases/{worldMode}/{phase} steps'] = metric(phaseSteps[phase] / len(grasps), 'steps/grasp')
+        metrics[f'phases/{worldMode}/total time'] = metric(sum(phaseTimes.values()) / len(grasps) * 1000,
+                                                           'ms/grasp')
+    return metrics
+
+
+def write_log(logFile, simulator, objIdList, copies):
+    """
+    Writes a log file with copies of all grasps of the prediction file (each copy as further objects), with
+    status codes cycling through all outcomes, as the outcomes do not matter for the time of the aggregation.
+
+    :return: objIdList, statusDict and annotationDict of the log
+    """
+    logObjIdList, statusDict, annotationDict = [], {}, {}
+    with open(logFile, 'w') as log:
+        for copy in range(copies):
+            for objId in objIdList:
+                logObjId = f'{objId}_{copy}'
+                annotations = simulator.annotationDict[objId]
+                statusList = (np.arange(len(annotations)) + copy) % 7
+                for annotationIndex, (status, annotation) in enumerate(zip(statusList, annotations)):
+                    log.write(format_log_line(logObjId, annotationIndex, status, annotation))
+                logObjIdList.append(logObjId)
+                statusDict[logObjId] = statusList
+                annotationDict[logObjId] = annotations
+    return logObjIdList, statusDict, annotationDict
+
+
+def aggregate(logFile):
+    """ reads the results and computes all statistics, as simulate() does """
+    results = load_results(logFile)
+    AutoGraspUtil.getStatistic(AutoGraspUtil.getSuccessData(results))
+    AutoGraspUtil.get_simulation_summary(results)
+
+
+def bench_aggregation(testFile, copies, repeats):
+    simulator, objIdList = load_grasps(testFile)
+    metrics = {}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        logFile = os.path.join(tmpDir, 'log.csv')
+        logObjIdList, statusDict, annotationDict = write_log(logFile, simulator, objIdList, copies)
+        graspNum = sum(len(statusList) for statusList in statusDict.values())
+        metrics['aggregation/csv time'] = metric(median_time(lambda: aggregate(logFile), repeats) * 1000, 'ms')
+        write_results_store(logFile, logObjIdList, statusDict, annotationDict)
+        seconds = median_time(lambda: aggregate(logFile), repeats)
+        metrics['aggregation/results store time'] = metric(seconds * 1000, 'ms')
+        metrics['aggregation/results store throughput'] = metric(graspNum / seconds, 'grasps/s', 'higher')
+    return metrics
+
+
+def bench_end_to_end(testFile, processNums, worldMode):
+    simulator, objIdList = load_grasps(testFile)
+    graspNum = sum(len(simulator.annotationDict[objId]) for objId in objIdList)
+    metrics = {}
+    for processNum in processNums:
+        startTime = perf_counter()
+        simulator.parallelSimulation(logFile=None, objMeshRoot=OBJ_MESH_ROOT, processNum=processNum,
+                                     gripperFile=GRIPPER_FILE, worldMode=worldMode)
+        seconds = perf_counter() - startTime
+        metrics[f'end-to-end/{worldMode}/{processNum} processes'] = metric(graspNum / seconds, 'sims/s', 'higher')
+    return metrics
+
+
+def run_benchmarks(names=BENCHMARKS, testFile=DEFAULT_TEST_FILE, repeats=5, worldModes=WORLD_MODES,
+                   graspNum=None, logCopies=100, processNums=(1, 2, 4), endToEndWorldMode='fresh'):
+    """
+    Runs the given benchmarks, each prints its metrics as soon as it has finished.
+
+    :param names: benchmarks to run, see BENCHMARKS
+    :param testFile: prediction file, the bundled one by default
+    :param repeats: number of runs of the parser and aggregation, of which the median time is taken
+    :param worldModes: world modes for the phases benchmark
+    :param graspNum: number of grasps for the phases benchmark, all grasps of the prediction file if None
+    :param logCopies: number of copies of the grasps in the log file of the aggregation benchmark
+    :param processNums: numbers of processes for the end-to-end benchmark
+    :param endToEndWorldMode: world mode of the end-to-end benchmark
+
+    :return: dict with metric name as key and metric (see metric()) as value
+    """
+    benchmarks = {
+        'parser': lambda: bench_parser(testFile, repeats),
+        'phases': lambda: bench_phases(testFile, worldModes, graspNum),
+        'aggregation': lambda: bench_aggregation(testFile, logCopies, repeats),
+        'end-to-end': lambda: bench_end_to_end(testFile, processNums, endToEndWorldMode),
+    }
+    metrics = {}
+    for name in names:
+        assert name in benchmarks, f'unknown benchmark {name}, use some of {BENCHMARKS}'
+        results = benchmarks[name]()
+        for key, value in results.items():
+            print(f'{key:<45} {value["value"]:>12.3f} {value["unit"]}')
+        metrics.update(results)
+    return metrics
@@ -0,0 +1,88 @@
+import argparse
+import os
+import threading
+from time import time
+
+import numpy as np
+
+from gpnet_sim.AutoGraspShapeCoreUtil import AutoGraspUtil
+from gpnet_sim.scheduler import BACKENDS
+from gpnet_sim.simulator import getObjStatusAndAnnotation, z_move
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+def process_tree_rss(pid):
+    """ resident memory in bytes of a process and all its descendants (linux only) """
+    children = {}
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    parent = int(f.read().rsplit(')', 1)[1].split()[1])
+                children.setdefault(parent, []).append(int(entry))
+            except (OSError, IndexError, ValueError):
+                pass
+    rss, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/statm') as f:
+                rss += int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except OSError:
+            pass
+    return rss
+
+
+class MemorySampler(threading.Thread):
+    """ samples the resident memory of this process and its children, keeps the peak """
+    def __init__(self, interval=0.1):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, process_tree_rss(os.getpid()))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='compares the process and thread backends of parallelSimulation')
+    parser.add_argument('-t', '--testFile', type=str, help='file with grasp predictions',
+                        default=os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt'))
+    parser.add_argument('-p', '--processNum', default=4, type=int, help='number of workers')
+    parser.add_argument('--worldMode', default='reuse', help='world mode of the simulations')
+    args = parser.parse_args()
+
+    simulator = AutoGraspUtil()
+    quaternionDict, centerDict, objIdList = getObjStatusAndAnnotation(args.testFile)
+    for objId in objIdList:
+        simulator.addObject2(objId, quaternionDict[objId], z_move(centerDict[objId], quaternionDict[objId]))
+    graspNum = sum(len(centerDict[objId]) for objId in objIdList)
+
+    results = {}
+    print(f'{graspNum} grasps, {args.processNum} workers, {os.cpu_count()} cpus')
+    for backend in BACKENDS:
+        sampler = MemorySampler()
+        sampler.start()
+        start_time = time()
+        statusDict = simulator.parallelSimulation(
+            logFile=None,
+            objMeshRoot=os.path.join(PROJECT_DIR, 'gpnet_data/urdf'),
+            processNum=args.processNum,
+            gripperFile=os.path.join(PROJECT_DIR, 'gpnet_data/gripper/parallel_simple.urdf'),
+            worldMode=args.worldMode,
+            backend=backend
+        )
+        total_time = time() - start_time
+        peak = sampler.stop()
+        results[backend] = np.concatenate([statusDict[objId] for objId in objIdList])
+        print(f'{backend}:\t{total_time:.2f} s\t{graspNum / total_time:.1f} grasps/s\tpeak memory {peak / 2 ** 20:.0f} MB')
+    print(f'identical outcomes: {np.array_equal(results["process"], results["thread"])}')
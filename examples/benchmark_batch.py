@@ -0,0 +1,59 @@
+import argparse
+import os
+from time import time
+
+import numpy as np
+import pybullet
+
+from gpnet_sim.AutoGraspShapeCoreUtil import AutoGraspUtil
+from gpnet_sim.simulator import getObjStatusAndAnnotation, z_move
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+class StepCounter(object):
+    """ wraps pybullet.stepSimulation to count the calls """
+    def __init__(self):
+        self.steps = 0
+        self.stepSimulation = pybullet.stepSimulation
+
+    def __call__(self, *args, **kwargs):
+        self.steps += 1
+        return self.stepSimulation(*args, **kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='compares simulating several grasps in one world for different ' +
+                                                 'batch sizes with simulating one grasp per world')
+    parser.add_argument('-t', '--testFile', type=str, help='file with grasp predictions',
+                        default=os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt'))
+    parser.add_argument('--batchSizes', nargs='+', default=[2, 4, 8, 16], type=int, help='batch sizes to test')
+    parser.add_argument('--fastControl', action='store_true', help='use the fast control path for all runs')
+    args = parser.parse_args()
+
+    simulator = AutoGraspUtil()
+    quaternionDict, centerDict, objIdList = getObjStatusAndAnnotation(args.testFile)
+    for objId in objIdList:
+        simulator.addObject2(objId, quaternionDict[objId], z_move(centerDict[objId], quaternionDict[objId]))
+    graspNum = sum(len(quaternionDict[objId]) for objId in objIdList)
+
+    # simulate in this process, so that the calls of stepSimulation can be counted
+    stepCounter = StepCounter()
+    pybullet.stepSimulation = stepCounter
+    results = {}
+    print(f'{"batch size":>10} {"time [s]":>9} {"grasps/s":>9} {"step calls":>11} {"agreement":>10}')
+    for batchSize in [1] + [batchSize for batchSize in args.batchSizes if batchSize != 1]:
+        stepCounter.steps = 0
+        start_time = time()
+        statusDict = simulator.parallelSimulation(
+            logFile=None,
+            objMeshRoot=os.path.join(PROJECT_DIR, 'gpnet_data/urdf'),
+            processNum=1,
+            gripperFile=os.path.join(PROJECT_DIR, 'gpnet_data/gripper/parallel_simple.urdf'),
+            fastControl=args.fastControl,
+            batchSize=batchSize
+        )
+        total_time = time() - start_time
+        results[batchSize] = np.concatenate([statusDict[objId] for objId in objIdList])
+        print(f'{batchSize:>10} {total_time:>9.2f} {graspNum / total_time:>9.1f} {stepCounter.steps:>11} '
+              f'{np.mean(results[batchSize] == results[1]):>10.3f}')
@@ -0,0 +1,62 @@
+import argparse
+import os
+from time import time
+
+import numpy as np
+import pybullet
+
+from gpnet_sim.AutoGraspShapeCoreUtil import AutoGraspUtil
+from gpnet_sim.AutoGraspSimpleShapeCore import WORLD_MODES
+from gpnet_sim.simulator import getObjStatusAndAnnotation, z_move
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+class StepCounter(object):
+    """ wraps pybullet.stepSimulation to count the simulation steps """
+    def __init__(self):
+        self.steps = 0
+        self.stepSimulation = pybullet.stepSimulation
+
+    def __call__(self, *args, **kwargs):
+        self.steps += 1
+        return self.stepSimulation(*args, **kwargs)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='compares the fast control path with the original control loop')
+    parser.add_argument('-t', '--testFile', type=str, help='file with grasp predictions',
+                        default=os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt'))
+    parser.add_argument('--worldMode', default='fresh', choices=WORLD_MODES)
+    args = parser.parse_args()
+
+    simulator = AutoGraspUtil()
+    quaternionDict, centerDict, objIdList = getObjStatusAndAnnotation(args.testFile)
+    for objId in objIdList:
+        simulator.addObject2(objId, quaternionDict[objId], z_move(centerDict[objId], quaternionDict[objId]))
+
+    # simulate in this process, so that the steps can be counted
+    stepCounter = StepCounter()
+    pybullet.stepSimulation = stepCounter
+    results = {}
+    for fastControl in [False, True]:
+        stepCounter.steps = 0
+        start_time = time()
+        statusDict = simulator.parallelSimulation(
+            logFile=None,
+            objMeshRoot=os.path.join(PROJECT_DIR, 'gpnet_data/urdf'),
+            processNum=1,
+            gripperFile=os.path.join(PROJECT_DIR, 'gpnet_data/gripper/parallel_simple.urdf'),
+            worldMode=args.worldMode,
+            fastControl=fastControl
+        )
+        total_time = time() - start_time
+        results[fastControl] = np.concatenate([statusDict[objId] for objId in objIdList])
+        print(f'fastControl={fastControl}:\t{total_time:.2f} s\t{stepCounter.steps} steps\t'
+              f'{stepCounter.steps / total_time:.0f} steps/s')
+
+    original, fast = results[False], results[True]
+    print(f'outcome agreement: {np.mean(original == fast):.4f} ({np.sum(original != fast)} of {len(original)} differ)')
+    for status in np.unique(np.concatenate([original, fast])):
+        print(f'\t{AutoGraspUtil.get_status_string(status)}:\toriginal {np.sum(original == status)}\t'
+              f'fast {np.sum(fast == status)}')
@@ -0,0 +1,68 @@
+import argparse
+import time
+
+import numpy as np
+
+from gpnet_sim import scheduler
+
+
+def process_rows(objId, annotations, annotationIndices, graspCost):
+    """ stands in for AutoGraspUtil.testAnnotationChunk(), busy for graspCost s per grasp """
+    end = time.perf_counter() + graspCost * len(annotations)
+    while time.perf_counter() < end:
+        pass
+    return objId, annotationIndices, np.zeros(len(annotations), dtype=int)
+
+
+def process_shared_rows(objId, sharedGrasps, offset, count, graspCost):
+    grasps = sharedGrasps.get(offset, offset + count)
+    return process_rows(objId, grasps[:, 1:], grasps[:, 0].astype(int), graspCost)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='measures the overhead of distributing grasps to worker processes')
+    parser.add_argument('-p', '--processNum', default=2, type=int, help='number of processes')
+    parser.add_argument('--graspNum', default=1000000, type=int, help='number of grasps')
+    parser.add_argument('--objectNum', default=100, type=int, help='number of objects')
+    parser.add_argument('--graspCost', default=0.0, type=float, help='simulated time per grasp in s')
+    args = parser.parse_args()
+
+    annotations = np.random.default_rng(0).random((args.graspNum, 8))
+    objIds = [f'object{i}' for i in range(args.objectNum)]
+    bounds = np.linspace(0, args.graspNum, args.objectNum + 1).astype(int)
+    counts = list(np.diff(bounds))
+
+    with scheduler.WorkerPool(args.processNum, inline=False) as pool:
+        pool.run_on_all(int)
+
+        # pickled annotation rows in chunks of fixed size
+        start_time = time.time()
+        tasks = []
+        for workerIndex, chunks in enumerate(scheduler.plan_object_chunks(counts, args.processNum)):
+            for objIndex, start, stop in chunks:
+                indices = np.arange(bounds[objIndex] + start, bounds[objIndex] + stop)
+                tasks.append((workerIndex, process_rows, (objIds[objIndex], annotations[indices], indices,
+                                                          args.graspCost)))
+        resultNum = sum(len(statusList) for _, _, statusList in pool.map_unordered(tasks))
+        fixed_time = time.time() - start_time
+        print(f'fixed chunks (pickled):\t{fixed_time:.2f} s\t{len(tasks)} tasks\t{resultNum / fixed_time:.0f} grasps/s')
+
+        # shared memory and adaptive chunk sizes
+        start_time = time.time()
+        # annotation index and annotation in one array, as in AutoGraspUtil.parallelSimulation
+        sharedGrasps = scheduler.SharedArray(np.column_stack((np.arange(args.graspNum), annotations)))
+        chunkSizer = scheduler.ChunkSizer()
+        taskNum = 0
+
+        def make_task(objIndex, start, stop):
+            global taskNum
+            taskNum += 1
+            return process_shared_rows, (objIds[objIndex], sharedGrasps, bounds[objIndex] + start, stop - start,
+                                         args.graspCost)
+
+        workerPieces = scheduler.plan_object_chunks(counts, args.processNum, chunkSize=args.graspNum)
+        resultNum = sum(len(statusList) for _, _, statusList in pool.map_adaptive(workerPieces, make_task, chunkSizer))
+        sharedGrasps.close()
+        adaptive_time = time.time() - start_time
+        print(f'adaptive chunks (shared):\t{adaptive_time:.2f} s\t{taskNum} tasks\t'
+              f'{resultNum / adaptive_time:.0f} grasps/s\tfinal chunk size {chunkSizer.next_size()}')
@@ -0,0 +1,56 @@
+import argparse
+import os
+from time import time
+
+import numpy as np
+
+from gpnet_sim.AutoGraspShapeCoreUtil import AutoGraspUtil
+from gpnet_sim.assets import DEFAULT_ASSET_ROOT, collision_mesh_root
+from gpnet_sim.simulator import getObjStatusAndAnnotation, z_move
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='compares loading the object urdf for every grasp with creating the '
+                                                 'objects from collision shapes kept in a mesh registry')
+    parser.add_argument('-t', '--testFile', type=str, help='file with grasp predictions',
+                        default=os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt'))
+    parser.add_argument('-p', '--processNum', default=1, type=int, help='number of worker processes')
+    parser.add_argument('--worldModes', nargs='+', default=['fresh', 'reuse'], help='world modes to compare')
+    parser.add_argument('--batchSize', default=1, type=int, help='grasps per world, see batch.py')
+    parser.add_argument('--collisionAssets', default=None, type=str,
+                        help='kind of collision assets to simulate with (see python -m gpnet_sim preprocess), whose '
+                             'binary vertex buffers the registry reads, the original meshes by default')
+    args = parser.parse_args()
+
+    simulator = AutoGraspUtil()
+    quaternionDict, centerDict, objIdList = getObjStatusAndAnnotation(args.testFile)
+    for objId in objIdList:
+        simulator.addObject2(objId, quaternionDict[objId], z_move(centerDict[objId], quaternionDict[objId]))
+    graspNum = sum(len(centerDict[objId]) for objId in objIdList)
+
+    objMeshRoot = os.path.join(PROJECT_DIR, 'gpnet_data/urdf')
+    if args.collisionAssets is not None:
+        objMeshRoot = collision_mesh_root(objMeshRoot, DEFAULT_ASSET_ROOT, args.collisionAssets, objIdList)
+    print(f'{graspNum} grasps, {args.processNum} processes, batch size {args.batchSize}, '
+          f'{args.collisionAssets or "original"} meshes')
+    for worldMode in args.worldModes:
+        results = {}
+        for meshRegistry in [False, True]:
+            start_time = time()
+            statusDict = simulator.parallelSimulation(
+                logFile=None,
+                objMeshRoot=objMeshRoot,
+                processNum=args.processNum,
+                gripperFile=os.path.join(PROJECT_DIR, 'gpnet_data/gripper/parallel_simple.urdf'),
+                worldMode=worldMode,
+                batchSize=args.batchSize,
+                meshRegistry=meshRegistry
+            )
+            total_time = time() - start_time
+            results[meshRegistry] = np.concatenate([statusDict[objId] for objId in objIdList])
+            print(f'{worldMode}, {"mesh registry" if meshRegistry else "urdf"}:\t{total_time:.2f} s\t'
+                  f'{graspNum / total_time:.1f} grasps/s')
+        print(f'{worldMode}: agreement of the mesh registry with urdf loading '
+              f'{np.mean(results[False] == results[True]):.4f}')
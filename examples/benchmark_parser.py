@@ -0,0 +1,85 @@
+import argparse
+import os
+import tempfile
+from time import time
+
+import numpy as np
+
+from gpnet_sim.simulator import getObjStatusAndAnnotation
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+def legacy_parser(testFile, haveWidth=False):
+    """ previous implementation of getObjStatusAndAnnotation, which concatenates arrays for each grasp """
+    with open(testFile, 'r') as testData:
+        lines = testData.readlines()
+        objIdList = []
+        quaternionDict = {}
+        centerDict = {}
+        objId = 'invalid'
+        for line in lines:
+            msg = line.strip()
+            if len(msg.split(',')) < 2:
+                objId = msg.strip()
+                objIdList.append(objId)
+                quaternionDict[objId] = np.empty(shape=(0, 4), dtype=float)
+                centerDict[objId] = np.empty(shape=(0, 3), dtype=float)
+            else:
+                if objId == 'invalid':
+                    continue
+                pose = msg.split(',')
+                if haveWidth:
+                    position = np.array([float(pose[1]), float(pose[2]), float(pose[3])])
+                    quaternion = np.array([float(pose[4]), float(pose[5]), float(pose[6]), float(pose[7])])
+                else:
+                    position = np.array([float(pose[0]), float(pose[1]), float(pose[2])])
+                    quaternion = np.array([float(pose[3]), float(pose[4]), float(pose[5]), float(pose[6])])
+                quaternionDict[objId] = np.concatenate((quaternionDict[objId], quaternion[None, :]), axis=0)
+                centerDict[objId] = np.concatenate((centerDict[objId], position[None, :]), axis=0)
+    return quaternionDict, centerDict, objIdList
+
+
+def write_test_file(filename, objNum, graspNum, haveWidth):
+    """ creates a prediction file with objNum objects and graspNum random grasps each """
+    rng = np.random.default_rng(0)
+    with open(filename, 'w') as f:
+        for i in range(objNum):
+            f.write(f'object{i:03d}\n')
+            grasps = rng.uniform(-1, 1, size=(graspNum, 8 if haveWidth else 7))
+            np.savetxt(f, grasps, fmt='%.6f', delimiter=',')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='compares the prediction file parser with the previous implementation')
+    parser.add_argument('--objects', default=5, type=int, help='number of objects in the generated file')
+    parser.add_argument('--grasps', nargs='+', default=[1000, 5000, 20000], type=int,
+                        help='numbers of grasps per object to test')
+    args = parser.parse_args()
+
+    # sanity check with the bundled predictions
+    test_file = os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt')
+    for new, old in zip(getObjStatusAndAnnotation(test_file)[:2], legacy_parser(test_file)[:2]):
+        assert all(np.array_equal(new[key], old[key]) for key in old.keys())
+
+    print(f'{"width":>6} {"grasps":>8} {"legacy [s]":>11} {"new [s]":>9} {"speedup":>8}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for have_width in [False, True]:
+            for grasp_num in args.grasps:
+                fn = os.path.join(tmp_dir, 'predictions.txt')
+                write_test_file(fn, args.objects, grasp_num, have_width)
+
+                start_time = time()
+                new_result = getObjStatusAndAnnotation(fn, have_width)
+                new_time = time() - start_time
+
+                start_time = time()
+                old_result = legacy_parser(fn, have_width)
+                old_time = time() - start_time
+
+                assert new_result[2] == old_result[2]
+                for new, old in zip(new_result[:2], old_result[:2]):
+                    assert all(np.array_equal(new[key], old[key]) for key in old.keys())
+
+                print(f'{str(have_width):>6} {grasp_num:>8} {old_time:>11.3f} {new_time:>9.3f} '
+                      f'{old_time / new_time:>7.1f}x')
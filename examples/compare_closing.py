@@ -0,0 +1,51 @@
+import argparse
+import os
+from time import time
+
+import numpy as np
+
+from gpnet_sim.AutoGraspShapeCoreUtil import AutoGraspUtil
+from gpnet_sim.AutoGraspSimpleShapeCore import DEFAULT_CLOSING_SPEED
+from gpnet_sim.simulator import getObjStatusAndAnnotation, z_move
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='compares the outcomes of continuous and stepwise closing')
+    parser.add_argument('-t', '--testFile', type=str, help='file with grasp predictions',
+                        default=os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt'))
+    parser.add_argument('-p', '--processNum', default=1, type=int, help='number of processes')
+    parser.add_argument('--speeds', nargs='+', default=[DEFAULT_CLOSING_SPEED], type=float,
+                        help='closing speeds in m/s to compare')
+    args = parser.parse_args()
+
+    simulator = AutoGraspUtil()
+    quaternionDict, centerDict, objIdList = getObjStatusAndAnnotation(args.testFile)
+    for objId in objIdList:
+        simulator.addObject2(objId, quaternionDict[objId], z_move(centerDict[objId], quaternionDict[objId]))
+
+    settings = [('stepwise', None)] + [('continuous', speed) for speed in args.speeds]
+    results = {}
+    for closingMode, closingSpeed in settings:
+        start_time = time()
+        statusDict = simulator.parallelSimulation(
+            logFile=None,
+            objMeshRoot=os.path.join(PROJECT_DIR, 'gpnet_data/urdf'),
+            processNum=args.processNum,
+            gripperFile=os.path.join(PROJECT_DIR, 'gpnet_data/gripper/parallel_simple.urdf'),
+            closingMode=closingMode,
+            closingSpeed=closingSpeed or DEFAULT_CLOSING_SPEED
+        )
+        results[closingMode, closingSpeed] = np.concatenate([statusDict[objId] for objId in objIdList])
+        print(f'{closingMode} {closingSpeed or ""}: {time() - start_time:.2f} s')
+
+    stepwise = results['stepwise', None]
+    print('\noutcome distribution:')
+    labels = [mode if speed is None else f'{mode} {speed}' for mode, speed in settings]
+    print(f'{"":<24}' + ''.join(f'{label:>16}' for label in labels))
+    for status in range(7):
+        print(f'{AutoGraspUtil.get_status_string(status):<24}' +
+              ''.join(f'{np.sum(results[setting] == status):>16}' for setting in settings))
+    print(f'{"success rate":<24}' + ''.join(f'{np.mean(results[setting] == 0):>16.3f}' for setting in settings))
+    print(f'{"agreement w/ stepwise":<24}' +
+          ''.join(f'{np.mean(results[setting] == stepwise):>16.3f}' for setting in settings))
@@ -0,0 +1,88 @@
+import argparse
+import os
+import tempfile
+from time import time
+
+import numpy as np
+import pybullet
+
+from gpnet_sim.AutoGraspShapeCoreUtil import AutoGraspUtil
+from gpnet_sim.AutoGraspSimpleShapeCore import AutoGraspSimple
+from gpnet_sim.simulator import getObjStatusAndAnnotation, z_move
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+OBJ_MESH_ROOT = os.path.join(PROJECT_DIR, 'gpnet_data/urdf')
+GRIPPER_FILE = os.path.join(PROJECT_DIR, 'gpnet_data/gripper/parallel_simple.urdf')
+
+
+def stable_widths(simulator, objIdList):
+    """
+    Simulates all grasps with stepwise closing and returns the width (relative to the maximum opening of 0.085 m) at
+    which the fingers reached into the object, as a perfect width prediction. 1 for grasps which were not lifted.
+    """
+    widthDict = {}
+    autoGraspInstance = None
+    for objId in objIdList:
+        widths = []
+        for annotation in simulator.annotationDict[objId]:
+            objectURDFFile = os.path.join(OBJ_MESH_ROOT, objId + '.urdf')
+            if autoGraspInstance is None:
+                autoGraspInstance = AutoGraspSimple(objectURDFFile, GRIPPER_FILE, annotation[0], annotation[1:4],
+                                                    annotation[4:8], serverMode=pybullet.DIRECT, worldMode='reuse')
+            else:
+                autoGraspInstance.resetGrasp(objectURDFFile, annotation[0], annotation[1:4], annotation[4:8])
+            status = autoGraspInstance.startSimulation()
+            # after closing, the instance holds the gripper length at which the object has been grasped
+            lifted = status in [autoGraspInstance.SUCCESS, autoGraspInstance.OBJECT_FALLEN]
+            widths.append(autoGraspInstance.gripperLengthInit / 0.085 if lifted else 1.0)
+        widthDict[objId] = np.array(widths)
+    autoGraspInstance.closeWorld()
+    return widthDict
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='compares closing with and without warm start from predicted widths')
+    parser.add_argument('-t', '--testFile', type=str, help='file with grasp predictions (without widths)',
+                        default=os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt'))
+    parser.add_argument('-p', '--processNum', default=1, type=int, help='number of processes')
+    parser.add_argument('--widthNoise', default=0.0, type=float,
+                        help='standard deviation of noise added to the relative widths, to mimic network predictions')
+    args = parser.parse_args()
+
+    quaternionDict, centerDict, objIdList = getObjStatusAndAnnotation(args.testFile)
+    simulator = AutoGraspUtil()
+    for objId in objIdList:
+        simulator.addObject2(objId, quaternionDict[objId], z_move(centerDict[objId], quaternionDict[objId]))
+    widthDict = stable_widths(simulator, objIdList)
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # prediction file with widths, which goes through the parser as with --width
+        test_file = os.path.join(tmp_dir, 'predictions_with_width.txt')
+        with open(test_file, 'w') as f:
+            for objId in objIdList:
+                f.write(objId + '\n')
+                widths = np.clip(widthDict[objId] + rng.normal(0, args.widthNoise, len(widthDict[objId])), 0, None)
+                np.savetxt(f, np.column_stack((widths, centerDict[objId], quaternionDict[objId])), fmt='%.6f',
+                           delimiter=',')
+        quaternionDict, centerDict, objIdList, parsedWidthDict = getObjStatusAndAnnotation(test_file, haveWidth=True,
+                                                                                           returnWidth=True)
+
+    simulator = AutoGraspUtil()
+    for objId in objIdList:
+        simulator.addObject2(objId, quaternionDict[objId], z_move(centerDict[objId], quaternionDict[objId]),
+                             width=parsedWidthDict[objId])
+    results = {}
+    for widthWarmStart in [False, True]:
+        start_time = time()
+        statusDict = simulator.parallelSimulation(
+            logFile=None,
+            objMeshRoot=OBJ_MESH_ROOT,
+            processNum=args.processNum,
+            gripperFile=GRIPPER_FILE,
+            widthWarmStart=widthWarmStart
+        )
+        results[widthWarmStart] = np.concatenate([statusDict[objId] for objId in objIdList])
+        print(f'warm start {widthWarmStart}:\t{time() - start_time:.2f} s\t'
+              f'success rate {np.mean(results[widthWarmStart] == 0):.3f}')
+    print(f'agreement: {np.mean(results[False] == results[True]):.3f}')
@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import os
+from time import time
+
+import numpy as np
+
+import gpnet_sim
+from gpnet_sim.asynchronous import as_completed
+from gpnet_sim.simulator import getObjStatusAndAnnotation
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+async def main(args):
+    conf = gpnet_sim.default_conf()
+    conf.z_move = True
+    conf.processNum = args.processNum
+
+    quaternionDict, centerDict, objIdList = getObjStatusAndAnnotation(args.testFile)
+    obj_id = max(objIdList, key=lambda objId: len(centerDict[objId]))
+    indices = np.arange(args.graspNum) % len(centerDict[obj_id])
+    centers = centerDict[obj_id][indices]
+    quats = quaternionDict[obj_id][indices]
+
+    async with gpnet_sim.AsyncSimulator(conf) as simulator:
+        # sequential: inference, then simulation of its grasps
+        start_time = time()
+        for _ in range(args.batchNum):
+            await asyncio.sleep(args.inferenceTime)
+            await simulator.submit(obj_id, centers, quats)
+        sequential_time = time() - start_time
+
+        # overlapped: the grasps of a batch are simulated during the inference of the next batch
+        start_time = time()
+        batches = []
+        for _ in range(args.batchNum):
+            await asyncio.sleep(args.inferenceTime)
+            batches.append(simulator.submit(obj_id, centers, quats))
+        async for batch, (sim_success, summary) in as_completed(batches):
+            pass
+        overlapped_time = time() - start_time
+        print(f'{args.batchNum} batches of {len(centers)} grasps, {args.inferenceTime} s inference each')
+        print(f'sequential:\t{sequential_time:.2f} s')
+        print(f'overlapped:\t{overlapped_time:.2f} s')
+
+        # results of single chunks, cancelling the rest as soon as a success is found
+        batch = simulator.submit(obj_id, centers, quats, chunkSize=1)
+        async for annotationIndices, statusList in batch.as_completed():
+            if 0 in statusList:
+                batch.cancel()
+                print(f'first success found: grasp {annotationIndices[list(statusList).index(0)]}, '
+                      f'{sum(future.cancelled() for future in batch.futures)} of {len(batch.futures)} chunks cancelled')
+                break
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='overlaps (simulated) network inference with grasp simulation')
+    parser.add_argument('-t', '--testFile', type=str, help='file with grasp predictions, the grasps of the object '
+                                                           'with most grasps are used (repeatedly if required)',
+                        default=os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt'))
+    parser.add_argument('-p', '--processNum', default=max(1, os.cpu_count() - 1), type=int, help='number of processes')
+    parser.add_argument('--batchNum', default=5, type=int, help='number of batches')
+    parser.add_argument('--graspNum', default=20, type=int, help='number of grasps per batch')
+    parser.add_argument('--inferenceTime', default=0.5, type=float, help='duration of the inference of a batch in s')
+    # asyncio.run() only exists since Python 3.7
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
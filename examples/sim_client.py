@@ -0,0 +1,73 @@
+import argparse
+import os
+import threading
+from time import time
+
+import numpy as np
+
+from gpnet_sim.client import SimulationClient
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+def read_grasps(test_file):
+    """
+    reads a file with grasp predictions (see readme) with numpy only, as the client environment may lack the simulator
+
+    :return: objId, centers and quaternions of the object with most grasps
+    """
+    with open(test_file, 'r') as f:
+        lines = [line.strip() for line in f if line.strip()]
+    blocks = {}
+    for line in lines:
+        if ',' not in line:
+            obj_id = line
+            blocks[obj_id] = []
+        else:
+            blocks[obj_id].append(line)
+    obj_id = max(blocks, key=lambda objId: len(blocks[objId]))
+    grasps = np.array([line.split(',') for line in blocks[obj_id]], dtype=float)
+    return obj_id, grasps[:, -7:-4], grasps[:, -4:]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='sends grasps to a server started with python -m gpnet_sim serve')
+    address = parser.add_mutually_exclusive_group(required=True)
+    address.add_argument('--socket', type=str, help='unix domain socket of the server')
+    address.add_argument('--port', type=int, help='localhost port of the server')
+    parser.add_argument('-t', '--testFile', type=str, help='file with grasp predictions, the grasps of the object '
+                                                           'with most grasps are used (repeatedly if required)',
+                        default=os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt'))
+    parser.add_argument('--clientNum', default=1, type=int, help='number of concurrent clients')
+    parser.add_argument('--batchNum', default=10, type=int, help='number of requests per client')
+    parser.add_argument('--graspNum', default=20, type=int, help='number of grasps per request')
+    args = parser.parse_args()
+
+    obj_id, centers, quats = read_grasps(args.testFile)
+    indices = np.arange(args.graspNum) % len(centers)
+    centers = centers[indices]
+    quats = quats[indices]
+    server_address = args.socket or ('127.0.0.1', args.port)
+
+    def run_client(latencies):
+        with SimulationClient(server_address) as client:
+            for _ in range(args.batchNum):
+                start_time = time()
+                sim_success, summary = client.simulate(obj_id, centers, quats)
+                latencies.append(time() - start_time)
+
+    client_latencies = [[] for _ in range(args.clientNum)]
+    start_time = time()
+    threads = [threading.Thread(target=run_client, args=(latencies,)) for latencies in client_latencies]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total_time = time() - start_time
+
+    latencies = np.concatenate(client_latencies)
+    print(f'{len(latencies)} requests with {len(centers)} grasps in {total_time:.2f} s')
+    print(f'latency:\tmean {np.mean(latencies):.3f} s\tmax {np.max(latencies):.3f} s')
+    with SimulationClient(server_address) as client:
+        print('server statistics:')
+        for key, value in client.statistics().items():
+            print(f'\t{key}: {value}')
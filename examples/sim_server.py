@@ -0,0 +1,44 @@
+import argparse
+import os
+from time import time
+
+import numpy as np
+
+import gpnet_sim
+from gpnet_sim.simulator import getObjStatusAndAnnotation
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='compares repeated simulate_direct() calls with a SimulationServer')
+    parser.add_argument('-t', '--testFile', type=str, help='file with grasp predictions, the grasps of the object '
+                                                           'with most grasps are used (repeatedly if required)',
+                        default=os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt'))
+    parser.add_argument('-p', '--processNum', default=max(1, os.cpu_count() - 1), type=int, help='number of processes')
+    parser.add_argument('--batchNum', default=10, type=int, help='number of calls')
+    parser.add_argument('--graspNum', default=20, type=int, help='number of grasps per call')
+    args = parser.parse_args()
+
+    conf = gpnet_sim.default_conf()
+    conf.z_move = True
+    conf.processNum = args.processNum
+
+    quaternionDict, centerDict, objIdList = getObjStatusAndAnnotation(args.testFile)
+    obj_id = max(objIdList, key=lambda objId: len(centerDict[objId]))
+    indices = np.arange(args.batchNum * args.graspNum).reshape(args.batchNum, -1) % len(centerDict[obj_id])
+    batches = [(centerDict[obj_id][i], quaternionDict[obj_id][i]) for i in indices]
+
+    start_time = time()
+    direct = [gpnet_sim.simulate_direct(conf, obj_id, c, q)[0] for c, q in batches]
+    direct_time = time() - start_time
+
+    start_time = time()
+    with gpnet_sim.SimulationServer(conf) as server:
+        startup_time = time() - start_time
+        served = [server.simulate(obj_id, c, q)[0] for c, q in batches]
+    server_time = time() - start_time
+
+    print(f'{args.batchNum} calls with {args.graspNum} grasps each, {args.processNum} processes')
+    print(f'simulate_direct:\t{direct_time:.2f} s')
+    print(f'SimulationServer:\t{server_time:.2f} s (of which {startup_time:.2f} s start-up and warm-up)')
+    print(f'identical results:\t{all(np.array_equal(a, b) for a, b in zip(direct, served))}')
@@ -0,0 +1,56 @@
+import argparse
+import os
+from time import time
+
+import numpy as np
+
+from gpnet_sim.AutoGraspShapeCoreUtil import AutoGraspUtil
+from gpnet_sim.AutoGraspSimpleShapeCore import PHYSICS_PROFILES
+from gpnet_sim.simulator import getObjStatusAndAnnotation, z_move
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='validates physics profiles against the reference profile')
+    parser.add_argument('-t', '--testFile', type=str, help='file with grasp predictions',
+                        default=os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt'))
+    parser.add_argument('-p', '--processNum', default=1, type=int, help='number of processes')
+    parser.add_argument('--profiles', nargs='+', default=['fast', 'fastest'], choices=list(PHYSICS_PROFILES.keys()),
+                        help='profiles to compare with the reference profile')
+    args = parser.parse_args()
+
+    simulator = AutoGraspUtil()
+    quaternionDict, centerDict, objIdList = getObjStatusAndAnnotation(args.testFile)
+    for objId in objIdList:
+        simulator.addObject2(objId, quaternionDict[objId], z_move(centerDict[objId], quaternionDict[objId]))
+    graspNum = sum(len(quaternionDict[objId]) for objId in objIdList)
+
+    profiles = ['reference'] + [profile for profile in args.profiles if profile != 'reference']
+    results = {}
+    for profile in profiles:
+        start_time = time()
+        statusDict = simulator.parallelSimulation(
+            logFile=None,
+            objMeshRoot=os.path.join(PROJECT_DIR, 'gpnet_data/urdf'),
+            processNum=args.processNum,
+            gripperFile=os.path.join(PROJECT_DIR, 'gpnet_data/gripper/parallel_simple.urdf'),
+            physicsProfile=profile
+        )
+        total_time = time() - start_time
+        results[profile] = np.concatenate([statusDict[objId] for objId in objIdList])
+        print(f'{profile}: {total_time:.2f} s, {graspNum / total_time:.1f} grasps/s')
+
+    # agreement per status code is the fraction of grasps with this status in the reference which keep it
+    reference = results['reference']
+    print('\nagreement with reference by status of reference:')
+    print(f'{"":<24}{"reference":>10}' + ''.join(f'{profile:>12}' for profile in profiles[1:]))
+    for status in range(7):
+        mask = reference == status
+        if not np.any(mask):
+            continue
+        print(f'{AutoGraspUtil.get_status_string(status):<24}{np.sum(mask):>10}' +
+              ''.join(f'{np.mean(results[profile][mask] == status):>12.3f}' for profile in profiles[1:]))
+    print(f'{"total":<24}{len(reference):>10}' +
+          ''.join(f'{np.mean(results[profile] == reference):>12.3f}' for profile in profiles[1:]))
+    print(f'{"success rate":<24}{np.mean(reference == 0):>10.3f}' +
+          ''.join(f'{np.mean(results[profile] == 0):>12.3f}' for profile in profiles[1:]))
@@ -1,13 +1,64 @@
+import contextlib
 import gc
 import os
-import csv
+import threading
 
 import numpy as np
 import pybullet
-from joblib import Parallel, delayed
 from tqdm import tqdm
 
-from .AutoGraspSimpleShapeCore import AutoGraspSimple
+from . import scheduler
+from .prescreen import DEFAULT_DUPLICATE_ANGLE_TOLERANCE, DEFAULT_DUPLICATE_POSITION_TOLERANCE, PRESCREEN_MODES, \
+    STATUS_COLLIDE_WITH_GROUND, STATUS_COLLIDE_WITH_OBJECT, CollisionScreen, cluster_near_duplicates, \
+    ground_collision_prescreen, prescreen_agreement
+from .AutoGraspSimpleShapeCore import DEFAULT_CLOSING_SPEED, DEFAULT_WIDTH_MARGIN, AutoGraspSimple
+from .batch import BatchSimulation
+from .cache import DEFAULT_MAX_SIZE, DEFAULT_POSE_TOLERANCE, OutcomeCache
+from .meshes import DEFAULT_MESH_MEMORY_BUDGET
+from .results import TOPK_PERCENTAGES, LogWriter, SimulationResults, load_completed_results, load_results, \
+    topk_grasp_numbers, topk_success_rates, wilson_half_width, write_results_store
+
+# worlds kept alive within a worker, if simulations do not use the fresh world mode. each worker thread (see
+# scheduler.BACKENDS) has its own worlds
+_workerState = threading.local()
+
+
+def _kept_worlds():
+    if not hasattr(_workerState, 'keptWorlds'):
+        _workerState.keptWorlds = {}
+    return _workerState.keptWorlds
+
+
+def simulation_options(worldMode='fresh', fastControl=False, closingMode='stepwise',
+                       closingSpeed=DEFAULT_CLOSING_SPEED, widthWarmStart=False, widthMargin=DEFAULT_WIDTH_MARGIN,
+                       physicsProfile='reference', meshRegistry=False, meshMemoryBudget=DEFAULT_MESH_MEMORY_BUDGET):
+    """
+    Options of the simulation of a grasp, see AutoGraspUtil.parallelSimulation().
+
+    :return: dict with keyword arguments of AutoGraspSimple, which are also part of the keys of the outcome cache
+    """
+    simulationOptions = dict(
+        worldMode=worldMode,
+        fastControl=fastControl,
+        closingMode=closingMode,
+        closingSpeed=closingSpeed,
+        widthWarmStart=widthWarmStart,
+        widthMargin=widthMargin,
+        physicsProfile=physicsProfile
+    )
+    if meshRegistry:
+        # only added if enabled, so the keys of the outcome cache do not change otherwise
+        simulationOptions.update(meshRegistry=True, meshMemoryBudget=meshMemoryBudget)
+    return simulationOptions
+
+
+# grasps of an object are checked in chunks of up to this size in one static world by the collision screen
+SCREEN_CHUNK_SIZE = 1000
+
+# with early termination, the sample of each object is extended by this many grasps per round
+SAMPLING_ROUND_SIZE = 10
+# quantile of the standard normal distribution for the confidence intervals of early termination (95%)
+CONFIDENCE_Z = 1.96
 
 
 class AutoGraspUtil(object):
@@ -27,7 +78,8 @@ class AutoGraspUtil(object):
     # objId: str (len <= 32)
     # quaternion: ndarray [N, 4]
     # translation: ndarray [N, 3]
-    def addObject2(self, objId, quaternion, translation):
+    # width: ndarray [N] predicted gripper opening lengths, optional
+    def addObject2(self, objId, quaternion, translation, width=None):
         # add object
         self.objIdList.append(objId)
 
@@ -35,8 +87,11 @@ class AutoGraspUtil(object):
         annotationNum = quaternion.shape[0]
         # fit the pybullet environment
         quaternion = quaternion[:, [1, 2, 3, 0]]
-        fakeLength = np.zeros((annotationNum, 1))
-        annotation = np.concatenate((fakeLength, translation, quaternion), axis=1)
+        if width is None:
+            length = np.zeros((annotationNum, 1))
+        else:
+            length = np.reshape(width, (annotationNum, 1))
+        annotation = np.concatenate((length, translation, quaternion), axis=1)
         self.annotationDict[objId] = annotation
 
     # used to 
@@ -45,9 +100,6 @@ class AutoGraspUtil(object):
         # add object
         self.objIdList.append(objId)
         objNum = len(self.objIdList)
-        if objNum <= 1:
-            # erase log file
-            open(logFile, 'w').close()
 
         # add annotation
         annotationNum = quaternion.shape[0]
@@ -58,223 +110,518 @@ class AutoGraspUtil(object):
         self.annotationDict[objId] = annotation
         if (objNum % splitLen) == 0:
             splitIndex = objNum // splitLen
-            runningObjIdList, \
-            runningObjIndexList, \
-            runningAnnotaionList, \
-            runningAnnotaionIndexList = self.__getRunningListSplit(
-                objIdListSplit=self.objIdList[(splitIndex - 1) * splitLen: splitIndex * splitLen],
-                objIndexShift=(splitIndex - 1) * splitLen
-            )
-            objMeshRoot = objMeshRoot
-            with Parallel(n_jobs=processNum, backend='multiprocessing') as parallel:
-                parallel(delayed(AutoGraspUtil.testAnnotation)
-                         (objId, objIndex, annotation, annotationIndex, gripperFile, logFile, objMeshRoot)
-                         for (objId, objIndex, annotation, annotationIndex) in
-                         zip(runningObjIdList, runningObjIndexList, runningAnnotaionList, runningAnnotaionIndexList))
+            # erase log file with the first split
+            with LogWriter(logFile, append=splitIndex > 1) as writer:
+                self.__simulateObjects(
+                    objIdList=self.objIdList[(splitIndex - 1) * splitLen: splitIndex * splitLen],
+                    writer=writer,
+                    objMeshRoot=objMeshRoot,
+                    processNum=processNum,
+                    gripperFile=gripperFile
+                )
             self.__annotationMemoryReallocate()
 
-    def __getRunningListSplit(self, objIdListSplit, objIndexShift):
-        runningObjIdList = []
-        runningObjIndexList = []
-        runningAnnotaionList = []
-        runningAnnotaionIndexList = []
-
-        for objIndex, objId in enumerate(objIdListSplit):
-            for annotationIndex, annotation in enumerate(self.annotationDict[objId]):
-                runningObjIdList.append(objId)
-                runningObjIndexList.append(objIndex + objIndexShift)
-                runningAnnotaionList.append(annotation)
-                runningAnnotaionIndexList.append(annotationIndex)
-
-        return runningObjIdList, runningObjIndexList, runningAnnotaionList, \
-               runningAnnotaionIndexList
-
-    def parallelSimulation(self, logFile, objMeshRoot, processNum, gripperFile, visual=False):
-        runningObjIdList, \
-        runningObjIndexList, \
-        runningAnnotaionList, \
-        runningAnnotaionIndexList = self.__getRunningList()
-        # erase log file
-        open(logFile, 'w').close()
-        objMeshRoot = objMeshRoot
+    def parallelSimulation(self, logFile, objMeshRoot, processNum, gripperFile, visual=False, worldMode='fresh',
+                           resultsStore=False, groundPrescreen='off', collisionScreen='off', fastControl=False,
+                           closingMode='stepwise', closingSpeed=DEFAULT_CLOSING_SPEED, widthWarmStart=False,
+                           widthMargin=DEFAULT_WIDTH_MARGIN, physicsProfile='reference', batchSize=1, resume=False,
+                           outcomeCache=None, cacheTolerance=DEFAULT_POSE_TOLERANCE,
+                           cacheMaxSize=DEFAULT_MAX_SIZE, collapseDuplicates=False,
+                           duplicatePositionTolerance=DEFAULT_DUPLICATE_POSITION_TOLERANCE,
+                           duplicateAngleTolerance=DEFAULT_DUPLICATE_ANGLE_TOLERANCE, topK=None,
+                           confidenceHalfWidth=None, backend='process', workerPool=None, resultCallback=None,
+                           meshRegistry=False, meshMemoryBudget=DEFAULT_MESH_MEMORY_BUDGET):
+        """
+        Simulates all added grasps. Results are collected in the main process and written to the log file.
+
+        :param logFile: path to the csv log file, will be overwritten. If None, no log file is written.
+        :param resultsStore: if True, the results are additionally written to a binary results store next to the log
+                             file, which is used by the readers (e.g. getSuccessData) instead of parsing the csv file.
+        :param groundPrescreen: one of prescreen.PRESCREEN_MODES. If 'on', grasps for which the gripper penetrates the
+                                ground are detected analytically and get status 1 without simulation. If 'validate',
+                                all grasps are simulated and the agreement of the pre-screen with the simulation is
+                                printed and stored in self.prescreenAgreement.
+        :param collisionScreen: one of prescreen.PRESCREEN_MODES. If 'on', the grasps of each object are first checked
+                                for collisions with ground and object in a static world, and only the grasps without
+                                collision are simulated. If 'validate', all grasps are simulated and the agreement is
+                                printed and stored in self.collisionScreenAgreement.
+        :param fastControl: if True, the gripper is controlled with joint targets computed once per phase, see
+                            AutoGraspSimple
+        :param closingMode: one of CLOSING_MODES, see AutoGraspSimple
+        :param closingSpeed: speed of the fingers in m/s if closingMode is 'continuous'
+        :param widthWarmStart: if True, the gripper closes directly to the predicted width (see addObject2) plus
+                               widthMargin before the fine-grained closing starts
+        :param widthMargin: safety margin in m added to the predicted width for the warm start
+        :param physicsProfile: one of PHYSICS_PROFILES, see AutoGraspSimpleShapeCore
+        :param batchSize: experimental, if > 1, each worker simulates this many grasps at once in one world (see
+                          batch.py) and worldMode is ignored. The outcomes of a few grasps differ from a world per
+                          grasp, so this is not offered by the command line, the server and the asyncio API. Not used
+                          with visual.
+        :param resume: if True, the log file is not overwritten, instead the grasps (objId, annotationIndex) which are
+                       already in it are skipped and only the missing ones are simulated and appended
+        :param outcomeCache: path to a SQLite file with simulated grasp outcomes (see cache.py). Grasps found in the
+                             cache are not simulated, the outcomes of all simulated grasps are added to it. The numbers
+                             of hits and misses are printed and stored in self.cacheStatistics.
+        :param cacheTolerance: grasp poses are quantised to this tolerance for the cache
+        :param cacheMaxSize: maximum size of the cache in megabytes, least recently used entries are evicted
+        :param collapseDuplicates: if True, the grasps of each object are clustered (see
+                                   prescreen.cluster_near_duplicates), only the highest ranked grasp of each cluster is
+                                   simulated and its outcome is assigned to all grasps of the cluster. The number of
+                                   saved simulations is printed and stored in self.collapseStatistics.
+        :param duplicatePositionTolerance: maximum distance of near-duplicate grasps in m
+        :param duplicateAngleTolerance: maximum rotation angle between near-duplicate grasps in degrees
+        :param topK: list of percentages of results.TOPK_PERCENTAGES (e.g. [10]). If given, only the grasps needed for
+                     these top k% success rates are simulated, i.e. the highest ranked grasps of each object.
+        :param confidenceHalfWidth: if given, the grasps needed for the top k% success rates of an object are simulated
+                                    in random order in rounds, and the object is finished as soon as the 95% confidence
+                                    intervals of all its (estimated) top k% success rates are narrower than +- this.
+                                    Implies topK=TOPK_PERCENTAGES if topK is not given.
+        :param backend: one of scheduler.BACKENDS, whether the processNum workers are processes or threads
+        :param workerPool: a scheduler.WorkerPool with processNum workers to use instead of creating a new one. It is
+                           not shut down, so worlds kept in its workers (see worldMode) remain available for later
+                           calls.
+        :param resultCallback: function(objId, annotationIndices, statusList), called in the main process whenever
+                               grasps get their status, i.e. as soon as each chunk of grasps is finished
+        :param meshRegistry: if True, objects are created from collision shapes which are kept per world instead of
+                             loading their urdf for every grasp, see meshes.MeshRegistry
+        :param meshMemoryBudget: in MB, a kept world is rebuilt once its registry exceeds this
+        The top k% success rates of all objects are stored in self.topkSuccessRates, a (4, n) array as returned by
+        results.topk_success_rates(), with nan for percentages which have not been requested, and the half widths of
+        their confidence intervals in self.topkHalfWidths (0 if all grasps have been simulated).
+
+        :return: dict with objId as key and array of status codes (ordered by annotation index) as value
+        """
         print('starting simulation...')
-        with Parallel(n_jobs=processNum, backend='multiprocessing') as parallel:
-            parallel(delayed(AutoGraspUtil.testAnnotation)
-                     (objId, objIndex, annotation, annotationIndex, gripperFile, logFile, objMeshRoot, visual)
-                     for (objId, objIndex, annotation, annotationIndex) in
-                     tqdm(zip(runningObjIdList, runningObjIndexList, runningAnnotaionList, runningAnnotaionIndexList),
-                          total=len(runningObjIdList))
-                     )
-
-    def __getRunningList(self):
-        # annotationNum = annotationDict.shape[1]
-        runningObjIdList = []
-        runningObjIndexList = []
-        runningAnnotaionList = []
-        runningAnnotaionIndexList = []
-        for objIndex, objId in enumerate(self.objIdList):
-            for annotationIndex, annotation in enumerate(self.annotationDict[objId]):
-                runningObjIdList.append(objId)
-                runningObjIndexList.append(objIndex)
-                runningAnnotaionList.append(annotation)
-                runningAnnotaionIndexList.append(annotationIndex)
-
-        return runningObjIdList, runningObjIndexList, runningAnnotaionList, \
-               runningAnnotaionIndexList
+        simulationOptions = simulation_options(worldMode, fastControl, closingMode, closingSpeed, widthWarmStart,
+                                               widthMargin, physicsProfile, meshRegistry, meshMemoryBudget)
+        completedResults = None
+        if resume and logFile is not None:
+            completedResults = load_completed_results(logFile)
+        cache = None
+        if outcomeCache is not None:
+            cache = OutcomeCache(outcomeCache, tolerance=cacheTolerance, maxSize=cacheMaxSize)
+        with LogWriter(logFile, append=completedResults is not None) as writer:
+            duplicateTolerances = (duplicatePositionTolerance, duplicateAngleTolerance) if collapseDuplicates else None
+            if confidenceHalfWidth is not None and topK is None:
+                topK = TOPK_PERCENTAGES
+            statusDict = self.__simulateObjects(self.objIdList, writer, objMeshRoot, processNum, gripperFile, visual,
+                                                simulationOptions, groundPrescreen, collisionScreen, batchSize,
+                                                completedResults, cache, duplicateTolerances, topK or TOPK_PERCENTAGES,
+                                                confidenceHalfWidth, backend, workerPool, resultCallback)
+        if cache is not None:
+            self.cacheStatistics = cache.statistics()
+            cache.close()
+            print('outcome cache:')
+            for key, value in self.cacheStatistics.items():
+                print(f'\t{key}: {value}')
+        if resultsStore and logFile is not None:
+            # objects of a resumed run come first in the log file, followed by those first written by this run
+            logObjIds = dict.fromkeys(completedResults.objIdList if completedResults is not None else [])
+            logObjIds.update(writer.objIds)
+            write_results_store(logFile, [objId for objId in logObjIds if objId in statusDict], statusDict,
+                                self.annotationDict)
+        return statusDict
+
+    def __planTasks(self, objIdList, simulationIndices, processNum, fn, args, chunkSize=None):
+        # group the grasps by object, so that each worker loads an object only once
+        plan = scheduler.plan_object_chunks([len(simulationIndices[objId]) for objId in objIdList], processNum,
+                                            chunkSize)
+        tasks = []
+        for workerIndex, chunks in enumerate(plan):
+            for objIndex, start, stop in chunks:
+                objId = objIdList[objIndex]
+                annotationIndices = simulationIndices[objId][start:stop]
+                tasks.append((workerIndex, fn, (objId, self.annotationDict[objId][annotationIndices], annotationIndices)
+                              + args))
+        return tasks
+
+    def __simulateObjects(self, objIdList, writer, objMeshRoot, processNum, gripperFile, visual=False,
+                          simulationOptions=None, groundPrescreen='off', collisionScreen='off', batchSize=1,
+                          completedResults=None, cache=None, duplicateTolerances=None, topK=TOPK_PERCENTAGES,
+                          confidenceHalfWidth=None, backend='process', workerPool=None, resultCallback=None):
+        for mode in [groundPrescreen, collisionScreen]:
+            assert mode in PRESCREEN_MODES, f'unknown pre-screen mode {mode}, use one of {PRESCREEN_MODES}'
+        for percentage in topK:
+            assert percentage in TOPK_PERCENTAGES, f'unknown top k percentage {percentage}, use {TOPK_PERCENTAGES}'
+        annotationCounts = [len(self.annotationDict[objId]) for objId in objIdList]
+        statusDict = {objId: np.full(count, -1, dtype=int) for objId, count in zip(objIdList, annotationCounts)}
+        # number of grasps in the top k% of each object (rows as in TOPK_PERCENTAGES), only the highest ranked grasps
+        # up to the largest requested top k% need to be simulated
+        topkRows = [TOPK_PERCENTAGES.index(percentage) for percentage in sorted(set(topK))]
+        topNums = {objId: topk_grasp_numbers([count])[:, 0] for objId, count in zip(objIdList, annotationCounts)}
+        prefixLengths = {objId: max(topNums[objId][topkRows]) if count > 0 else 0
+                         for objId, count in zip(objIdList, annotationCounts)}
+
+        # near-duplicates of each representative grasp, which get the same status as the representative
+        duplicates = {objId: {} for objId in objIdList}
+        representativeOf = {objId: np.arange(count) for objId, count in zip(objIdList, annotationCounts)}
+
+        def assign_status(objId, annotationIndices, statusList):
+            assignedIndices, assignedStatus = [], []
+            for annotationIndex, status in zip(annotationIndices, statusList):
+                for index in [annotationIndex] + duplicates[objId].get(annotationIndex, []):
+                    statusDict[objId][index] = status
+                    writer.add(objId, index, status, self.annotationDict[objId][index])
+                    assignedIndices.append(index)
+                    assignedStatus.append(status)
+            # results are written as soon as they are known, a crash would lose them otherwise (see resume)
+            writer.flush()
+            progress.update(len(assignedIndices))
+            if resultCallback is not None and assignedIndices:
+                resultCallback(objId, assignedIndices, assignedStatus)
+
+        # grasps of a previous run, i.e. which are already in the log file
+        completedNum = 0
+        if completedResults is not None:
+            for objId, count in zip(objIdList, annotationCounts):
+                if objId in completedResults:
+                    records = completedResults[objId]
+                    records = records[records['annotationIndex'] < count]
+                    statusDict[objId][records['annotationIndex']] = records['status']
+                    completedNum += int(np.sum(statusDict[objId] >= 0))
+
+        # annotation indices which need to be simulated
+        simulationIndices = {objId: np.flatnonzero(statusDict[objId][:prefixLengths[objId]] < 0) for objId in objIdList}
+        # an external pool is neither shut down here, nor are the worlds kept in the (inline) workers closed
+        ownPool = workerPool is None
+        with contextlib.ExitStack() as poolContext, \
+                tqdm(total=sum(prefixLengths.values()), initial=completedNum) as progress:
+            pool = workerPool
+            if ownPool:
+                pool = poolContext.enter_context(scheduler.WorkerPool(processNum, backend=backend))
+            if groundPrescreen != 'off':
+                groundFlags = {objId: ground_collision_prescreen(self.annotationDict[objId], gripperFile)
+                               for objId in objIdList}
+                if groundPrescreen == 'on':
+                    for objId in objIdList:
+                        screened = simulationIndices[objId]
+                        collided = screened[groundFlags[objId][screened]]
+                        assign_status(objId, collided, [STATUS_COLLIDE_WITH_GROUND] * len(collided))
+                        simulationIndices[objId] = screened[~groundFlags[objId][screened]]
+
+            if cache is not None:
+                # outcomes depend on the batch size, as numerics differ slightly in batched worlds
+                cacheOptions = dict(simulationOptions or {}, batchSize=batchSize) if batchSize > 1 else \
+                    simulationOptions
+                cacheKeys = {}
+                for objId in objIdList:
+                    cacheKeys[objId] = cache.keys(os.path.join(objMeshRoot, objId + ".urdf"), gripperFile,
+                                                  self.annotationDict[objId], cacheOptions)
+                    screened = simulationIndices[objId]
+                    cachedStatus = cache.lookup([cacheKeys[objId][i] for i in screened])
+                    assign_status(objId, screened[cachedStatus >= 0], cachedStatus[cachedStatus >= 0])
+                    simulationIndices[objId] = screened[cachedStatus < 0]
+
+            if duplicateTolerances is not None:
+                simulationNum = sum(len(simulationIndices[objId]) for objId in objIdList)
+                for objId in objIdList:
+                    remaining = simulationIndices[objId]
+                    representatives = remaining[cluster_near_duplicates(self.annotationDict[objId][remaining],
+                                                                        *duplicateTolerances)]
+                    for index, representative in zip(remaining, representatives):
+                        if index != representative:
+                            duplicates[objId].setdefault(representative, []).append(index)
+                            representativeOf[objId][index] = representative
+                    simulationIndices[objId] = np.unique(representatives)
+                representativeNum = sum(len(simulationIndices[objId]) for objId in objIdList)
+                self.collapseStatistics = {
+                    'grasps': simulationNum,
+                    'representatives': representativeNum,
+                    'saved simulations': simulationNum - representativeNum
+                }
+
+            if collisionScreen != 'off':
+                screenStatus = {objId: np.full(count, -1, dtype=int)
+                                for objId, count in zip(objIdList, annotationCounts)}
+                tasks = self.__planTasks(objIdList, simulationIndices, processNum, AutoGraspUtil.screenAnnotationChunk,
+                                         (gripperFile, objMeshRoot), chunkSize=SCREEN_CHUNK_SIZE)
+                for objId, annotationIndices, statusList in pool.map_unordered(tasks):
+                    screenStatus[objId][annotationIndices] = statusList
+                if collisionScreen == 'on':
+                    for objId in objIdList:
+                        screened = simulationIndices[objId]
+                        collided = screened[screenStatus[objId][screened] >= 0]
+                        assign_status(objId, collided, screenStatus[objId][collided])
+                        simulationIndices[objId] = screened[screenStatus[objId][screened] < 0]
+
+            # chunk sizes adapt to the measured cost per grasp, batched simulation needs at least batchSize grasps
+            chunkSizer = scheduler.ChunkSizer(minSize=batchSize)
+
+            def simulate_grasps(objIds, indices):
+                counts = [len(indices[objId]) for objId in objIds]
+                workerPieces = scheduler.plan_object_chunks(counts, processNum, chunkSize=max(1, sum(counts)))
+                chunkArgs = (gripperFile, objMeshRoot, visual, simulationOptions, batchSize)
+                # grasps are placed in shared memory once, the tasks only refer to rows of it. annotation index and
+                # annotation share one array, so that a worker attaches to a single segment for all its chunks
+                sharedGrasps = None
+                if scheduler.shared_memory is not None and not pool.inline and pool.backend == 'process':
+                    sharedGrasps = scheduler.SharedArray(np.concatenate(
+                        [np.column_stack((indices[objId], self.annotationDict[objId][indices[objId]]))
+                         for objId in objIds] + [np.empty((0, 9))]))
+                    objectOffsets = np.concatenate([[0], np.cumsum(counts)])
+
+                def make_task(objIndex, start, stop):
+                    objId = objIds[objIndex]
+                    if sharedGrasps is not None:
+                        return AutoGraspUtil.testSharedAnnotationChunk, \
+                            (objId, sharedGrasps, objectOffsets[objIndex] + start, stop - start) + chunkArgs
+                    annotationIndices = indices[objId][start:stop]
+                    return AutoGraspUtil.testAnnotationChunk, \
+                        (objId, self.annotationDict[objId][annotationIndices], annotationIndices) + chunkArgs
+
+                try:
+                    for objId, annotationIndices, statusList in pool.map_adaptive(workerPieces, make_task, chunkSizer):
+                        assign_status(objId, annotationIndices, statusList)
+                        if cache is not None:
+                            cache.store([cacheKeys[objId][i] for i in annotationIndices], statusList)
+                finally:
+                    if sharedGrasps is not None:
+                        sharedGrasps.close()
+
+            # random order in which the grasps of each object are sampled, and size of the sample so far
+            rng = np.random.default_rng(0)
+            sampleOrder = {objId: rng.permutation(prefixLengths[objId]) for objId in objIdList}
+            sampleNums = {objId: prefixLengths[objId] for objId in objIdList}
+            if confidenceHalfWidth is None:
+                simulate_grasps(objIdList, simulationIndices)
+            else:
+                activeObjIds = list(objIdList)
+                for objId in objIdList:
+                    sampleNums[objId] = 0
+                while activeObjIds:
+                    roundIndices = {}
+                    for objId in activeObjIds:
+                        sampleNums[objId] = min(sampleNums[objId] + SAMPLING_ROUND_SIZE, prefixLengths[objId])
+                        sample = sampleOrder[objId][:sampleNums[objId]]
+                        roundIndices[objId] = np.unique(representativeOf[objId][sample[statusDict[objId][sample] < 0]])
+                    simulate_grasps(activeObjIds, roundIndices)
+                    activeObjIds = [
+                        objId for objId in activeObjIds
+                        if sampleNums[objId] < prefixLengths[objId] and
+                        max(AutoGraspUtil.__sampledTopkRates(statusDict[objId], sampleOrder[objId][:sampleNums[objId]],
+                                                             topNums[objId][topkRows])[1]) > confidenceHalfWidth
+                    ]
+
+            self.topkSuccessRates = np.full((len(TOPK_PERCENTAGES), len(objIdList)), np.nan)
+            self.topkHalfWidths = np.full((len(TOPK_PERCENTAGES), len(objIdList)), np.nan)
+            for i, objId in enumerate(objIdList):
+                self.topkSuccessRates[topkRows, i], self.topkHalfWidths[topkRows, i] = AutoGraspUtil.__sampledTopkRates(
+                    statusDict[objId], sampleOrder[objId][:sampleNums[objId]], topNums[objId][topkRows])
+        # with a single process, everything runs in this process, so make sure no worlds are left behind
+        if ownPool:
+            AutoGraspUtil.closeKeptWorlds()
+
+        if duplicateTolerances is not None:
+            print('near-duplicate collapsing:')
+            for key, value in self.collapseStatistics.items():
+                print(f'\t{key}: {value}')
+        if groundPrescreen == 'validate':
+            self.prescreenAgreement = prescreen_agreement(groundFlags, statusDict, STATUS_COLLIDE_WITH_GROUND)
+            AutoGraspUtil.__printAgreement('ground collision pre-screen', self.prescreenAgreement)
+        if collisionScreen == 'validate':
+            self.collisionScreenAgreement = {
+                status: prescreen_agreement({objId: screenStatus[objId] == status for objId in objIdList}, statusDict,
+                                            status)
+                for status in [STATUS_COLLIDE_WITH_GROUND, STATUS_COLLIDE_WITH_OBJECT]
+            }
+            for status, agreement in self.collisionScreenAgreement.items():
+                AutoGraspUtil.__printAgreement(f'collision screen ({AutoGraspUtil.get_status_string(status)})',
+                                               agreement)
+        return statusDict
 
     @staticmethod
-    def testAnnotation(objId, objIndex, annotation, annotationIndex, gripperFile, logfile,
-                       objMeshRoot, visual=False):
-        status = AutoGraspUtil.annotationSimulation(
-            objId=objId,
-            annotation=annotation,
-            objMeshRoot=objMeshRoot,
-            gripperFile=gripperFile,
-            visual=visual,
-        )
-        #print('objId\t', objId, '\tobjIdx\t', str(objIndex), '\tannotationIdx\t', str(annotationIndex), '\tstatus\t',
-        #      str(status))
-        # todo: progress bar ?
-        simulatorParamStrList = [str(i) for i in annotation]
-        logInfo = [objId, str(annotationIndex), str(status)]
-        simulatorParamStrList = logInfo + simulatorParamStrList
-        # print(simulatorParamStrList)
-        simulatorParamStr = ','.join(simulatorParamStrList)
-        # logLine = objId + ',' + str(annotationIndex) + ',' + str(status) + '\n'
-        logLine = simulatorParamStr + '\n'
-        # print(logLine)
-        with open(logfile, 'a') as logger:
-            logger.write(logLine)
+    def __sampledTopkRates(statusVector, sample, topNums):
+        """
+        Estimates top k% success rates of an object from a random sample of its highest ranked grasps.
+
+        :param statusVector: status codes of the object's grasps, ordered by annotation index
+        :param sample: annotation indices of the sampled grasps, a random sample of the grasps with index < max(topNums)
+        :param topNums: numbers of grasps in the top k%
+
+        :return: estimated success rates, half widths of their confidence intervals
+        """
+        rates, halfWidths = [], []
+        for topNum in topNums:
+            sampled = statusVector[sample[sample < topNum]]
+            successNum = int(np.sum(sampled == 0))
+            rates.append(successNum / len(sampled) if len(sampled) > 0 else np.nan)
+            halfWidths.append(wilson_half_width(successNum, len(sampled), topNum, CONFIDENCE_Z))
+        return rates, halfWidths
 
     @staticmethod
-    def getSuccessData(logFile):
-        annotationSuccessDict = {}
-        with open(logFile, 'r') as logReader:
-            lines = logReader
-            for line in lines:
-                msg = line.strip()
-                # objId, annotationId, status = msg.split(',')
-                msgList = msg.split(',')
-                objId, annotationId, status = msgList[0], int(msgList[1]), int(msgList[2])
-                # initialize
-                if objId not in annotationSuccessDict.keys():
-                    annotationSuccessDict[objId] = np.full(shape=[annotationId + 1], fill_value=False)
-                # # if success
-                # if status == 0:
-                #     logDict[objId][annotationId, gripperId] = True
-
-                # if overflow (keep rank): reallocate memory
-                if annotationId + 1 > len(annotationSuccessDict[objId]):
-                    temp = np.full(shape=[annotationId + 1], fill_value=False)
-                    temp[:len(annotationSuccessDict[objId])] = annotationSuccessDict[objId]
-                    annotationSuccessDict[objId] = temp
-
-                # if success
-                if status == 0:
-                    annotationSuccessDict[objId][annotationId] = True
-
-        return annotationSuccessDict
+    def __printAgreement(name, agreement):
+        print(f'{name} compared to simulation:')
+        for key, value in agreement.items():
+            print(f'\t{key}: {value}')
 
     @staticmethod
-    def getCollisionData(logFile):
-        annotationSuccessDict = {}
-        with open(logFile, 'r') as logReader:
-            lines = logReader
-            for line in lines:
-                msg = line.strip()
-                msgList = msg.split(',')
-                objId, annotationId, status = msgList[0], int(msgList[1]), int(msgList[2])
+    def screenAnnotationChunk(objId, annotations, annotationIndices, gripperFile, objMeshRoot):
+        """
+        Checks annotations of one object for collisions of the gripper with ground or object in a static world.
 
-                # initialize
-                if objId not in annotationSuccessDict.keys():
-                    annotationSuccessDict[objId] = np.full(shape=[annotationId + 1], fill_value=False)
+        :return: objId, annotationIndices, list of status codes (1 or 2 if colliding, -1 otherwise)
+        """
+        objectURDFFile = os.path.join(objMeshRoot, objId + ".urdf")
+        with CollisionScreen(objectURDFFile, gripperFile) as screen:
+            statusList = [screen.check(annotation[1:4], annotation[4:8]) for annotation in annotations]
+        return objId, annotationIndices, statusList
 
-                # # if success
-                # if status == 0:
-                #     logDict[objId][annotationId, gripperId] = True
+    @staticmethod
+    def testAnnotationChunk(objId, annotations, annotationIndices, gripperFile, objMeshRoot, visual=False,
+                            simulationOptions=None, batchSize=1):
+        """
+        Simulates annotations of one object.
+
+        :param simulationOptions: dict with further keyword arguments of annotationSimulation (e.g. worldMode)
+        :param batchSize: if > 1 (and not visual), the annotations are simulated in batches in one world
+
+        :return: objId, annotationIndices, list of status codes
+        """
+        if batchSize > 1 and not visual and len(annotations) > 1:
+            objectURDFFile = os.path.join(objMeshRoot, objId + ".urdf")
+            statusList = [-1] * len(annotations)
+            with BatchSimulation(gripperFile, batchSize=min(batchSize, len(annotations)),
+                                 **(simulationOptions or {})) as batch:
+                for index, status in batch.simulate((objectURDFFile, annotation) for annotation in annotations):
+                    statusList[index] = status
+            return objId, annotationIndices, statusList
+
+        statusList = []
+        for annotation in annotations:
+            statusList.append(AutoGraspUtil.annotationSimulation(
+                objId=objId,
+                annotation=annotation,
+                objMeshRoot=objMeshRoot,
+                gripperFile=gripperFile,
+                visual=visual,
+                **(simulationOptions or {})
+            ))
+        return objId, annotationIndices, statusList
 
-                # if overflow (keep rank): reallocate memory
-                if annotationId + 1 > len(annotationSuccessDict[objId]):
-                    temp = np.full(shape=[annotationId + 1], fill_value=False)
-                    temp[:len(annotationSuccessDict[objId])] = annotationSuccessDict[objId]
-                    annotationSuccessDict[objId] = temp
+    @staticmethod
+    def testSharedAnnotationChunk(objId, sharedGrasps, offset, count, gripperFile, objMeshRoot, visual=False,
+                                  simulationOptions=None, batchSize=1):
+        """
+        Simulates annotations of one object, which are given by the rows offset:offset+count of a shared array
+        (see scheduler.SharedArray), see testAnnotationChunk().
 
-                # if success
-                if status == 2 or status == 1:
-                    annotationSuccessDict[objId][annotationId] = True
+        :param sharedGrasps: shared (n, 9) array, each row is the annotation index followed by the annotation
 
-        return annotationSuccessDict
+        :return: objId, annotationIndices, list of status codes
+        """
+        grasps = sharedGrasps.get(offset, offset + count)
+        return AutoGraspUtil.testAnnotationChunk(objId, grasps[:, 1:], grasps[:, 0].astype(int), gripperFile,
+                                                 objMeshRoot, visual, simulationOptions, batchSize)
+
+    @staticmethod
+    def getSuccessData(logFile):
+        """
+        :param logFile: path to the csv log file (or results store), or SimulationResults that have already been read
+
+        :return: dict with objId as key and bool array (indexed by annotation index) as value, True if successful
+        """
+        return AutoGraspUtil.__getResults(logFile).success_vectors()
+
+    @staticmethod
+    def getCollisionData(logFile):
+        """
+        :param logFile: path to the csv log file (or results store), or SimulationResults that have already been read
+
+        :return: dict with objId as key and bool array (indexed by annotation index) as value, True if collided
+        """
+        return AutoGraspUtil.__getResults(logFile).collision_vectors()
+
+    @staticmethod
+    def __getResults(logFile):
+        if isinstance(logFile, SimulationResults):
+            return logFile
+        return load_results(logFile)
 
     @staticmethod
     def annotationVisualization(logFile, objIdv, annotationIdv, objMeshRoot, gripperFile):
-        with open(logFile, 'r') as logReader:
-            lines = logReader
-            for line in lines:
-                msg = line.strip()
-                # objId, annotationId, status = msg.split(',')
-                msgList = msg.split(',')
-                objId, annotationId, status = msgList[0], int(msgList[1]), int(msgList[2])
-                simulatorParamStr = msgList[3:]
-                simulatorParam = [float(i) for i in simulatorParamStr]
-                annotation = np.array(simulatorParam[:8])
-                if objId == objIdv and annotationId == annotationIdv:
-                    status = AutoGraspUtil.annotationSimulation(
-                        objId=objId,
-                        annotation=annotation,
-                        objMeshRoot=objMeshRoot,
-                        gripperFile=gripperFile,
-                        visual=True
-                    )
-                    return status
+        results = AutoGraspUtil.__getResults(logFile)
+        if objIdv not in results:
+            return None
+        records = results[objIdv]
+        records = records[records['annotationIndex'] == annotationIdv]
+        if len(records) == 0:
+            return None
+        status = AutoGraspUtil.annotationSimulation(
+            objId=objIdv,
+            annotation=np.array(records['annotation'][0]),
+            objMeshRoot=objMeshRoot,
+            gripperFile=gripperFile,
+            visual=True
+        )
+        return status
 
     @staticmethod
-    def annotationSimulation(objId, annotation, objMeshRoot, gripperFile, visual=False):
+    def annotationSimulation(objId, annotation, objMeshRoot, gripperFile, visual=False, worldMode='fresh',
+                             **simulationOptions):
+        """
+        Simulates a single grasp.
+
+        :param worldMode: one of WORLD_MODES, unless 'fresh', the world is kept alive for the next grasp in this process
+        :param simulationOptions: further keyword arguments of AutoGraspSimple (e.g. closingMode)
+
+        :return: status code
+        """
         length = annotation[0]
         position = annotation[1:4]
         quaternion = annotation[4:8]
-        autoGraspInstance = AutoGraspSimple(
-            # clientId = gripperIndex,
-            objectURDFFile=os.path.join(objMeshRoot, objId + ".urdf"),
-            gripperLengthInit=length,
-            gripperBasePosition=position,
-            gripperURDFFile=gripperFile,
-            gripperBaseOrientation=quaternion,
-            serverMode=pybullet.GUI if visual else pybullet.DIRECT,
-            # serverMode=pybullet.GUI,
-        )
+        serverMode = pybullet.GUI if visual else pybullet.DIRECT
+        objectURDFFile = os.path.join(objMeshRoot, objId + ".urdf")
+        worldKey = (gripperFile, serverMode, worldMode, tuple(sorted(simulationOptions.items())))
+        keptWorlds = _kept_worlds()
+        if worldKey in keptWorlds:
+            autoGraspInstance = keptWorlds[worldKey]
+            autoGraspInstance.resetGrasp(
+                objectURDFFile=objectURDFFile,
+                gripperLengthInit=length,
+                gripperBasePosition=position,
+                gripperBaseOrientation=quaternion
+            )
+        else:
+            autoGraspInstance = AutoGraspSimple(
+                # clientId = gripperIndex,
+                objectURDFFile=objectURDFFile,
+                gripperLengthInit=length,
+                gripperBasePosition=position,
+                gripperURDFFile=gripperFile,
+                gripperBaseOrientation=quaternion,
+                serverMode=serverMode,
+                # serverMode=pybullet.GUI,
+                worldMode=worldMode,
+                **simulationOptions
+            )
+            if worldMode != 'fresh':
+                keptWorlds[worldKey] = autoGraspInstance
         result = autoGraspInstance.startSimulation()
         if visual:
             print(f'simulation result: {AutoGraspUtil.get_status_string(result)} (press enter)')
             input()
         return result
 
+    @staticmethod
+    def closeKeptWorlds():
+        """
+        Disconnects all worlds that have been kept alive in this process (thread) by simulations with a reuse/persistent
+        world.
+        """
+        keptWorlds = _kept_worlds()
+        for autoGraspInstance in keptWorlds.values():
+            autoGraspInstance.closeWorld()
+        keptWorlds.clear()
+
     @staticmethod
     def getStatistic(annotationSuccessDict):
-        currentObjNum = len(annotationSuccessDict.keys())
-        top10Success = np.empty(shape=currentObjNum, dtype=np.float)
-        top30Success = np.empty(shape=currentObjNum, dtype=np.float)
-        top50Success = np.empty(shape=currentObjNum, dtype=np.float)
-        top100Success = np.empty(shape=currentObjNum, dtype=np.float)
-
-        for index, annotationSuccess in enumerate(annotationSuccessDict.values()):
-            annotationNum = len(annotationSuccess)
-            # print(annotationSuccess)
-            top10_num = int(0.1 * annotationNum)
-            if top10_num == 0:
-                top10_num = 1
-            top10Success[index] = np.sum(
-                annotationSuccess[:top10_num]) / top10_num
-            top30_num = round(0.3 * annotationNum)
-            if top30_num == 0:
-                top30_num = 1
-            top30Success[index] = np.sum(
-                annotationSuccess[:top30_num]) / top30_num
-            top50_num = round(0.5 * annotationNum)
-            if top50_num == 0:
-                top50_num = 1
-            top50Success[index] = np.sum(
-                annotationSuccess[:top50_num]) / top50_num
-            top100Success[index] = np.sum(annotationSuccess) / annotationNum
+        """
+        :param annotationSuccessDict: dict with objId as key and bool array (ordered by annotation index) as value
+
+        :return: top 10, top 30, top 50 and top 100 success rate, averaged over all objects
+        """
+        topkSuccess = topk_success_rates(list(annotationSuccessDict.values()))
+        top10Success, top30Success, top50Success, top100Success = topkSuccess
         return top10Success.mean(), top30Success.mean(), top50Success.mean(), top100Success.mean()
 
     @staticmethod
@@ -283,22 +630,18 @@ class AutoGraspUtil(object):
 
     @staticmethod
     def get_simulation_summary(logFile):
+        """
+        :param logFile: path to the csv log file (or results store), or SimulationResults that have already been read
+
+        :return: dict with objId as key and list of status strings (ordered by annotation index) as value,
+                 dict with the number of grasps per status string and in total
+        """
+        results = AutoGraspUtil.__getResults(logFile)
+        status_strings = np.array([AutoGraspUtil.get_status_string(status) for status in range(7)])
         annotationSuccessDict = {}
-        status_frequencies = np.zeros(7, dtype=np.int)
-        with open(logFile, 'r') as logReader:
-            lines = logReader
-            for line in lines:
-                msg = line.strip()
-                msgList = msg.split(',')
-                objId, annotationId, status = msgList[0], int(msgList[1]), int(msgList[2])
-
-                # initialize
-                if objId not in annotationSuccessDict.keys():
-                    annotationSuccessDict[objId] = []
-
-                # append status to obj
-                annotationSuccessDict[objId].append(AutoGraspUtil.get_status_string(status))
-                status_frequencies[status] += 1
+        for objId, records in results.items():
+            annotationSuccessDict[objId] = status_strings[records['status']].tolist()
+        status_frequencies = results.status_frequencies()
 
         freq_dict = {}
         for status, freq in enumerate(status_frequencies):
@@ -331,51 +674,28 @@ class AutoGraspUtil(object):
 def read_sim_csv_file(filename, keep_num=None, initial_array_size=2000):
     """
     This reads the csv log file created during simulation.
+    If there is an up-to-date binary results store for the log file, it is read instead.
 
-    :param filename: the filename of the simulation's log file output
+    :param filename: the filename of the simulation's log file output (or of its results store)
     :param keep_num: at most this number of grasps is reported (as of annotation idx order)
-    :param initial_array_size: an estimate of how many grasps there will be per object to speed up things
+    :param initial_array_size: not used anymore, the file is parsed at once
 
     :return: returns a dict with shape id as keys and np array as value.
              the np array is of shape (n, 10): 0:3 pos, 3:7 quat, annotation id, sim result, sim success
              keeps only keep_num entries (as of annotation idx order). quaternion is in w,x,y,z
     """
 
-    print(f'reading csv data from {filename}')
+    print(f'reading simulation results from {filename}')
     sim_data = {}
-    counters = {}
-    with open(filename, 'r') as csv_file:
-        reader = csv.reader(csv_file, delimiter=',')
-        for row in tqdm(reader):
-            shape = row[0]
-            if shape not in sim_data.keys():
-                # we do not know the array length in advance, so start with 10k
-                data_array = np.zeros((initial_array_size, 10))
-                sim_data[shape] = data_array
-                counters[shape] = 0
-            elif counters[shape] == len(sim_data[shape]):
-                sim_data[shape] = np.resize(sim_data[shape], (len(sim_data[shape]) + initial_array_size, 10))
-
-            sim_data[shape][counters[shape]] = [
-                float(row[4]),  # pos: x, y, z
-                float(row[5]),
-                float(row[6]),
-                float(row[10]),  # quat: w, x, y, z, converted from pybullet convention
-                float(row[7]),
-                float(row[8]),
-                float(row[9]),
-                int(row[1]),  # annotation id
-                int(row[2]),  # simulation result
-                int(row[2]) == 0  # simulation success flag
-            ]
-            counters[shape] += 1
-
-    # now reduce arrays to their actual content
-    for key in sim_data.keys():
-        sim_data[key] = np.resize(sim_data[key], (counters[key], 10))
-        # also sort by annotation id
-        order = np.argsort(sim_data[key][:, 7])
-        sim_data[key] = sim_data[key][order]
-        sim_data[key] = sim_data[key][:keep_num]
+    for shape, records in load_results(filename).items():
+        # records are sorted by annotation id
+        records = records[:keep_num]
+        data_array = np.empty((len(records), 10))
+        data_array[:, 0:3] = records['annotation'][:, 1:4]  # pos: x, y, z
+        data_array[:, 3:7] = records['annotation'][:, [7, 4, 5, 6]]  # quat: w, x, y, z, from pybullet convention
+        data_array[:, 7] = records['annotationIndex']  # annotation id
+        data_array[:, 8] = records['status']  # simulation result
+        data_array[:, 9] = records['status'] == 0  # simulation success flag
+        sim_data[shape] = data_array
 
     return sim_data
@@ -7,6 +7,8 @@ import pybullet
 import pybullet_data
 from attrdict import AttrDict
 
+from .meshes import DEFAULT_MESH_MEMORY_BUDGET, MeshRegistry
+
 #
 # from Antipodal import *
 # from FerrariCannyL1 import *
@@ -17,6 +19,52 @@ ROLLING_FRICTION = 0.1
 MAXIMUM_SIMULATED_STEP = 15000
 COLLISION_DETECTION_INDENTATION_DEPTH = 0.002
 FINGER_REACH_INDENTATION_DEPTH = 0.003
+# pybullet equips each joint with a velocity motor of maximum impulse 1 when loading a URDF,
+# with the default time step of 1/240 s this corresponds to a force of 240 (scaled for other time steps)
+DEFAULT_MOTOR_FORCE = 240
+
+# fresh:        each simulation connects to a new physics server and loads all bodies (original behaviour)
+# reuse:        physics server and plane are kept, gripper and object are loaded anew, results identical to fresh
+# persistent:   physics server, plane, gripper and object are kept and only reset between grasps, fastest but
+#               as numerics differ slightly, the outcome of some unstable grasps may change
+WORLD_MODES = ['fresh', 'reuse', 'persistent']
+
+# stepwise:     the gripper closes in steps of 1 mm and waits for the fingers to come to rest after each step, until
+#               both fingers reach into the object (original behaviour)
+# continuous:   the fingers close continuously with the closing speed and contact is checked in every simulation step
+CLOSING_MODES = ['stepwise', 'continuous']
+# speed of each finger in m/s for continuous closing
+DEFAULT_CLOSING_SPEED = 0.05
+# safety margin in m which is added to the predicted width if the closing is warm started from it
+DEFAULT_WIDTH_MARGIN = 0.01
+
+# phases of a simulation for which time and simulation steps can be recorded, see AutoGraspSimple.recordPhases()
+# setup:            connecting to or resetting the world and loading object and gripper
+# collision check:  the first simulation step, which computes the contacts for the collision checks
+# closing:          closing the gripper until the fingers reach into the object
+# lifting:          lifting the gripper
+# evaluation:       checking the contacts after lifting (or the collisions) and finishing the simulation
+PHASES = ['setup', 'collision check', 'closing', 'lifting', 'evaluation']
+
+# parameters of the physics engine and the simulation loops which determine accuracy and speed of the simulation
+#   timeStep:               time step of the physics engine in s
+#   solverIterations:       number of iterations of the constraint solver per time step
+#   maxSimulatedSteps:      number of steps after which closing or lifting is aborted (status time out)
+#   fingerStableThreshold:  movement of the finger tips per step below which the fingers are considered at rest
+#   liftTolerance:          distance to the lifting target height at which the lifting is considered finished
+PhysicsProfile = namedtuple('PhysicsProfile', ['timeStep', 'solverIterations', 'maxSimulatedSteps',
+                                               'fingerStableThreshold', 'liftTolerance'])
+# reference:    pybullet defaults and the original loop constants
+# fast:         fewer solver iterations and slightly coarser thresholds
+# fastest:      doubled time step in addition, the thresholds are scaled to the time step
+PHYSICS_PROFILES = {
+    'reference': PhysicsProfile(timeStep=1 / 240, solverIterations=50, maxSimulatedSteps=MAXIMUM_SIMULATED_STEP,
+                                fingerStableThreshold=1e-4, liftTolerance=1e-4),
+    'fast': PhysicsProfile(timeStep=1 / 240, solverIterations=20, maxSimulatedSteps=MAXIMUM_SIMULATED_STEP,
+                           fingerStableThreshold=2e-4, liftTolerance=2e-4),
+    'fastest': PhysicsProfile(timeStep=1 / 120, solverIterations=10, maxSimulatedSteps=MAXIMUM_SIMULATED_STEP // 2,
+                              fingerStableThreshold=4e-4, liftTolerance=5e-4),
+}
 
 
 # EXTRA_CLOSING = 0.002
@@ -24,10 +72,52 @@ FINGER_REACH_INDENTATION_DEPTH = 0.003
 
 class AutoGraspSimple(object):
     def __init__(self, objectURDFFile, gripperURDFFile, gripperLengthInit, gripperBasePosition, gripperBaseOrientation,
-                 serverMode=pybullet.GUI, mu=MU, spinningFriction=SPINNING_FRICTION, rollingFriction=ROLLING_FRICTION):
+                 serverMode=pybullet.GUI, mu=MU, spinningFriction=SPINNING_FRICTION, rollingFriction=ROLLING_FRICTION,
+                 worldMode='fresh', fastControl=False, closingMode='stepwise', closingSpeed=DEFAULT_CLOSING_SPEED,
+                 widthWarmStart=False, widthMargin=DEFAULT_WIDTH_MARGIN, physicsProfile='reference', meshRegistry=False,
+                 meshMemoryBudget=DEFAULT_MESH_MEMORY_BUDGET):
         self.serverMode = serverMode
 
+        assert physicsProfile in PHYSICS_PROFILES, \
+            f'unknown physics profile {physicsProfile}, use one of {list(PHYSICS_PROFILES.keys())}'
+        self.physics = PHYSICS_PROFILES[physicsProfile]
+
+        assert closingMode in CLOSING_MODES, f'unknown closing mode {closingMode}, use one of {CLOSING_MODES}'
+        self.closingMode = closingMode
+        self.closingSpeed = closingSpeed
+
+        # if True and a predicted width is given as gripperLengthInit, the gripper closes directly to the predicted
+        # width plus widthMargin, and the closing mode only takes over from there
+        self.widthWarmStart = widthWarmStart
+        self.widthMargin = widthMargin
+
+        # if True, inverse kinematics is solved and the joint motors are set only once per closing/lifting phase
+        # instead of in every simulation step, as the target pose is constant within a phase. re-issuing the same
+        # motor targets has no effect, but the inverse kinematics solution changes slightly from step to step, so the
+        # outcome of some unstable grasps may change
+        self.fastControl = fastControl
+
+        # worldMode determines what happens to the world after a simulation has finished, see WORLD_MODES.
+        # unless it is 'fresh', the next grasp can be set up with resetGrasp() and startSimulation() called again
+        assert worldMode in WORLD_MODES, f'unknown world mode {worldMode}, use one of {WORLD_MODES}'
+        self.worldMode = worldMode
+        self.worldInitialized = False
+        self.loadedObjectURDFFile = None
+        # all pybullet calls go to this physics client explicitly, so that one process can drive several worlds
+        self.clientId = None
+        # if True, the world is shared with other grasps and only object and gripper belong to this instance
+        self.sharedWorld = False
+        # if True, objects are created from collision shapes kept in a registry of the world instead of loading their
+        # urdf, see meshes.MeshRegistry. The bodies have no visual shapes, so the registry is not used in the GUI
+        self.useMeshRegistry = meshRegistry and serverMode != pybullet.GUI
+        self.meshMemoryBudget = meshMemoryBudget
+        self.meshRegistry = None
+        # if not None, startSimulation() adds up wall time and simulation steps of each phase, see recordPhases()
+        self.phaseTimes = None
+        self.phaseSteps = None
+
         self.objectURDFFile = objectURDFFile
+        self.objectBasePosition = [0, 0, 0]
 
         self.gripperURDFFile = gripperURDFFile
         self.gripperBasePosition = gripperBasePosition
@@ -50,48 +140,113 @@ class AutoGraspSimple(object):
 
         self.TIME_SLEEP = 0.01  # for slowing down GUI visualization
 
+    def resetGrasp(self, objectURDFFile, gripperLengthInit, gripperBasePosition, gripperBaseOrientation):
+        """
+        Sets up the next grasp to be simulated with startSimulation().
+        Only useful if the world is kept alive (see worldMode), as otherwise a new instance can be created just as well.
+        In the persistent world mode, the object will not be loaded again if its URDF file did not change.
+        """
+        self.objectURDFFile = objectURDFFile
+        self.gripperBasePosition = gripperBasePosition
+        self.gripperBaseOrientation = gripperBaseOrientation
+        self.gripperLengthInit = gripperLengthInit
+
+    def closeWorld(self):
+        """
+        Disconnects from the physics server of a kept world. Does nothing if there is no world alive.
+        """
+        if self.worldInitialized:
+            pybullet.disconnect(physicsClientId=self.clientId)
+            self.worldInitialized = False
+            self.loadedObjectURDFFile = None
+
+    def recordPhases(self):
+        """
+        Makes startSimulation() add up the wall time (in s) and the number of simulation steps of each phase (see
+        PHASES) over all following simulations, in the dicts phaseTimes and phaseSteps.
+        """
+        self.phaseTimes = dict.fromkeys(PHASES, 0.0)
+        self.phaseSteps = dict.fromkeys(PHASES, 0)
+
     def startSimulation(self):
-        self.__initializeTheWorld()
+        startTime = time.perf_counter()
+        if self.worldInitialized and self.meshRegistry is not None and self.meshRegistry.overBudget:
+            # pybullet only releases the collision shapes of the registry with the world
+            self.closeWorld()
+        if self.worldMode != 'fresh' and self.worldInitialized:
+            self.__resetTheWorld()
+        else:
+            self.__initializeTheWorld()
+            self.objectID = self.__loadObject()
+            # objectPosition, objectOrientation = pybullet.getBasePositionAndOrientation(self.objectID)
+            # a = pybullet.getDynamicsInfo(self.objectID, -1)
+            self.gripperID = self.__loadGripper()
+            self.__gripperControlInit()
+            self.__gripperDynamicsInit()
+            self.worldInitialized = True
+
+        # the grasp is a generator which yields whenever the world needs to be stepped
+        steps = self.__graspSteps()
+        if self.phaseTimes is not None:
+            self.phaseTimes['setup'] += time.perf_counter() - startTime
+            return self.__timedSimulation(steps)
+        while True:
+            try:
+                next(steps)
+            except StopIteration as stop:
+                return stop.value
+            pybullet.stepSimulation(physicsClientId=self.clientId)
+
+    def startSimulationSteps(self, planeID, positionOffset, clientId, meshRegistry=None):
+        """
+        Like startSimulation(), but in a world which is shared with other grasps (see batch.BatchSimulation).
+        Object and gripper are loaded into the given world, shifted by positionOffset, and removed again when the
+        simulation has finished. This is a generator which yields whenever the world needs to be stepped, the status
+        code is its return value.
+
+        :param planeID: id of the ground plane in the world
+        :param positionOffset: translation of object and gripper, i.e. the origin of this grasp's scene
+        :param clientId: physics client of the world
+        :param meshRegistry: meshes.MeshRegistry of the world, used if the mesh registry is enabled
+        """
+        self.sharedWorld = True
+        self.clientId = clientId
+        self.meshRegistry = meshRegistry if self.useMeshRegistry else None
+        self.planeID = planeID
+        self.objectBasePosition = list(positionOffset)
+        self.gripperBasePosition = np.add(self.gripperBasePosition, positionOffset)
         self.objectID = self.__loadObject()
-        # objectPosition, objectOrientation = pybullet.getBasePositionAndOrientation(self.objectID)
-        # a = pybullet.getDynamicsInfo(self.objectID, -1)
         self.gripperID = self.__loadGripper()
         self.__gripperControlInit()
-        pybullet.changeDynamics(
-            self.objectID,
-            -1,
-            lateralFriction=self.mu,
-            spinningFriction=self.spinningFriction,
-            rollingFriction=self.rollingFriction
-        )
-        pybullet.changeDynamics(
-            self.gripperID,
-            self.robotiq_85_left_finger_tip_joint_index,
-            lateralFriction=self.mu,
-            spinningFriction=self.spinningFriction,
-            rollingFriction=self.rollingFriction
-        )
-        pybullet.changeDynamics(
-            self.gripperID,
-            self.robotiq_85_right_finger_tip_joint_index,
-            lateralFriction=self.mu,
-            spinningFriction=self.spinningFriction,
-            rollingFriction=self.rollingFriction
-        )
-
+        self.__gripperDynamicsInit()
+        return (yield from self.__graspSteps())
+
+    def __timedSimulation(self, steps):
+        # the steps yield the phase which requests the next simulation step. The time until the request is attributed
+        # to that phase, along with the step itself, the time after the last step to the evaluation
+        while True:
+            startTime = time.perf_counter()
+            try:
+                phase = next(steps)
+            except StopIteration as stop:
+                self.phaseTimes['evaluation'] += time.perf_counter() - startTime
+                return stop.value
+            pybullet.stepSimulation(physicsClientId=self.clientId)
+            self.phaseTimes[phase] += time.perf_counter() - startTime
+            self.phaseSteps[phase] += 1
+
+    def __graspSteps(self):
         if self.serverMode == pybullet.GUI:
             print('****************************************************')
             print('objects loaded - will check collisions (press enter)')
             input()
 
-        pybullet.stepSimulation()
+        yield 'collision check'
         if self.__isCollide(self.gripperID, self.planeID, - COLLISION_DETECTION_INDENTATION_DEPTH):
-            pybullet.disconnect()
-            return self.COLLIDE_WITH_GROUND
+            return self.__finishSimulation(self.COLLIDE_WITH_GROUND)
 
         if self.__isCollide(self.gripperID, self.objectID, - COLLISION_DETECTION_INDENTATION_DEPTH):
-            pybullet.disconnect()
-            return self.COLLIDE_WITH_OBJECT
+            return self.__finishSimulation(self.COLLIDE_WITH_OBJECT)
 
         if self.serverMode == pybullet.GUI:
             print('****************************************************')
@@ -100,36 +255,58 @@ class AutoGraspSimple(object):
 
         untouched = True
         stableGripperLength = 0.085
+        warmStartLength = self.__getWarmStartLength()
         try:
-            for gripperLength in self.gripperLengthList:
-                self.__gripperClosing(gripperLength=gripperLength)
-                # contactListLeft = pybullet.getContactPoints(bodyA=self.gripperID,
-                #                                             bodyB=self.objectID,
-                #                                             linkIndexA=self.robotiq_85_left_finger_tip_joint_index)
-                # contactListRight = pybullet.getContactPoints(bodyA=self.gripperID,
-                #                                              bodyB=self.objectID,
-                #                                              linkIndexA=self.robotiq_85_right_finger_tip_joint_index)
-                # if (len(contactListLeft) >=1) and (len(contactListRight) >= 1) and (len(contactListLeft) + len(contactListRight) >= 3):
-                #     untouched = False
-                #
-                #     self.__gripperClosing(gripperLength=gripperLength - EXTRA_CLOSING)
-                #     stableGripperLenth = gripperLength
-                #     break
-                reachFlag = self.__fingerReach(
-                    gripperId=self.gripperID,
-                    objectId=self.objectID,
-                    finger1LinkId=self.robotiq_85_left_finger_tip_joint_index,
-                    finger2LinkId=self.robotiq_85_right_finger_tip_joint_index,
-                    indentationDepth=- FINGER_REACH_INDENTATION_DEPTH
-                )
-                if reachFlag:
-                    stableGripperLength = gripperLength
-                    untouched = False
-                    break
+            if self.closingMode == 'continuous':
+                if warmStartLength is not None:
+                    yield from self.__gripperClosing(gripperLength=warmStartLength)
+                    if self.__fingerReach(
+                        gripperId=self.gripperID,
+                        objectId=self.objectID,
+                        finger1LinkId=self.robotiq_85_left_finger_tip_joint_index,
+                        finger2LinkId=self.robotiq_85_right_finger_tip_joint_index,
+                        indentationDepth=- FINGER_REACH_INDENTATION_DEPTH
+                    ):
+                        stableGripperLength = warmStartLength
+                        untouched = False
+                if untouched:
+                    reachedGripperLength = yield from self.__gripperClosingContinuous()
+                    if reachedGripperLength is not None:
+                        stableGripperLength = reachedGripperLength
+                        untouched = False
+            else:
+                gripperLengthList = self.gripperLengthList
+                if warmStartLength is not None:
+                    # the first closing step goes directly to the largest length within the warm start length
+                    gripperLengthList = [length for length in gripperLengthList if length <= warmStartLength + 1e-9]
+                for gripperLength in gripperLengthList:
+                    yield from self.__gripperClosing(gripperLength=gripperLength)
+                    # contactListLeft = pybullet.getContactPoints(bodyA=self.gripperID,
+                    #                                             bodyB=self.objectID,
+                    #                                             linkIndexA=self.robotiq_85_left_finger_tip_joint_index)
+                    # contactListRight = pybullet.getContactPoints(bodyA=self.gripperID,
+                    #                                              bodyB=self.objectID,
+                    #                                              linkIndexA=self.robotiq_85_right_finger_tip_joint_index)
+                    # if (len(contactListLeft) >=1) and (len(contactListRight) >= 1) and (len(contactListLeft) + len(contactListRight) >= 3):
+                    #     untouched = False
+                    #
+                    #     self.__gripperClosing(gripperLength=gripperLength - EXTRA_CLOSING)
+                    #     stableGripperLenth = gripperLength
+                    #     break
+                    reachFlag = self.__fingerReach(
+                        gripperId=self.gripperID,
+                        objectId=self.objectID,
+                        finger1LinkId=self.robotiq_85_left_finger_tip_joint_index,
+                        finger2LinkId=self.robotiq_85_right_finger_tip_joint_index,
+                        indentationDepth=- FINGER_REACH_INDENTATION_DEPTH
+                    )
+                    if reachFlag:
+                        stableGripperLength = gripperLength
+                        untouched = False
+                        break
 
             if untouched:
-                pybullet.disconnect()
-                return self.UNTOUCHED
+                return self.__finishSimulation(self.UNTOUCHED)
             self.gripperLengthInit = stableGripperLength
 
             if self.serverMode == pybullet.GUI:
@@ -137,10 +314,9 @@ class AutoGraspSimple(object):
                 print('object has been grasped, will lift now (press enter)')
                 input()
 
-            self.__gripperLifting(stableGripperLength)
+            yield from self.__gripperLifting(stableGripperLength)
         except RuntimeError:
-            pybullet.disconnect()
-            return self.TIME_OUT
+            return self.__finishSimulation(self.TIME_OUT)
 
         if self.serverMode == pybullet.GUI:
             print('****************************************************')
@@ -149,16 +325,25 @@ class AutoGraspSimple(object):
 
         contactListLeft = pybullet.getContactPoints(bodyA=self.gripperID,
                                                     bodyB=self.objectID,
-                                                    linkIndexA=self.robotiq_85_left_finger_tip_joint_index)
+                                                    linkIndexA=self.robotiq_85_left_finger_tip_joint_index,
+                                                    physicsClientId=self.clientId)
         contactListRight = pybullet.getContactPoints(bodyA=self.gripperID,
                                                      bodyB=self.objectID,
-                                                     linkIndexA=self.robotiq_85_right_finger_tip_joint_index)
+                                                     linkIndexA=self.robotiq_85_right_finger_tip_joint_index,
+                                                     physicsClientId=self.clientId)
         if len(contactListLeft) >= 1 and len(contactListRight) >= 1:
-            pybullet.disconnect()
-            return self.SUCCESS
+            return self.__finishSimulation(self.SUCCESS)
         else:
-            pybullet.disconnect()
-            return self.OBJECT_FALLEN
+            return self.__finishSimulation(self.OBJECT_FALLEN)
+
+    def __getWarmStartLength(self):
+        # gripper length from which the closing starts if warm started from the predicted width, None otherwise
+        if not self.widthWarmStart or self.gripperLengthInit is None or self.gripperLengthInit <= 0:
+            return None
+        warmStartLength = self.gripperLengthInit + self.widthMargin
+        if warmStartLength >= 0.085:
+            return None
+        return warmStartLength
 
     def __getGripperLengthList(self):
         temp = [0.085 - x * 0.001 for x in range(85)]
@@ -169,26 +354,117 @@ class AutoGraspSimple(object):
         return gripperLengthList
 
     def __initializeTheWorld(self):
-        pybullet.connect(self.serverMode)
-        pybullet.setAdditionalSearchPath(pybullet_data.getDataPath())
-        pybullet.setGravity(0, 0, -9.8)
-        self.planeID = pybullet.loadURDF("plane.urdf")
+        self.clientId = pybullet.connect(self.serverMode)
+        self.meshRegistry = MeshRegistry(self.clientId, self.meshMemoryBudget) if self.useMeshRegistry else None
+        pybullet.setAdditionalSearchPath(pybullet_data.getDataPath(), physicsClientId=self.clientId)
+        pybullet.setGravity(0, 0, -9.8, physicsClientId=self.clientId)
+        pybullet.setPhysicsEngineParameter(fixedTimeStep=self.physics.timeStep,
+                                           numSolverIterations=self.physics.solverIterations,
+                                           physicsClientId=self.clientId)
+        self.planeID = pybullet.loadURDF("plane.urdf", physicsClientId=self.clientId)
         if self.serverMode == pybullet.GUI:
             pybullet.resetDebugVisualizerCamera(cameraDistance=0.4, cameraYaw=-45, cameraPitch=-30,
-                                                cameraTargetPosition=[0, 0, 0])
+                                                cameraTargetPosition=[0, 0, 0], physicsClientId=self.clientId)
 
     def __loadObject(self):
-        return pybullet.loadURDF(fileName=self.objectURDFFile)
+        if self.meshRegistry is not None:
+            objectID = self.meshRegistry.create_body(self.objectURDFFile, self.objectBasePosition)
+        else:
+            objectID = pybullet.loadURDF(fileName=self.objectURDFFile, basePosition=self.objectBasePosition,
+                                         physicsClientId=self.clientId)
+        # bodies of the mesh registry consist of one link per convex part, urdf bodies only of the base
+        for linkIndex in range(-1, pybullet.getNumJoints(objectID, physicsClientId=self.clientId)):
+            pybullet.changeDynamics(
+                objectID,
+                linkIndex,
+                lateralFriction=self.mu,
+                spinningFriction=self.spinningFriction,
+                rollingFriction=self.rollingFriction,
+                physicsClientId=self.clientId
+            )
+        # remember initial state, so the object can be put back in place in a persistent world
+        self.objectInitPosition, self.objectInitOrientation = pybullet.getBasePositionAndOrientation(
+            objectID, physicsClientId=self.clientId)
+        self.loadedObjectURDFFile = self.objectURDFFile
+        return objectID
+
+    def __gripperDynamicsInit(self):
+        pybullet.changeDynamics(
+            self.gripperID,
+            self.robotiq_85_left_finger_tip_joint_index,
+            lateralFriction=self.mu,
+            spinningFriction=self.spinningFriction,
+            rollingFriction=self.rollingFriction,
+            physicsClientId=self.clientId
+        )
+        pybullet.changeDynamics(
+            self.gripperID,
+            self.robotiq_85_right_finger_tip_joint_index,
+            lateralFriction=self.mu,
+            spinningFriction=self.spinningFriction,
+            rollingFriction=self.rollingFriction,
+            physicsClientId=self.clientId
+        )
+
+    def __resetTheWorld(self):
+        # bring the world into the same state as a freshly loaded one
+        if self.worldMode == 'reuse':
+            # loading the bodies anew gives exactly the same results as a fresh world, whereas teleporting them
+            # places links slightly differently (~1e-8) and the solver order depends on the history of the bodies,
+            # which both can change the outcome of some grasps
+            pybullet.removeBody(self.gripperID, physicsClientId=self.clientId)
+            pybullet.removeBody(self.objectID, physicsClientId=self.clientId)
+            self.objectID = self.__loadObject()
+            self.gripperID = self.__loadGripper()
+            self.__gripperDynamicsInit()
+            return
+
+        # persistent world: move bodies apart to get rid of all contacts, otherwise they would be kept and used
+        # for warm starting the solver
+        pybullet.resetBasePositionAndOrientation(self.gripperID, [0, 0, 100], [0, 0, 0, 1],
+                                                 physicsClientId=self.clientId)
+        pybullet.resetBasePositionAndOrientation(self.objectID, [0, 0, 200], [0, 0, 0, 1],
+                                                 physicsClientId=self.clientId)
+        pybullet.performCollisionDetection(physicsClientId=self.clientId)
+
+        if self.loadedObjectURDFFile != self.objectURDFFile:
+            pybullet.removeBody(self.objectID, physicsClientId=self.clientId)
+            self.objectID = self.__loadObject()
+        else:
+            pybullet.resetBasePositionAndOrientation(self.objectID, self.objectInitPosition,
+                                                     self.objectInitOrientation, physicsClientId=self.clientId)
+            pybullet.resetBaseVelocity(self.objectID, [0, 0, 0], [0, 0, 0], physicsClientId=self.clientId)
+
+        pybullet.resetBasePositionAndOrientation(self.gripperID, self.gripperBasePosition,
+                                                 self.gripperBaseOrientation, physicsClientId=self.clientId)
+        for joint in self.joints.values():
+            if joint.type == "FIXED":
+                continue
+            pybullet.resetJointState(self.gripperID, joint.id, targetValue=0, targetVelocity=0,
+                                     physicsClientId=self.clientId)
+            # restore the default velocity motors which pybullet creates when loading a URDF
+            pybullet.setJointMotorControl2(self.gripperID, joint.id, pybullet.VELOCITY_CONTROL, targetVelocity=0,
+                                           force=DEFAULT_MOTOR_FORCE * (1 / 240) / self.physics.timeStep,
+                                           physicsClientId=self.clientId)
+
+    def __finishSimulation(self, status):
+        if self.sharedWorld:
+            pybullet.removeBody(self.gripperID, physicsClientId=self.clientId)
+            pybullet.removeBody(self.objectID, physicsClientId=self.clientId)
+        elif self.worldMode == 'fresh':
+            pybullet.disconnect(physicsClientId=self.clientId)
+            self.worldInitialized = False
+        return status
 
     # return
     #   objectPosition
     #   objectOrientation
     def __getObjectState(self):
-        objectInfo = pybullet.getBasePositionAndOrientation(self.objectID)
+        objectInfo = pybullet.getBasePositionAndOrientation(self.objectID, physicsClientId=self.clientId)
         return objectInfo[0], objectInfo[1]
 
     def __getLinkPositionAndOrientation(self, linkId):
-        linkInfo = pybullet.getLinkState(self.gripperID, linkId)
+        linkInfo = pybullet.getLinkState(self.gripperID, linkId, physicsClientId=self.clientId)
         return linkInfo[0], linkInfo[1]
 
     def __stablizedFlag(self, currentObjectPosition, currentObjectOrientation, previousObjectPosition,
@@ -200,11 +476,11 @@ class AutoGraspSimple(object):
     def __loadGripper(self):
         return pybullet.loadURDF(fileName=self.gripperURDFFile,
                                  basePosition=self.gripperBasePosition,
-                                 baseOrientation=self.gripperBaseOrientation)
+                                 baseOrientation=self.gripperBaseOrientation, physicsClientId=self.clientId)
 
     def __gripperControlInit(self):
         jointTypeList = ["REVOLUTE", "PRISMATIC", "SPHERICAL", "PLANAR", "FIXED"]
-        numJoints = pybullet.getNumJoints(self.gripperID)
+        numJoints = pybullet.getNumJoints(self.gripperID, physicsClientId=self.clientId)
         jointInfo = namedtuple("jointInfo",
                                ["id", "name", "type", "lowerLimit", "upperLimit", "maxForce", "maxVelocity"])
 
@@ -213,7 +489,7 @@ class AutoGraspSimple(object):
 
         # get jointInfo and index of dummy_center_indicator_link
         for i in range(numJoints):
-            info = pybullet.getJointInfo(self.gripperID, i)
+            info = pybullet.getJointInfo(self.gripperID, i, physicsClientId=self.clientId)
             jointID = info[0]
             jointName = info[1].decode("utf-8")
             jointType = jointTypeList[info[2]]
@@ -244,9 +520,16 @@ class AutoGraspSimple(object):
             "gripper_pitch",
             "gripper_yaw"
         ]
+        # joints set by __setGripperControl (in this order), which the fast control path drives with one call per step
+        controlJoints = [self.joints[jointName] for jointName in self.joints
+                         if jointName in self.position_control_joint_name] + \
+                        [self.joints[self.gripper_main_control_joint_name]] + \
+                        [self.joints[jointName] for jointName in self.mimic_joint_name]
+        self.controlJointIds = [joint.id for joint in controlJoints]
+        self.controlJointForces = [joint.maxForce for joint in controlJoints]
 
     def __isCollide(self, robotID1, robotID2, indentationDepth):
-        contactList = pybullet.getContactPoints(robotID1, robotID2)
+        contactList = pybullet.getContactPoints(robotID1, robotID2, physicsClientId=self.clientId)
         for contact in contactList:
             if contact[8] < indentationDepth:
                 return True
@@ -257,12 +540,14 @@ class AutoGraspSimple(object):
         contactFinger1 = pybullet.getContactPoints(
             bodyA=gripperId,
             bodyB=objectId,
-            linkIndexA=finger1LinkId
+            linkIndexA=finger1LinkId,
+            physicsClientId=self.clientId
         )
         contactFinger2 = pybullet.getContactPoints(
             bodyA=gripperId,
             bodyB=objectId,
-            linkIndexA=finger2LinkId
+            linkIndexA=finger2LinkId,
+            physicsClientId=self.clientId
         )
         if len(contactFinger1) < 1 or len(contactFinger2) < 1:
             return False
@@ -272,6 +557,53 @@ class AutoGraspSimple(object):
                 return True
         return False
 
+    def __setGripperControl(self, basePosition, gripper_opening_para, fingerMaxVelocity=None):
+        # sets the motor targets of all joints for the given pose of the dummy center link and gripper opening.
+        # targets are kept by pybullet, i.e. they remain active for all following simulation steps.
+        # fingerMaxVelocity overrides the maximum velocity of the finger joints given in the urdf
+        # returns the targets of the joints in self.controlJointIds
+        targets = []
+        jointPose = pybullet.calculateInverseKinematics(self.gripperID,
+                                                        self.dummy_center_indicator_link_index,
+                                                        basePosition,
+                                                        self.gripperBaseOrientation, physicsClientId=self.clientId)
+        for jointName in self.joints:
+            if jointName in self.position_control_joint_name:
+                joint = self.joints[jointName]
+                pybullet.setJointMotorControl2(self.gripperID, joint.id, pybullet.POSITION_CONTROL,
+                                               targetPosition=jointPose[joint.id], force=joint.maxForce,
+                                               maxVelocity=joint.maxVelocity, physicsClientId=self.clientId)
+                targets.append(jointPose[joint.id])
+
+        pybullet.setJointMotorControl2(self.gripperID,
+                                       self.joints[self.gripper_main_control_joint_name].id,
+                                       pybullet.POSITION_CONTROL,
+                                       targetPosition=gripper_opening_para,
+                                       force=self.joints[self.gripper_main_control_joint_name].maxForce,
+                                       maxVelocity=fingerMaxVelocity or
+                                       self.joints[self.gripper_main_control_joint_name].maxVelocity,
+                                       physicsClientId=self.clientId)
+        targets.append(gripper_opening_para)
+        # print(self.joints[self.gripper_main_control_joint_name].maxForce)
+        for i in range(len(self.mimic_joint_name)):
+            joint = self.joints[self.mimic_joint_name[i]]
+            pybullet.setJointMotorControl2(self.gripperID, joint.id, pybullet.POSITION_CONTROL,
+                                           targetPosition=gripper_opening_para * self.mimic_multiplier[i],
+                                           force=joint.maxForce,
+                                           maxVelocity=fingerMaxVelocity or joint.maxVelocity,
+                                           physicsClientId=self.clientId)
+            targets.append(gripper_opening_para * self.mimic_multiplier[i])
+            # print(joint.maxForce)
+        return targets
+
+    def __driveGripper(self, targets):
+        # fast control: drives all joints with a single call per step, towards the targets which __setGripperControl
+        # has computed once for the phase. setJointMotorControlArray cannot set maximum velocities, pybullet keeps
+        # those which __setGripperControl has set
+        pybullet.setJointMotorControlArray(self.gripperID, self.controlJointIds, pybullet.POSITION_CONTROL,
+                                           targetPositions=targets, forces=self.controlJointForces,
+                                           physicsClientId=self.clientId)
+
     def __gripperClosing(self, gripperLength):
         # gripper control
         gripper_opening_para = 0.0415 - gripperLength / 2
@@ -280,36 +612,17 @@ class AutoGraspSimple(object):
         rightTipLinkPosition, rightTipLinkOrientation = self.__getLinkPositionAndOrientation(
             self.robotiq_85_right_finger_tip_joint_index)
         simulatedStep = 0
+        if self.fastControl:
+            targets = self.__setGripperControl(self.gripperBasePosition, gripper_opening_para)
         while (1):
-            jointPose = pybullet.calculateInverseKinematics(self.gripperID,
-                                                            self.dummy_center_indicator_link_index,
-                                                            self.gripperBasePosition,
-                                                            self.gripperBaseOrientation)
-            for jointName in self.joints:
-                if jointName in self.position_control_joint_name:
-                    joint = self.joints[jointName]
-                    pybullet.setJointMotorControl2(self.gripperID, joint.id, pybullet.POSITION_CONTROL,
-                                                   targetPosition=jointPose[joint.id], force=joint.maxForce,
-                                                   maxVelocity=joint.maxVelocity)
-
-            pybullet.setJointMotorControl2(self.gripperID,
-                                           self.joints[self.gripper_main_control_joint_name].id,
-                                           pybullet.POSITION_CONTROL,
-                                           targetPosition=gripper_opening_para,
-                                           force=self.joints[self.gripper_main_control_joint_name].maxForce,
-                                           maxVelocity=self.joints[self.gripper_main_control_joint_name].maxVelocity)
-            # print(self.joints[self.gripper_main_control_joint_name].maxForce)
-            for i in range(len(self.mimic_joint_name)):
-                joint = self.joints[self.mimic_joint_name[i]]
-                pybullet.setJointMotorControl2(self.gripperID, joint.id, pybullet.POSITION_CONTROL,
-                                               targetPosition=gripper_opening_para * self.mimic_multiplier[i],
-                                               force=joint.maxForce,
-                                               maxVelocity=joint.maxVelocity)
-                # print(joint.maxForce)
+            if self.fastControl:
+                self.__driveGripper(targets)
+            else:
+                self.__setGripperControl(self.gripperBasePosition, gripper_opening_para)
             simulatedStep = simulatedStep + 1
-            if simulatedStep > MAXIMUM_SIMULATED_STEP:
+            if simulatedStep > self.physics.maxSimulatedSteps:
                 raise RuntimeError()
-            pybullet.stepSimulation()
+            yield 'closing'
             if self.serverMode == pybullet.GUI:
                 time.sleep(self.TIME_SLEEP)
 
@@ -319,9 +632,11 @@ class AutoGraspSimple(object):
                 self.robotiq_85_right_finger_tip_joint_index)
 
             leftStablizedFlag = self.__stablizedFlag(currentLeftTipLinkPosition, currentLeftTipLinkOrientation,
-                                                     leftTipLinkPosition, leftTipLinkOrientation, threshold=1e-4)
+                                                     leftTipLinkPosition, leftTipLinkOrientation,
+                                                     threshold=self.physics.fingerStableThreshold)
             rightStablizedFlag = self.__stablizedFlag(currentRightTipLinkPosition, currentRightTipLinkOrientation,
-                                                      rightTipLinkPosition, rightTipLinkOrientation, threshold=1e-4)
+                                                      rightTipLinkPosition, rightTipLinkOrientation,
+                                                      threshold=self.physics.fingerStableThreshold)
             if leftStablizedFlag and rightStablizedFlag:
                 return True
             else:
@@ -330,6 +645,45 @@ class AutoGraspSimple(object):
                 rightTipLinkPosition, rightTipLinkOrientation = self.__getLinkPositionAndOrientation(
                     self.robotiq_85_right_finger_tip_joint_index)
 
+    def __gripperClosingContinuous(self):
+        # closes the fingers with constant speed towards the smallest gripper length of the stepwise mode
+        # returns the gripper length at which both fingers reach into the object, None if they close without reaching
+        closed_opening_para = 0.0415 - self.gripperLengthList[-1] / 2
+        fingerJointIds = [self.joints[self.gripper_main_control_joint_name].id] + \
+                         [self.joints[jointName].id for jointName in self.mimic_joint_name]
+        # time for closing completely at the closing speed, plus one second
+        stepsPerSecond = round(1 / self.physics.timeStep)
+        closingSteps = int(closed_opening_para * stepsPerSecond / self.closingSpeed) + stepsPerSecond
+        simulatedStep = 0
+        if self.fastControl:
+            targets = self.__setGripperControl(self.gripperBasePosition, closed_opening_para, self.closingSpeed)
+        while (1):
+            if self.fastControl:
+                self.__driveGripper(targets)
+            else:
+                self.__setGripperControl(self.gripperBasePosition, closed_opening_para, self.closingSpeed)
+            simulatedStep = simulatedStep + 1
+            if simulatedStep > self.physics.maxSimulatedSteps:
+                raise RuntimeError()
+            yield 'closing'
+            if self.serverMode == pybullet.GUI:
+                time.sleep(self.TIME_SLEEP)
+
+            fingerPositions = [jointState[0] for jointState in
+                               pybullet.getJointStates(self.gripperID, fingerJointIds, physicsClientId=self.clientId)]
+            reachFlag = self.__fingerReach(
+                gripperId=self.gripperID,
+                objectId=self.objectID,
+                finger1LinkId=self.robotiq_85_left_finger_tip_joint_index,
+                finger2LinkId=self.robotiq_85_right_finger_tip_joint_index,
+                indentationDepth=- FINGER_REACH_INDENTATION_DEPTH
+            )
+            if reachFlag:
+                # the finger which is further closed determines the gripper length
+                return (0.0415 - max(fingerPositions)) * 2
+            if min(fingerPositions) > closed_opening_para - 1e-4 or simulatedStep > closingSteps:
+                return None
+
     def __gripperLifting(self, gripperLength):
         basePosition = np.array(self.gripperBasePosition)
         # basePosition = self.gripperBasePosition.copy()
@@ -337,39 +691,19 @@ class AutoGraspSimple(object):
         # gripper control
         gripper_opening_para = 0.0415 - gripperLength / 2
         simulatedStep = 0
+        if self.fastControl:
+            targets = self.__setGripperControl(basePosition, gripper_opening_para)
         while (1):
-            jointPose = pybullet.calculateInverseKinematics(self.gripperID,
-                                                            self.dummy_center_indicator_link_index,
-                                                            basePosition,
-                                                            self.gripperBaseOrientation)
-            for jointName in self.joints:
-                if jointName in self.position_control_joint_name:
-                    joint = self.joints[jointName]
-                    pybullet.setJointMotorControl2(self.gripperID, joint.id, pybullet.POSITION_CONTROL,
-                                                   targetPosition=jointPose[joint.id], force=joint.maxForce,
-                                                   maxVelocity=joint.maxVelocity)
-
-            pybullet.setJointMotorControl2(self.gripperID,
-                                           self.joints[self.gripper_main_control_joint_name].id,
-                                           pybullet.POSITION_CONTROL,
-                                           targetPosition=gripper_opening_para,
-                                           force=self.joints[self.gripper_main_control_joint_name].maxForce,
-                                           maxVelocity=self.joints[self.gripper_main_control_joint_name].maxVelocity)
-            # print(self.joints[self.gripper_main_control_joint_name].maxForce)
-            for i in range(len(self.mimic_joint_name)):
-                joint = self.joints[self.mimic_joint_name[i]]
-                pybullet.setJointMotorControl2(self.gripperID, joint.id, pybullet.POSITION_CONTROL,
-                                               targetPosition=gripper_opening_para * self.mimic_multiplier[i],
-                                               force=joint.maxForce,
-                                               maxVelocity=joint.maxVelocity)
-
-                # print(joint.maxForce)
-            pybullet.stepSimulation()
+            if self.fastControl:
+                self.__driveGripper(targets)
+            else:
+                self.__setGripperControl(basePosition, gripper_opening_para)
+            yield 'lifting'
             if self.serverMode == pybullet.GUI:
                 time.sleep(self.TIME_SLEEP)
             simulatedStep = simulatedStep + 1
-            if simulatedStep > MAXIMUM_SIMULATED_STEP:
+            if simulatedStep > self.physics.maxSimulatedSteps:
                 raise RuntimeError()
             currentBasePosition, _ = self.__getLinkPositionAndOrientation(self.dummy_center_indicator_link_index)
-            if math.fabs(currentBasePosition[2] - basePosition[2]) < 1e-4:
+            if math.fabs(currentBasePosition[2] - basePosition[2]) < self.physics.liftTolerance:
                 return True
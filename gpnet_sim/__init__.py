@@ -1,2 +1,40 @@
-from .simulator import simulate, simulate_direct, default_conf
-from .AutoGraspShapeCoreUtil import read_sim_csv_file
+import importlib
+import sys
+import types
+
+# the public functions and classes are imported from their modules on first access, so that modules without further
+# dependencies, i.e. gpnet_sim.client, can be imported without pybullet and the other requirements of the simulator
+_EXPORTS = {
+    'simulate': 'simulator',
+    'simulate_direct': 'simulator',
+    'default_conf': 'simulator',
+    'SimulationServer': 'server',
+    'AsyncSimulator': 'asynchronous',
+    'read_sim_csv_file': 'AutoGraspShapeCoreUtil',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(importlib.import_module(f'.{_EXPORTS[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
+
+
+if sys.version_info < (3, 7):
+    # module level __getattr__ is only supported since Python 3.7, before it has to be a method of the module's class
+    class _LazyModule(types.ModuleType):
+        def __getattr__(self, name):
+            return __getattr__(name)
+
+        def __dir__(self):
+            return __dir__()
+
+    sys.modules[__name__].__class__ = _LazyModule
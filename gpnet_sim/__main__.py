@@ -1,3 +1,11 @@
-from .simulator import simulate, parse_args
+import sys
 
-simulate(parse_args())
+if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+    from .server import serve
+    serve(sys.argv[2:])
+elif len(sys.argv) > 1 and sys.argv[1] == 'preprocess':
+    from .assets import preprocess
+    preprocess(sys.argv[2:])
+else:
+    from .simulator import simulate, parse_args
+    simulate(parse_args())
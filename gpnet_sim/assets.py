@@ -0,0 +1,458 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+import pybullet
+from attrdict import AttrDict
+from scipy.spatial import ConvexHull, QhullError
+from tqdm import tqdm
+
+from .cache import _hash_urdf
+
+# vhacd: new convex decomposition of the object mesh with pybullet's VHACD, for object meshes which are not decomposed
+#        yet (the bundled meshes already are)
+# merged: convex parts of the mesh are merged greedily, as long as the convex hull of two parts exceeds their volume by
+#         at most the merge tolerance, i.e. fewer parts with almost the same shape
+# convex: a single convex hull of the whole object, the fastest but least exact collision shape
+ASSET_KINDS = ['vhacd', 'merged', 'convex']
+
+DEFAULT_ASSET_ROOT = os.path.join(os.path.dirname(__file__), '../gpnet_data/collision')
+DEFAULT_MERGE_TOLERANCE = 0.05
+# convex parts are only merged with parts whose bounding box is at most this far away (in m)
+MERGE_NEIGHBOUR_DISTANCE = 0.001
+DEFAULT_VHACD_RESOLUTION = 100000
+# VHACD runs in a separate process per object, which is killed after this time (in s)
+DEFAULT_VHACD_TIMEOUT = 300
+MANIFEST_FILE = 'manifest.json'
+
+
+def source_hash(urdfFile):
+    """
+    :return: hex digest of the urdf file and all mesh files referenced in it
+    """
+    digest = hashlib.sha1()
+    _hash_urdf(digest, urdfFile)
+    return digest.hexdigest()
+
+
+def read_obj_parts(objFile):
+    """
+    Reads the vertices of an obj file, one array per object ('o') of the file. The bundled meshes are convex
+    decompositions with one object per convex part, and pybullet creates one convex hull per object as well.
+
+    :return: list of (n, 3) arrays
+    """
+    parts = [[]]
+    with open(objFile, 'r') as f:
+        for line in f:
+            if line.startswith('o ') and parts[-1]:
+                parts.append([])
+            elif line.startswith('v '):
+                parts[-1].append([float(v) for v in line.split()[1:4]])
+    return [np.array(part, dtype=float) for part in parts if part]
+
+
+def _convex_hull(points):
+    try:
+        return ConvexHull(points)
+    except QhullError:
+        # flat parts, joggling the input gives a hull of (almost) zero volume instead of an error
+        return ConvexHull(points, qhull_options='QJ')
+
+
+def merge_convex_parts(parts, tolerance=DEFAULT_MERGE_TOLERANCE):
+    """
+    Greedily merges the two convex parts whose convex hull adds the least volume, as long as the hull exceeds the
+    volume of both parts by at most the tolerance.
+
+    :param parts: list of (n, 3) vertex arrays of convex parts
+    :param tolerance: maximum added volume relative to the volume of the merged parts
+
+    :return: list of (n, 3) vertex arrays of the merged parts
+    """
+    hulls = {}
+    for i, points in enumerate(parts):
+        hull = _convex_hull(points)
+        hulls[i] = (points[hull.vertices], hull.volume)
+
+    def neighbours(i, j):
+        # only parts whose bounding boxes touch are merged, the hull of distant parts adds too much volume anyway
+        return np.all(hulls[i][0].min(axis=0) <= hulls[j][0].max(axis=0) + MERGE_NEIGHBOUR_DISTANCE) and \
+            np.all(hulls[j][0].min(axis=0) <= hulls[i][0].max(axis=0) + MERGE_NEIGHBOUR_DISTANCE)
+
+    def merge_cost(i, j):
+        points = np.concatenate([hulls[i][0], hulls[j][0]])
+        hull = _convex_hull(points)
+        volume = hulls[i][1] + hulls[j][1]
+        return hull.volume / volume - 1 if volume > 0 else 0.0, points[hull.vertices], hull.volume
+
+    # merge costs of all pairs are computed once, after a merge only those of the new part are added
+    costs = {(i, j): merge_cost(i, j) for i in hulls for j in hulls if i < j and neighbours(i, j)}
+    nextIndex = len(parts)
+    while costs:
+        (i, j), (cost, points, volume) = min(costs.items(), key=lambda item: item[1][0])
+        if cost > tolerance:
+            break
+        del hulls[i], hulls[j]
+        costs = {pair: value for pair, value in costs.items() if i not in pair and j not in pair}
+        hulls[nextIndex] = (points, volume)
+        costs.update({(k, nextIndex): merge_cost(k, nextIndex) for k in hulls
+                      if k != nextIndex and neighbours(k, nextIndex)})
+        nextIndex += 1
+    return [points for points, _ in hulls.values()]
+
+
+def write_obj_parts(objFile, parts):
+    """
+    Writes convex parts as objects of an obj file, each with the vertices and outward facing triangles of its hull.
+
+    :return: list of (n, 3) arrays with the hull vertices of the parts as written
+    """
+    hullParts = []
+    with open(objFile, 'w') as f:
+        vertexOffset = 1
+        for i, points in enumerate(parts):
+            hull = _convex_hull(points)
+            f.write(f'o convex_{i}\n')
+            # faces refer to the hull vertices only
+            vertexIndex = np.full(len(points), -1, dtype=int)
+            vertexIndex[hull.vertices] = np.arange(len(hull.vertices))
+            for vertex in points[hull.vertices]:
+                f.write('v %f %f %f\n' % tuple(vertex))
+            for simplex, equation in zip(hull.simplices, hull.equations):
+                a, b, c = points[simplex]
+                if np.dot(np.cross(b - a, c - a), equation[:3]) < 0:
+                    simplex = simplex[[0, 2, 1]]
+                f.write('f %d %d %d\n' % tuple(vertexIndex[simplex] + vertexOffset))
+            vertexOffset += len(hull.vertices)
+            hullParts.append(points[hull.vertices])
+    return hullParts
+
+
+def _write_vhacd_input(meshFile, inputFile):
+    """
+    Writes the vertices and faces of a mesh as a single object, with the faces in the form v//vn. The obj loader of
+    pybullet's VHACD crashes on faces which consist of vertex indices only, as in the bundled meshes.
+    """
+    with open(meshFile, 'r') as f, open(inputFile, 'w') as target:
+        for line in f:
+            if line.startswith('v '):
+                target.write(line)
+            elif line.startswith('f '):
+                indices = [vertex.split('/')[0] for vertex in line.split()[1:]]
+                target.write('f ' + ' '.join(f'{index}//{index}' for index in indices) + '\n')
+
+
+def _run_vhacd(meshFile, targetFile, logFile, resolution):
+    # vhacd prints its progress, which is in the log file as well
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+    pybullet.vhacd(meshFile, targetFile, logFile, resolution=resolution)
+
+
+def vhacd_parts(meshFile, resolution=DEFAULT_VHACD_RESOLUTION, timeout=DEFAULT_VHACD_TIMEOUT):
+    """
+    Convex decomposition of a mesh with pybullet.vhacd, which runs in a separate process, as it crashes on some meshes.
+
+    :return: list of (n, 3) vertex arrays of the convex parts, None if the decomposition failed
+    """
+    with tempfile.TemporaryDirectory() as workDir:
+        inputFile = os.path.join(workDir, 'input.obj')
+        _write_vhacd_input(meshFile, inputFile)
+        targetFile = os.path.join(workDir, 'vhacd.obj')
+        process = multiprocessing.Process(target=_run_vhacd,
+                                          args=(inputFile, targetFile, os.path.join(workDir, 'vhacd.log'), resolution))
+        process.start()
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        if process.exitcode != 0 or not os.path.isfile(targetFile):
+            return None
+        parts = read_obj_parts(targetFile)
+    return parts if parts else None
+
+
+def _collision_mesh(robot, urdfFile):
+    """
+    :return: the mesh element of the (only) collision geometry of an object urdf
+    """
+    meshes = robot.findall('.//collision/geometry/mesh')
+    if len(meshes) != 1:
+        raise ValueError(f'{urdfFile} must have exactly one collision mesh, found {len(meshes)}')
+    return meshes[0]
+
+
+def build_asset(objId, urdfRoot, kindDir, kind, parameters):
+    """
+    Builds the collision asset of one object: <objId>.obj with the convex parts, <objId>.urdf which refers to it and is
+    otherwise the same as the original urdf, and <objId>.npz with the vertices of the parts (see load_asset_parts()).
+
+    :param objId: the object id
+    :param urdfRoot: directory with the original urdf files
+    :param kindDir: output directory
+    :param kind: one of ASSET_KINDS
+    :param parameters: dict with mergeTolerance, vhacdResolution and vhacdTimeout
+
+    :return: manifest entry of the object
+    """
+    urdfFile = os.path.join(urdfRoot, objId + '.urdf')
+    urdfDir = os.path.dirname(urdfFile)
+    with open(urdfFile, 'r') as f:
+        # some urdf files start with an empty line, which is not valid xml
+        robot = ElementTree.fromstring(f.read().strip())
+    collisionMesh = _collision_mesh(robot, urdfFile)
+    meshFile = os.path.join(urdfDir, collisionMesh.get('filename'))
+
+    entry = {'source': source_hash(urdfFile)}
+    parts = read_obj_parts(meshFile)
+    if kind == 'vhacd':
+        decomposition = vhacd_parts(meshFile, parameters['vhacdResolution'], parameters['vhacdTimeout'])
+        if decomposition is None:
+            # the original mesh is kept, so the object can still be simulated
+            entry['fallback'] = 'vhacd failed, original mesh'
+        else:
+            parts = decomposition
+    elif kind == 'merged':
+        parts = merge_convex_parts(parts, parameters['mergeTolerance'])
+    elif kind == 'convex':
+        parts = [np.concatenate(parts)]
+    else:
+        raise ValueError(f'unknown asset kind {kind}')
+
+    parts = write_obj_parts(os.path.join(kindDir, objId + '.obj'), parts)
+    np.savez(os.path.join(kindDir, objId + '.npz'), vertices=np.concatenate(parts),
+             partSizes=np.array([len(points) for points in parts]))
+    collisionMesh.set('filename', objId + '.obj')
+    for mesh in robot.iter('mesh'):
+        if mesh is not collisionMesh and not os.path.isabs(mesh.get('filename')):
+            mesh.set('filename', os.path.abspath(os.path.join(urdfDir, mesh.get('filename'))))
+    assetURDFFile = os.path.join(kindDir, objId + '.urdf')
+    ElementTree.ElementTree(robot).write(assetURDFFile)
+
+    entry.update(asset=source_hash(assetURDFFile), parts=len(parts), vertices=int(sum(len(p) for p in parts)))
+    return entry
+
+
+def load_manifest(kindDir):
+    """
+    :return: manifest dict of the assets in the directory (kind, parameters and an entry per object), None if there
+             is none
+    """
+    manifestFile = os.path.join(kindDir, MANIFEST_FILE)
+    if not os.path.isfile(manifestFile):
+        return None
+    with open(manifestFile, 'r') as f:
+        return json.load(f)
+
+
+def asset_up_to_date(entry, urdfRoot, kindDir, objId):
+    """
+    :param entry: manifest entry of the object, None if there is none
+
+    :return: True if the asset was built from the current source and its files have not been changed or deleted since
+    """
+    assetURDFFile = os.path.join(kindDir, objId + '.urdf')
+    return entry is not None and os.path.isfile(assetURDFFile) and \
+        os.path.isfile(os.path.join(kindDir, objId + '.npz')) and \
+        entry['source'] == source_hash(os.path.join(urdfRoot, objId + '.urdf')) and \
+        entry['asset'] == source_hash(assetURDFFile)
+
+
+def preprocess_assets(urdfRoot, assetRoot, kind, objIds=None, mergeTolerance=DEFAULT_MERGE_TOLERANCE,
+                      vhacdResolution=DEFAULT_VHACD_RESOLUTION, vhacdTimeout=DEFAULT_VHACD_TIMEOUT, force=False):
+    """
+    Builds the collision assets of the given kind in <assetRoot>/<kind>. Assets whose source (urdf and mesh) and
+    parameters have not changed since they were built, and whose files are unchanged, are kept (see
+    asset_up_to_date()).
+
+    :param urdfRoot: directory with the original urdf files (i.e. objMeshRoot)
+    :param assetRoot: directory of the assets
+    :param kind: one of ASSET_KINDS
+    :param objIds: list of object ids, all urdf files in urdfRoot if None
+    :param force: if True, all assets are rebuilt
+
+    :return: manifest dict, see load_manifest()
+    """
+    if objIds is None:
+        objIds = sorted(name[:-len('.urdf')] for name in os.listdir(urdfRoot) if name.endswith('.urdf'))
+    kindDir = os.path.join(assetRoot, kind)
+    os.makedirs(kindDir, exist_ok=True)
+    parameters = {'mergeTolerance': mergeTolerance} if kind == 'merged' else \
+        {'vhacdResolution': vhacdResolution, 'vhacdTimeout': vhacdTimeout} if kind == 'vhacd' else {}
+
+    manifest = load_manifest(kindDir)
+    if force or manifest is None or manifest['kind'] != kind or manifest['parameters'] != parameters:
+        manifest = {'kind': kind, 'parameters': parameters, 'objects': {}}
+    builtNum = 0
+    try:
+        for objId in tqdm(objIds):
+            entry = manifest['objects'].get(objId)
+            # objects which kept their original mesh are tried again
+            if asset_up_to_date(entry, urdfRoot, kindDir, objId) and 'fallback' not in entry:
+                continue
+            manifest['objects'][objId] = build_asset(objId, urdfRoot, kindDir, kind, parameters)
+            builtNum += 1
+    finally:
+        # written in any case, so an interrupted run can be continued
+        with open(os.path.join(kindDir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+    print(f'{builtNum} of {len(objIds)} {kind} assets built, the others were up to date')
+    return manifest
+
+
+def collision_mesh_root(urdfRoot, assetRoot, kind, objIds):
+    """
+    Checks that the collision assets of the given objects are up to date with their sources and that their files
+    have not been changed since they were built.
+
+    :return: directory of the assets, to be used as objMeshRoot
+    """
+    kindDir = os.path.join(assetRoot, kind)
+    manifest = load_manifest(kindDir)
+    entries = manifest['objects'] if manifest is not None else {}
+    for objId in objIds:
+        if not asset_up_to_date(entries.get(objId), urdfRoot, kindDir, objId):
+            raise RuntimeError(f'{kind} collision asset of {objId} is missing or outdated in {assetRoot}, '
+                               f'run python -m gpnet_sim preprocess --collisionAssets {kind} first')
+    return kindDir
+
+
+def asset_mesh_root(cfg, objIds):
+    """
+    :return: cfg.objMeshRoot, or the directory of the collision assets if cfg.collisionAssets is set
+    """
+    if getattr(cfg, 'collisionAssets', None) is None:
+        return cfg.objMeshRoot
+    return collision_mesh_root(cfg.objMeshRoot, cfg.assetRoot, cfg.collisionAssets, objIds)
+
+
+def load_asset_parts(kindDir, objId):
+    """
+    Reads the convex parts of a collision asset from its binary file, which is much faster than parsing the obj file.
+
+    :return: list of (n, 3) vertex arrays
+    """
+    with np.load(os.path.join(kindDir, objId + '.npz')) as data:
+        return np.split(data['vertices'], np.cumsum(data['partSizes'])[:-1])
+
+
+def outcome_agreement(rawResults, assetResults, statusNum=7):
+    """
+    Compares the status codes of grasps simulated with the original meshes and with collision assets.
+
+    :param rawResults: results.SimulationResults with the original meshes
+    :param assetResults: results.SimulationResults with the collision assets
+
+    :return: dict with the number of compared grasps, the agreement rate, the success rates of both and a
+             (statusNum, statusNum) confusion matrix (rows: original meshes, columns: assets)
+    """
+    confusion = np.zeros((statusNum, statusNum), dtype=int)
+    for objId, rawRecords in rawResults.items():
+        if objId not in assetResults:
+            continue
+        assetStatus = dict(zip(assetResults[objId]['annotationIndex'], assetResults[objId]['status']))
+        for annotationIndex, status in zip(rawRecords['annotationIndex'], rawRecords['status']):
+            if annotationIndex in assetStatus:
+                confusion[status, assetStatus[annotationIndex]] += 1
+    graspNum = int(confusion.sum())
+    return {
+        'grasps': graspNum,
+        'agreement rate': np.trace(confusion) / graspNum if graspNum > 0 else 1.0,
+        'original success rate': confusion[0, :].sum() / graspNum if graspNum > 0 else 0.0,
+        'asset success rate': confusion[:, 0].sum() / graspNum if graspNum > 0 else 0.0,
+        'confusion': confusion
+    }
+
+
+def validate_assets(cfg):
+    """
+    Simulates the grasps of cfg.testFile with the original meshes and with the collision assets of cfg.collisionAssets
+    (all other options as in cfg) and prints how far the outcomes differ.
+
+    :return: dict, see outcome_agreement(), with the simulation times of both runs
+    """
+    # the simulator itself resolves the asset directory with this module
+    from .AutoGraspShapeCoreUtil import AutoGraspUtil
+    from .results import load_results
+    from .simulator import simulate
+
+    results = {}
+    times = {}
+    with tempfile.TemporaryDirectory() as workDir:
+        testFile = os.path.join(workDir, os.path.basename(cfg.testFile))
+        shutil.copy(cfg.testFile, testFile)
+        for name, collisionAssets in [('original', None), ('asset', cfg.collisionAssets)]:
+            start = time.time()
+            simulate(AttrDict(cfg, testFile=testFile, dir=None, collisionAssets=collisionAssets, verbose=False))
+            times[name] = time.time() - start
+            results[name] = load_results(testFile[:-4] + '_log.csv')
+        agreement = outcome_agreement(results['original'], results['asset'])
+    agreement.update({'original time': times['original'], 'asset time': times['asset']})
+
+    print(f'{cfg.collisionAssets} collision assets compared to the original meshes on {agreement["grasps"]} grasps:')
+    print(f'\tagreement rate:\t{agreement["agreement rate"]:.4f}')
+    print(f'\tsuccess rate:\t{agreement["original success rate"]:.4f} -> {agreement["asset success rate"]:.4f}')
+    print(f'\tsimulation time:\t{times["original"]:.1f} s -> {times["asset"]:.1f} s')
+    print('\tchanged outcomes (original -> asset: number of grasps):')
+    confusion = agreement['confusion']
+    for rawStatus, assetStatus in zip(*np.nonzero(confusion)):
+        if rawStatus != assetStatus:
+            print(f'\t\t{AutoGraspUtil.get_status_string(rawStatus)} -> {AutoGraspUtil.get_status_string(assetStatus)}:'
+                  f' {confusion[rawStatus, assetStatus]}')
+    return agreement
+
+
+def preprocess_parser():
+    # the simulator imports this module for the asset options
+    from .simulator import parser
+
+    preprocessParser = parser()
+    preprocessParser.prog = 'python -m gpnet_sim preprocess'
+    preprocessParser.description = 'builds collision assets of the objects in objMeshRoot, the simulation options ' \
+                                   'are used with --validate'
+    preprocessParser.set_defaults(collisionAssets='merged')
+    preprocessParser.add_argument('--objects', nargs='+', default=None, type=str, metavar='ID',
+                                  help='object ids to build assets for, all objects in objMeshRoot by default')
+    preprocessParser.add_argument('--mergeTolerance', default=DEFAULT_MERGE_TOLERANCE, type=float, metavar='TOL',
+                                  help='merged assets: maximum volume added by merging two convex parts, relative to '
+                                       'their volume')
+    preprocessParser.add_argument('--vhacdResolution', default=DEFAULT_VHACD_RESOLUTION, type=int, metavar='N',
+                                  help='vhacd assets: voxel resolution of the decomposition')
+    preprocessParser.add_argument('--vhacdTimeout', default=DEFAULT_VHACD_TIMEOUT, type=float, metavar='S',
+                                  help='vhacd assets: time limit per object, the original mesh is kept beyond that')
+    preprocessParser.add_argument('--force', action='store_true', help='rebuilds assets which are up to date')
+    preprocessParser.add_argument('--validate', action='store_true',
+                                  help='simulates the grasps of the test file with original meshes and assets and '
+                                       'reports how often the outcomes differ')
+    return preprocessParser
+
+
+def preprocess(args=None):
+    """
+    Entry point of python -m gpnet_sim preprocess.
+
+    :param args: list of command line arguments following preprocess
+    """
+    cfg = AttrDict(vars(preprocess_parser().parse_args(args)))
+    start = time.time()
+    manifest = preprocess_assets(cfg.objMeshRoot, cfg.assetRoot, cfg.collisionAssets, cfg.objects,
+                                 mergeTolerance=cfg.mergeTolerance, vhacdResolution=cfg.vhacdResolution,
+                                 vhacdTimeout=cfg.vhacdTimeout, force=cfg.force)
+    entries = [manifest['objects'][objId] for objId in (cfg.objects or manifest['objects'].keys())]
+    print(f'{len(entries)} objects with {sum(entry["parts"] for entry in entries)} convex parts and '
+          f'{sum(entry["vertices"] for entry in entries)} vertices in {time.time() - start:.1f} s')
+    fallbacks = [objId for objId in (cfg.objects or manifest['objects'].keys())
+                 if 'fallback' in manifest['objects'][objId]]
+    if fallbacks:
+        print(f'{len(fallbacks)} of {len(entries)} objects kept their original mesh: {", ".join(fallbacks)}')
+        if len(fallbacks) == len(entries):
+            raise RuntimeError(f'{cfg.collisionAssets} preprocessing failed on all objects, the assets are copies of '
+                               f'the original meshes')
+    if cfg.validate:
+        validate_assets(cfg)
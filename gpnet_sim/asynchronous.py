@@ -0,0 +1,150 @@
+import asyncio
+
+import numpy as np
+
+from . import scheduler
+from .AutoGraspShapeCoreUtil import AutoGraspUtil, simulation_options
+from .assets import asset_mesh_root
+from .server import SimulationServer
+from .simulator import z_move
+
+
+def _running_loop():
+    # asyncio.get_running_loop() only exists since Python 3.7
+    if hasattr(asyncio, 'get_running_loop'):
+        return asyncio.get_running_loop()
+    return asyncio.get_event_loop()
+
+
+class GraspBatch(object):
+    """
+    Grasps of one object submitted to an AsyncSimulator. The grasps are simulated in chunks, each of which is an
+    asyncio future of (objId, annotationIndices, statusList) as returned by AutoGraspUtil.testAnnotationChunk().
+    Awaiting the batch gives the same as simulate_direct().
+    """
+    def __init__(self, shape, count, futures):
+        self.shape = shape
+        self.count = count
+        self.futures = futures
+
+    async def as_completed(self):
+        """
+        Yields the results of the chunks in the order in which they finish.
+
+        :return: async generator of (annotationIndices, statusList)
+        """
+        for future in asyncio.as_completed(self.futures):
+            _, annotationIndices, statusList = await future
+            yield annotationIndices, statusList
+
+    async def result(self):
+        """
+        :return: binary success array, dict with error types (see simulate_direct())
+        """
+        outcome = np.full(self.count, -1, dtype=int)
+        for _, annotationIndices, statusList in await asyncio.gather(*self.futures):
+            outcome[annotationIndices] = statusList
+        status_code, counts = np.unique(outcome, return_counts=True)
+        summary = {AutoGraspUtil.get_status_string(status): count for status, count in zip(status_code, counts)}
+        return (outcome == 0).astype(float), summary
+
+    def __await__(self):
+        return self.result().__await__()
+
+    def cancel(self):
+        """
+        Cancels all chunks which have not been started yet. Chunks which are already being simulated (or have been
+        passed to a worker process) are finished, but their results are dropped.
+        Awaiting the batch afterwards raises asyncio.CancelledError.
+        """
+        for future in self.futures:
+            future.cancel()
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+
+class AsyncSimulator(SimulationServer):
+    """
+    asyncio interface for simulations in background worker processes, e.g. to overlap network inference with the
+    simulation. Grasps are simulated as with simulate_direct() (i.e. with AutoGraspUtil.annotationSimulation() and the
+    same status codes) on warm workers, see SimulationServer, but even a single worker runs in its own process.
+    Pre-screens, the outcome cache and near-duplicate collapsing of the config are not applied.
+
+    Usage:
+        async with AsyncSimulator(cfg) as simulator:
+            batch = simulator.submit(shape, centers, quats)
+            ...  # e.g. inference for the next batch
+            success, summary = await batch
+    """
+    def __init__(self, cfg=None, warmUp=True):
+        super().__init__(cfg, warmUp, inline=False)
+        self.simulationOptions = simulation_options(self.worldMode, self.cfg.fastControl, self.cfg.closingMode,
+                                                    self.cfg.closingSpeed, self.cfg.widthWarmStart,
+                                                    self.cfg.widthMargin, self.cfg.physicsProfile,
+                                                    self.cfg.meshRegistry, self.cfg.meshMemoryBudget)
+
+    def submit(self, shape, centers, quats, widths=None, chunkSize=None):
+        """
+        Submits the grasps for one object to the workers. Must be called with a running event loop.
+
+        :param shape: the object id
+        :param centers: np array with grasp centers
+        :param quats: np array with grasp quaternions (w, x, y, z)
+        :param widths: np array with predicted gripper opening lengths in m, optional, see simulate_direct()
+        :param chunkSize: number of grasps per chunk, i.e. granularity of GraspBatch.as_completed() and cancel(),
+                          chosen automatically if None
+
+        :return: GraspBatch
+        """
+        if self.pool is None:
+            raise RuntimeError('the simulator has been shut down')
+        if self.cfg.z_move:
+            centers = z_move(centers, quats)
+        simulator = AutoGraspUtil()
+        simulator.addObject2(objId=shape, quaternion=np.asarray(quats), translation=centers, width=widths)
+        annotations = simulator.annotationDict[shape]
+        objMeshRoot = asset_mesh_root(self.cfg, [shape])
+
+        loop = _running_loop()
+        futures = []
+        plan = scheduler.plan_object_chunks([len(annotations)], self.pool.workerNum, chunkSize)
+        for workerIndex, chunks in enumerate(plan):
+            for _, start, stop in chunks:
+                annotationIndices = np.arange(start, stop)
+                future = self.pool.submit(workerIndex, AutoGraspUtil.testAnnotationChunk, shape,
+                                          annotations[annotationIndices], annotationIndices, self.cfg.gripperFile,
+                                          objMeshRoot, False, self.simulationOptions)
+                futures.append(asyncio.wrap_future(future, loop=loop))
+        return GraspBatch(shape, len(annotations), futures)
+
+    async def simulate_async(self, shape, centers, quats, widths=None):
+        """
+        Awaitable counterpart of simulate_direct().
+
+        :return: binary success array, dict with error types
+        """
+        return await self.submit(shape, centers, quats, widths)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        # closing the kept worlds waits for the workers, which must not block the event loop
+        await _running_loop().run_in_executor(None, self.shutdown)
+
+
+async def as_completed(batches):
+    """
+    Yields grasp batches (e.g. of different objects) in the order in which they finish.
+
+    :param batches: list of GraspBatch
+
+    :return: async generator of (batch, (binary success array, dict with error types))
+    """
+    tasks = {asyncio.ensure_future(batch.result()): batch for batch in batches}
+    pending = set(tasks.keys())
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield tasks[task], task.result()
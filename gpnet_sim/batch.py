@@ -0,0 +1,116 @@
+import collections
+
+import numpy as np
+import pybullet
+import pybullet_data
+
+from .AutoGraspSimpleShapeCore import PHYSICS_PROFILES, AutoGraspSimple
+from .meshes import DEFAULT_MESH_MEMORY_BUDGET, MeshRegistry
+
+# distance in m between the origins of neighbouring scenes, large enough that objects and grippers of different
+# scenes cannot touch each other (objects are < 0.5 m, the gripper is lifted by 0.05 m only)
+SCENE_SPACING = 2.0
+
+
+def scene_offsets(sceneNum, spacing=SCENE_SPACING):
+    """
+    :return: (sceneNum, 3) array of scene origins on a square grid on the ground plane, starting at the world origin
+    """
+    columns = int(np.ceil(np.sqrt(sceneNum)))
+    indices = np.arange(sceneNum)
+    return np.stack([indices % columns * spacing, indices // columns * spacing, np.zeros(sceneNum)], axis=1)
+
+
+class BatchSimulation(object):
+    """
+    Simulates several grasps at once in one physics world (experimental). Each grasp gets its own scene with object
+    and gripper, the scenes are placed apart on a common ground plane, so they cannot touch, and are stepped together.
+    The outcomes of a few grasps differ from a world per grasp. The solver handles each scene as an island of its own,
+    but once the fingers touch the object, the contacts of a scene are ordered differently when there are other scenes
+    in the world, and the shift of the scenes away from the origin changes the numerics as well. Placing all scenes
+    at the origin with collision filtering does not make them match, neither does deterministic ordering of the
+    contact pairs (which also changes the outcomes of a world per grasp). Therefore batching is not offered by the
+    command line, the server and the asyncio API.
+    Grasps run exactly as in AutoGraspSimple (see AutoGraspSimple.startSimulationSteps()), and as soon as a grasp has
+    finished, its scene is cleared and the next grasp is set up there, so the batch does not wait for the slowest grasp.
+    The world uses its own physics client, so it does not interfere with other worlds in the process.
+    """
+    def __init__(self, gripperFile, batchSize=8, spacing=SCENE_SPACING, **simulationOptions):
+        """
+        :param gripperFile: urdf file of the gripper
+        :param batchSize: number of grasps which are simulated at once
+        :param spacing: distance between the origins of neighbouring scenes
+        :param simulationOptions: further keyword arguments of AutoGraspSimple (e.g. closingMode), worldMode is ignored
+        """
+        self.gripperFile = gripperFile
+        self.batchSize = batchSize
+        self.offsets = scene_offsets(batchSize, spacing)
+        simulationOptions.pop('worldMode', None)
+        self.simulationOptions = simulationOptions
+        physics = PHYSICS_PROFILES[simulationOptions.get('physicsProfile', 'reference')]
+
+        self.clientId = pybullet.connect(pybullet.DIRECT)
+        pybullet.setAdditionalSearchPath(pybullet_data.getDataPath(), physicsClientId=self.clientId)
+        pybullet.setGravity(0, 0, -9.8, physicsClientId=self.clientId)
+        pybullet.setPhysicsEngineParameter(fixedTimeStep=physics.timeStep, numSolverIterations=physics.solverIterations,
+                                           physicsClientId=self.clientId)
+        self.planeID = pybullet.loadURDF("plane.urdf", physicsClientId=self.clientId)
+        # the scenes share the collision shapes of the world, if the mesh registry is enabled
+        self.meshRegistry = MeshRegistry(self.clientId, simulationOptions.get('meshMemoryBudget',
+                                                                              DEFAULT_MESH_MEMORY_BUDGET))
+
+    def simulate(self, grasps):
+        """
+        Simulates the given grasps, yields results in the order in which the grasps finish.
+
+        :param grasps: iterable of (objectURDFFile, annotation), annotation is (length, position x y z,
+                       quaternion x y z w) as for AutoGraspUtil.annotationSimulation()
+
+        :return: generator of (index of the grasp in grasps, status code)
+        """
+        pending = collections.deque(enumerate(grasps))
+        scenes = {}
+
+        def set_up(slot):
+            # starts the next pending grasp in the scene of slot, returns False if there is none
+            if not pending:
+                return False
+            index, (objectURDFFile, annotation) = pending.popleft()
+            grasp = AutoGraspSimple(
+                objectURDFFile=objectURDFFile,
+                gripperURDFFile=self.gripperFile,
+                gripperLengthInit=annotation[0],
+                gripperBasePosition=annotation[1:4],
+                gripperBaseOrientation=annotation[4:8],
+                serverMode=pybullet.DIRECT,
+                **self.simulationOptions
+            )
+            steps = grasp.startSimulationSteps(self.planeID, self.offsets[slot], self.clientId, self.meshRegistry)
+            # run the grasp until it needs the first simulation step
+            next(steps)
+            scenes[slot] = (index, steps)
+            return True
+
+        for slot in range(self.batchSize):
+            if not set_up(slot):
+                break
+
+        while scenes:
+            pybullet.stepSimulation(physicsClientId=self.clientId)
+            for slot in list(scenes.keys()):
+                index, steps = scenes[slot]
+                try:
+                    next(steps)
+                except StopIteration as stop:
+                    del scenes[slot]
+                    yield index, stop.value
+                    set_up(slot)
+
+    def close(self):
+        pybullet.disconnect(physicsClientId=self.clientId)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
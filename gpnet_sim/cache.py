@@ -0,0 +1,173 @@
+import hashlib
+import os
+import sqlite3
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+import pybullet
+
+from . import AutoGraspSimpleShapeCore as core
+
+# grasp poses (and predicted widths) are quantised to multiples of this tolerance before hashing, i.e. grasps which
+# differ by less than the tolerance share a cache entry
+DEFAULT_POSE_TOLERANCE = 1e-6
+# maximum size of the cache in megabytes, the least recently used entries are evicted beyond that
+DEFAULT_MAX_SIZE = 1024
+# simulation options which do not change the outcome of a grasp and are therefore not part of the scene key.
+# the 'fresh' and 'reuse' world modes give identical results, only 'persistent' is hashed
+NEUTRAL_OPTIONS = {'worldMode': ['fresh', 'reuse']}
+
+
+def _hash_file(digest, filename):
+    with open(filename, 'rb') as f:
+        content = f.read()
+    digest.update(content)
+    return content
+
+
+def _hash_urdf(digest, urdfFile):
+    """ adds the contents of the urdf file and all mesh files referenced in it to the digest """
+    # some urdf files start with an empty line, which is not valid xml
+    robot = ElementTree.fromstring(_hash_file(digest, urdfFile).strip())
+    urdfDir = os.path.dirname(urdfFile)
+    for mesh in robot.iter('mesh'):
+        meshFile = os.path.join(urdfDir, mesh.get('filename'))
+        if os.path.isfile(meshFile):
+            _hash_file(digest, meshFile)
+
+
+def scene_key(objectURDFFile, gripperURDFFile, simulationOptions=None):
+    """
+    Hash of everything a simulated grasp outcome depends on except for the grasp itself: object and gripper (including
+    meshes), the physics parameters and the simulation options.
+
+    :param simulationOptions: dict with further keyword arguments of AutoGraspSimple (e.g. closingMode), options in
+                              NEUTRAL_OPTIONS are left out if they take one of the listed values
+
+    :return: bytes
+    """
+    simulationOptions = {key: value for key, value in (simulationOptions or {}).items()
+                         if value not in NEUTRAL_OPTIONS.get(key, [])}
+    digest = hashlib.sha1()
+    _hash_urdf(digest, objectURDFFile)
+    _hash_urdf(digest, gripperURDFFile)
+    physics = core.PHYSICS_PROFILES[simulationOptions.get('physicsProfile', 'reference')]
+    parameters = [pybullet.getAPIVersion(), core.MU, core.SPINNING_FRICTION, core.ROLLING_FRICTION,
+                  core.COLLISION_DETECTION_INDENTATION_DEPTH, core.FINGER_REACH_INDENTATION_DEPTH, tuple(physics),
+                  sorted(simulationOptions.items())]
+    digest.update(repr(parameters).encode())
+    return digest.digest()
+
+
+def grasp_keys(sceneKey, annotations, tolerance=DEFAULT_POSE_TOLERANCE):
+    """
+    :param sceneKey: see scene_key()
+    :param annotations: (n, 8) array of annotations (length, position x y z, quaternion x y z w)
+    :param tolerance: quantisation of the annotation values
+
+    :return: list of n keys (hex strings)
+    """
+    quantised = np.round(np.asarray(annotations, dtype=float).reshape(-1, 8) / tolerance).astype(np.int64)
+    return [hashlib.sha1(sceneKey + row.tobytes()).hexdigest() for row in quantised]
+
+
+class OutcomeCache(object):
+    """
+    Persistent cache of simulated grasp outcomes in a SQLite file, keyed by grasp_keys().
+    Counts hits and misses of lookup() and, when storing, evicts the least recently used entries while the pages in
+    use exceed maxSize megabytes. Pages freed by the eviction are reused by later entries, so the file does not grow
+    beyond maxSize.
+    It should only be used by one process at a time, i.e. the main process, which distributes the grasps.
+    """
+    def __init__(self, cacheFile, tolerance=DEFAULT_POSE_TOLERANCE, maxSize=DEFAULT_MAX_SIZE):
+        self.cacheFile = cacheFile
+        self.tolerance = tolerance
+        self.maxBytes = int(maxSize * 1024 ** 2)
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(cacheFile)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS outcomes '
+                                '(key TEXT PRIMARY KEY, status INTEGER NOT NULL, lastUsed INTEGER NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS outcomesLastUsed ON outcomes (lastUsed)')
+        self.connection.commit()
+        # logical clock for the least recently used eviction
+        self.clock = self.connection.execute('SELECT COALESCE(MAX(lastUsed), 0) FROM outcomes').fetchone()[0]
+        # number of entries, counted once and then kept up to date by store()
+        self.entryNum = self.connection.execute('SELECT COUNT(*) FROM outcomes').fetchone()[0]
+        self.pageSize = self.connection.execute('PRAGMA page_size').fetchone()[0]
+
+    def size(self):
+        """
+        :return: number of bytes of the pages in use (the free pages of the file are not counted)
+        """
+        pageNum = self.connection.execute('PRAGMA page_count').fetchone()[0]
+        freePageNum = self.connection.execute('PRAGMA freelist_count').fetchone()[0]
+        return (pageNum - freePageNum) * self.pageSize
+
+    def keys(self, objectURDFFile, gripperURDFFile, annotations, simulationOptions=None):
+        """
+        :return: cache keys of the grasps given by annotations, see grasp_keys()
+        """
+        sceneKey = scene_key(objectURDFFile, gripperURDFFile, simulationOptions)
+        return grasp_keys(sceneKey, annotations, self.tolerance)
+
+    def lookup(self, keys):
+        """
+        :param keys: list of keys
+
+        :return: array of status codes, -1 for keys which are not in the cache
+        """
+        uniqueKeys = list(set(keys))
+        found = {}
+        # sqlite limits the number of parameters of a query
+        for start in range(0, len(uniqueKeys), 500):
+            chunk = uniqueKeys[start:start + 500]
+            rows = self.connection.execute(
+                f'SELECT key, status FROM outcomes WHERE key IN ({",".join("?" * len(chunk))})', chunk).fetchall()
+            found.update(rows)
+        if found:
+            self.clock += 1
+            self.connection.executemany('UPDATE outcomes SET lastUsed = ? WHERE key = ?',
+                                        [(self.clock, key) for key in found.keys()])
+            self.connection.commit()
+        statusList = np.array([found.get(key, -1) for key in keys], dtype=int)
+        hitNum = int(np.sum(statusList >= 0))
+        self.hits += hitNum
+        self.misses += len(statusList) - hitNum
+        return statusList
+
+    def store(self, keys, statusList):
+        """
+        Adds outcomes to the cache and evicts the least recently used entries if it is larger than maxSize.
+        Keys which are already in the cache keep their outcome, as equal keys imply equal outcomes.
+        """
+        self.clock += 1
+        cursor = self.connection.executemany('INSERT OR IGNORE INTO outcomes (key, status, lastUsed) VALUES (?, ?, ?)',
+                                             [(key, int(status), self.clock) for key, status in zip(keys, statusList)])
+        self.entryNum += cursor.rowcount
+        size = self.size()
+        while size > self.maxBytes and self.entryNum > 0:
+            # estimate the number of entries to evict from the mean size of an entry. deleting entries leaves
+            # partially filled pages behind, so the size is checked again until it is within the budget
+            excess = min(self.entryNum, int(np.ceil((size - self.maxBytes) * self.entryNum / size)) + 1)
+            cursor = self.connection.execute('DELETE FROM outcomes WHERE key IN '
+                                             '(SELECT key FROM outcomes ORDER BY lastUsed LIMIT ?)', (excess,))
+            self.entryNum -= cursor.rowcount
+            size = self.size()
+        self.connection.commit()
+
+    def statistics(self):
+        """
+        :return: dict with hits, misses, number of entries and size in megabytes
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'entries': self.entryNum,
+                'size': round(self.size() / 1024 ** 2, 3)}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,173 @@
+"""
+Client for the grasp evaluation server (python -m gpnet_sim serve), see readme.
+This module only depends on numpy and the standard library. With the repository on the python path, it is imported
+as gpnet_sim.client, which does not import the simulator (the package imports its other modules on first access). In
+environments without the repository, client.py can also be copied next to the training code and imported as a
+top-level module (import client), as it has no imports from gpnet_sim.
+
+Protocol: every message consists of a header (two big-endian uint32: length of the json part, length of the binary
+part), a json object and a binary payload.
+    simulate request:   {'type': 'simulate', 'id', 'shape', 'count', 'widths'}, payload: float64 array with one row
+                        per grasp: center x y z, quaternion w x y z and, if widths is true, the predicted opening
+                        length in m
+    stats request:      {'type': 'stats'}, no payload
+    results:            {'type': 'results', 'id', 'count'}, payload: int64 annotation indices, then int64 status codes,
+                        sent as soon as grasps of the request are finished
+    done:               {'type': 'done', 'id', 'summary', 'wait', 'latency'}, after all results of the request
+    error:              {'type': 'error', 'id', 'message'}
+    stats:              {'type': 'stats', ...}, see SimulationClient.statistics()
+"""
+import json
+import socket
+import struct
+
+import numpy as np
+
+HEADER = struct.Struct('!II')
+GRASP_DTYPE = np.dtype('<f8')
+STATUS_DTYPE = np.dtype('<i8')
+
+# status codes of the simulation, as in AutoGraspUtil.get_status_string()
+SUCCESS = 0
+
+
+def _receive_exactly(connection, length):
+    data = bytearray()
+    while len(data) < length:
+        chunk = connection.recv(length - len(data))
+        if not chunk:
+            raise ConnectionError('connection closed by peer')
+        data.extend(chunk)
+    return bytes(data)
+
+
+def send_message(connection, header, payload=b''):
+    """
+    :param connection: socket
+    :param header: json serialisable dict
+    :param payload: bytes
+    """
+    content = json.dumps(header).encode()
+    connection.sendall(HEADER.pack(len(content), len(payload)) + content + payload)
+
+
+def receive_message(connection):
+    """
+    :return: header dict, payload bytes
+    """
+    contentLength, payloadLength = HEADER.unpack(_receive_exactly(connection, HEADER.size))
+    header = json.loads(_receive_exactly(connection, contentLength).decode())
+    return header, _receive_exactly(connection, payloadLength)
+
+
+def encode_grasps(centers, quats, widths=None):
+    """
+    :return: payload of a simulate request
+    """
+    columns = [np.reshape(centers, (-1, 3)), np.reshape(quats, (-1, 4))]
+    if widths is not None:
+        columns.append(np.reshape(widths, (-1, 1)))
+    return np.ascontiguousarray(np.concatenate(columns, axis=1), dtype=GRASP_DTYPE).tobytes()
+
+
+def decode_grasps(payload, count, haveWidths):
+    """
+    :return: centers, quats, widths (None if haveWidths is False)
+    """
+    grasps = np.frombuffer(payload, dtype=GRASP_DTYPE).reshape(count, 8 if haveWidths else 7)
+    return grasps[:, 0:3], grasps[:, 3:7], grasps[:, 7] if haveWidths else None
+
+
+def encode_results(annotationIndices, statusList):
+    return np.asarray(annotationIndices, dtype=STATUS_DTYPE).tobytes() + \
+        np.asarray(statusList, dtype=STATUS_DTYPE).tobytes()
+
+
+def decode_results(payload, count):
+    """
+    :return: annotation indices, status codes
+    """
+    results = np.frombuffer(payload, dtype=STATUS_DTYPE)
+    return results[:count], results[count:]
+
+
+class SimulationClient(object):
+    """
+    Connection to a grasp evaluation server. Requests of one client are answered one after the other.
+    """
+    def __init__(self, address):
+        """
+        :param address: path of the unix domain socket, or (host, port) tuple
+        """
+        if isinstance(address, str):
+            self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connection.connect(address)
+        self.requestId = 0
+        # wait and latency of the last request as measured by the server
+        self.lastTiming = None
+
+    def simulate(self, shape, centers, quats, widths=None, resultCallback=None):
+        """
+        Simulates the grasps for one object on the server, see gpnet_sim.simulate_direct(). The simulation settings
+        are those the server has been started with.
+
+        :param shape: the object id
+        :param centers: np array with grasp centers
+        :param quats: np array with grasp quaternions (w, x, y, z)
+        :param widths: np array with predicted gripper opening lengths in m, optional
+        :param resultCallback: function(annotationIndices, statusList), called as results arrive
+
+        :return: binary success array, dict with error types
+        """
+        self.requestId += 1
+        count = len(centers)
+        send_message(self.connection, {'type': 'simulate', 'id': self.requestId, 'shape': shape, 'count': count,
+                                       'widths': widths is not None},
+                     encode_grasps(centers, quats, widths))
+        status = np.full(count, -1, dtype=int)
+        while True:
+            header, payload = receive_message(self.connection)
+            if header['type'] == 'results':
+                annotationIndices, statusList = decode_results(payload, header['count'])
+                status[annotationIndices] = statusList
+                if resultCallback is not None:
+                    resultCallback(annotationIndices, statusList)
+            elif header['type'] == 'done':
+                self.lastTiming = {'wait': header['wait'], 'latency': header['latency']}
+                return (status == SUCCESS).astype(float), header['summary']
+            elif header['type'] == 'error':
+                raise RuntimeError(f'simulation server: {header["message"]}')
+
+    def statistics(self):
+        """
+        :return: dict with the server's current request queue depth, its maximum, the numbers of received, completed
+                 and failed requests, the number of simulated grasps and the mean and maximum wait and latency (time
+                 from receiving a request until it is done) in s
+        """
+        send_message(self.connection, {'type': 'stats'})
+        header, _ = receive_message(self.connection)
+        header.pop('type')
+        return header
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def simulate_direct(address, shape, centers, quats, widths=None):
+    """
+    Counterpart of gpnet_sim.simulate_direct() for a grasp evaluation server.
+
+    :param address: path of the unix domain socket, or (host, port) tuple
+
+    :return: binary success array, dict with error types
+    """
+    with SimulationClient(address) as client:
+        return client.simulate(shape, centers, quats, widths)
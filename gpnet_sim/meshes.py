@@ -0,0 +1,148 @@
+import functools
+import os
+import xml.etree.ElementTree as ElementTree
+from collections import namedtuple
+
+import numpy as np
+import pybullet
+
+# limit of the memory of the vertex buffers which a mesh registry has turned into collision shapes in one world, in MB
+DEFAULT_MESH_MEMORY_BUDGET = 256
+# number of parsed object urdf files and vertex buffers kept per process
+MODEL_CACHE_SIZE = 4096
+# loadURDF computes the inertia of an object as that of a box, the bounding box of its mesh enlarged by this margin
+# on each side (in m, determined empirically)
+URDF_INERTIA_MARGIN = 0.004
+
+# what createCollisionShape/createMultiBody need to build the same body as loadURDF from an object urdf
+ObjectModel = namedtuple('ObjectModel', ['meshFile', 'meshScale', 'collisionPosition', 'collisionOrientation',
+                                         'mass', 'inertialPosition', 'inertialOrientation', 'size'])
+
+
+def _parse_pose(element):
+    """
+    :return: position and orientation (quaternion x, y, z, w) given by the origin tag of an urdf element
+    """
+    origin = element.find('origin') if element is not None else None
+    if origin is None:
+        return [0, 0, 0], [0, 0, 0, 1]
+    xyz = [float(v) for v in origin.get('xyz', '0 0 0').replace(',', ' ').split()]
+    rpy = [float(v) for v in origin.get('rpy', '0 0 0').replace(',', ' ').split()]
+    return xyz, list(pybullet.getQuaternionFromEuler(rpy))
+
+
+@functools.lru_cache(maxsize=MODEL_CACHE_SIZE)
+def read_object_model(urdfFile):
+    """
+    Parses an object urdf with a single link and a single collision mesh (as all bundled objects), the result is
+    cached per process.
+
+    :return: ObjectModel
+    """
+    with open(urdfFile, 'r') as f:
+        # some urdf files start with an empty line, which is not valid xml
+        robot = ElementTree.fromstring(f.read().strip())
+    links = robot.findall('link')
+    collisions = links[0].findall('collision') if len(links) == 1 else []
+    mesh = collisions[0].find('geometry/mesh') if len(collisions) == 1 else None
+    if mesh is None:
+        raise ValueError(f'{urdfFile} must have a single link with a single collision mesh')
+    meshFile = os.path.join(os.path.dirname(urdfFile), mesh.get('filename'))
+    meshScale = [float(v) for v in mesh.get('scale', '1 1 1').replace(',', ' ').split()]
+    collisionPosition, collisionOrientation = _parse_pose(collisions[0])
+    inertial = links[0].find('inertial')
+    massElement = inertial.find('mass') if inertial is not None else None
+    mass = float(massElement.get('value')) if massElement is not None else 0.0
+    inertialPosition, inertialOrientation = _parse_pose(inertial)
+    return ObjectModel(meshFile, meshScale, collisionPosition, collisionOrientation, mass, inertialPosition,
+                       inertialOrientation, os.path.getsize(meshFile))
+
+
+@functools.lru_cache(maxsize=MODEL_CACHE_SIZE)
+def read_object_parts(urdfFile):
+    """
+    Vertex buffers of the convex parts of an object, read from the binary file of a collision asset (see
+    assets.load_asset_parts()) if the urdf belongs to one, otherwise from its obj file. The result is cached per
+    process.
+
+    :return: list of (n, 3) arrays, scaled by the mesh scale of the urdf
+    """
+    # the assets module imports the simulator
+    from .assets import load_asset_parts, read_obj_parts
+
+    kindDir, fileName = os.path.split(urdfFile)
+    objId = fileName[:-len('.urdf')]
+    model = read_object_model(urdfFile)
+    if os.path.isfile(os.path.join(kindDir, objId + '.npz')):
+        parts = load_asset_parts(kindDir, objId)
+    else:
+        parts = read_obj_parts(model.meshFile)
+    return [np.asarray(part, dtype=float) * model.meshScale for part in parts]
+
+
+def urdf_inertia(model, parts):
+    """
+    :return: diagonal of the inertia tensor which loadURDF computes for the object
+    """
+    vertices = np.concatenate(parts)
+    x, y, z = vertices.max(axis=0) - vertices.min(axis=0) + 2 * URDF_INERTIA_MARGIN
+    return list(model.mass / 12 * np.array([y ** 2 + z ** 2, x ** 2 + z ** 2, x ** 2 + y ** 2]))
+
+
+class MeshRegistry(object):
+    """
+    Collision shapes of the objects in one physics world. Instead of loading the object urdf (i.e. parsing xml and
+    mesh file and building the convex hulls) for every grasp, one convex collision shape per part of an object is
+    created once from the vertex buffers of read_object_parts() and all bodies of the object are created from them with
+    createMultiBody: the first part is the base, with mass and inertial frame of the urdf, the others are attached as
+    massless links with fixed joints. The inertia is set to the one loadURDF computes. The collision margins of these
+    shapes differ slightly from those of urdf bodies, so the outcome of a few grasps changes.
+    pybullet does not release a collision shape which has been used by a body before the world is disconnected, so
+    shapes cannot be evicted one by one. Instead, the registry counts the memory of the vertex buffers of its shapes and
+    the world should be rebuilt once it exceeds the budget, see overBudget.
+    """
+    def __init__(self, clientId, memoryBudget=DEFAULT_MESH_MEMORY_BUDGET):
+        """
+        :param clientId: physics client of the world
+        :param memoryBudget: in MB
+        """
+        self.clientId = clientId
+        self.memoryBudget = memoryBudget * 2 ** 20
+        # urdf file -> collision shape ids of the parts
+        self.shapes = {}
+        # urdf file -> diagonal of the inertia tensor
+        self.inertia = {}
+        self.size = 0
+
+    @property
+    def overBudget(self):
+        return self.size > self.memoryBudget
+
+    def create_body(self, urdfFile, basePosition):
+        """
+        Creates a body of the object as loadURDF(urdfFile, basePosition) would.
+
+        :return: body id
+        """
+        model = read_object_model(urdfFile)
+        if urdfFile not in self.shapes:
+            parts = read_object_parts(urdfFile)
+            # without indices, each vertex buffer becomes a convex hull
+            self.shapes[urdfFile] = [pybullet.createCollisionShape(
+                pybullet.GEOM_MESH, vertices=part, collisionFramePosition=model.collisionPosition,
+                collisionFrameOrientation=model.collisionOrientation, physicsClientId=self.clientId)
+                for part in parts]
+            self.inertia[urdfFile] = urdf_inertia(model, parts)
+            self.size += sum(part.nbytes for part in parts)
+        shapes = self.shapes[urdfFile]
+        linkNum = len(shapes) - 1
+        bodyId = pybullet.createMultiBody(
+            baseMass=model.mass, baseCollisionShapeIndex=shapes[0], basePosition=basePosition,
+            baseInertialFramePosition=model.inertialPosition, baseInertialFrameOrientation=model.inertialOrientation,
+            linkMasses=[0] * linkNum, linkCollisionShapeIndices=shapes[1:], linkVisualShapeIndices=[-1] * linkNum,
+            linkPositions=[[0, 0, 0]] * linkNum, linkOrientations=[[0, 0, 0, 1]] * linkNum,
+            linkInertialFramePositions=[[0, 0, 0]] * linkNum, linkInertialFrameOrientations=[[0, 0, 0, 1]] * linkNum,
+            linkParentIndices=[0] * linkNum, linkJointTypes=[pybullet.JOINT_FIXED] * linkNum,
+            linkJointAxis=[[0, 0, 1]] * linkNum, physicsClientId=self.clientId)
+        pybullet.changeDynamics(bodyId, -1, localInertiaDiagonal=self.inertia[urdfFile], physicsClientId=self.clientId)
+        return bodyId
@@ -0,0 +1,197 @@
+import xml.etree.ElementTree as ElementTree
+
+import numpy as np
+import pybullet
+import pybullet_data
+
+from .AutoGraspSimpleShapeCore import COLLISION_DETECTION_INDENTATION_DEPTH
+
+# off: all grasps are simulated
+# on: grasps flagged by the pre-screen get their status directly and are not simulated
+# validate: all grasps are simulated and the pre-screen is compared to the simulation results
+PRESCREEN_MODES = ['off', 'on', 'validate']
+
+# status codes of AutoGraspSimple, which are assigned by the pre-screens
+STATUS_COLLIDE_WITH_GROUND = 1
+STATUS_COLLIDE_WITH_OBJECT = 2
+
+# grasps within these tolerances of a higher ranked grasp are considered near-duplicates of it (in m and degrees)
+DEFAULT_DUPLICATE_POSITION_TOLERANCE = 0.001
+DEFAULT_DUPLICATE_ANGLE_TOLERANCE = 2.0
+
+
+def _parse_origin(element):
+    """
+    :return: (4, 4) transform given by the origin tag of an urdf element (identity if there is none)
+    """
+    transform = np.eye(4)
+    origin = element.find('origin')
+    if origin is None:
+        return transform
+    xyz = [float(v) for v in origin.get('xyz', '0 0 0').replace(',', ' ').split()]
+    roll, pitch, yaw = [float(v) for v in origin.get('rpy', '0 0 0').replace(',', ' ').split()]
+    cr, sr, cp, sp, cy, sy = np.cos(roll), np.sin(roll), np.cos(pitch), np.sin(pitch), np.cos(yaw), np.sin(yaw)
+    transform[:3, :3] = [
+        [cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr],
+        [sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr],
+        [-sp, cp * sr, cp * cr]
+    ]
+    transform[:3, 3] = xyz
+    return transform
+
+
+def gripper_collision_corners(gripperFile):
+    """
+    Computes the corners of all collision boxes of the gripper in its initial configuration (all joints at zero),
+    expressed in the frame of the gripper base, i.e. the frame of gripperBasePosition/-Orientation.
+
+    :param gripperFile: urdf file of the gripper, all collision geometries must be boxes
+
+    :return: (n*8, 3) array of corners of the n collision boxes
+    """
+    robot = ElementTree.parse(gripperFile).getroot()
+    links = {link.get('name'): link for link in robot.findall('link')}
+    jointsByChild = {joint.find('child').get('link'): joint for joint in robot.findall('joint')}
+
+    # root link is the one which is not a child of any joint
+    baseLinkNames = [name for name in links.keys() if name not in jointsByChild]
+    if len(baseLinkNames) != 1:
+        raise ValueError(f'could not determine base link of {gripperFile}')
+    # pybullet places the inertial frame of the base link at the given base pose
+    baseInertial = links[baseLinkNames[0]].find('inertial')
+    baseTransform = np.linalg.inv(_parse_origin(baseInertial)) if baseInertial is not None else np.eye(4)
+
+    def link_transform(name):
+        if name not in jointsByChild:
+            return baseTransform
+        joint = jointsByChild[name]
+        return link_transform(joint.find('parent').get('link')) @ _parse_origin(joint)
+
+    signs = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype=float)
+    corners = []
+    for name, link in links.items():
+        for collision in link.findall('collision'):
+            box = collision.find('geometry/box')
+            if box is None:
+                raise ValueError(f'link {name} of {gripperFile} has a collision geometry that is not a box')
+            halfExtents = np.array([float(v) for v in box.get('size').replace(',', ' ').split()]) / 2
+            transform = link_transform(name) @ _parse_origin(collision)
+            corners.append((signs * halfExtents) @ transform[:3, :3].T + transform[:3, 3])
+    return np.concatenate(corners, axis=0)
+
+
+def ground_collision_prescreen(annotations, gripperFile, indentationDepth=COLLISION_DETECTION_INDENTATION_DEPTH):
+    """
+    Checks analytically for all grasps at once, whether the gripper penetrates the ground plane (z=0) deeper than the
+    indentation depth used for collision detection in the simulation.
+
+    :param annotations: (n, 8) array of annotations (length, position x y z, quaternion x y z w)
+    :param gripperFile: urdf file of the gripper
+    :param indentationDepth: penetration depth from which on a contact counts as collision
+
+    :return: (n,) bool array, True if the grasp would collide with the ground
+    """
+    annotations = np.asarray(annotations, dtype=float).reshape(-1, 8)
+    corners = gripper_collision_corners(gripperFile)
+    q = annotations[:, 4:8] / np.linalg.norm(annotations[:, 4:8], axis=1, keepdims=True)
+    x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    # the z-coordinate of a point in world frame only depends on the last row of the rotation matrix
+    rotationZRow = np.stack([2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)], axis=1)
+    lowestCorner = annotations[:, 3] + np.min(rotationZRow @ corners.T, axis=1)
+    return lowestCorner < -indentationDepth
+
+
+class CollisionScreen(object):
+    """
+    Static world with ground plane, one object and the (open) gripper, in which the gripper is teleported through
+    grasp poses to check them for collisions with closest-point queries, without simulating any dynamics.
+    This is the same check as in the first phase of AutoGraspSimple.startSimulation().
+    The world uses its own physics client, so it does not interfere with the worlds of AutoGraspSimple.
+    """
+    def __init__(self, objectURDFFile, gripperURDFFile, indentationDepth=COLLISION_DETECTION_INDENTATION_DEPTH):
+        self.indentationDepth = indentationDepth
+        self.clientId = pybullet.connect(pybullet.DIRECT)
+        pybullet.setAdditionalSearchPath(pybullet_data.getDataPath(), physicsClientId=self.clientId)
+        self.planeID = pybullet.loadURDF('plane.urdf', physicsClientId=self.clientId)
+        self.objectID = pybullet.loadURDF(objectURDFFile, physicsClientId=self.clientId)
+        self.gripperID = pybullet.loadURDF(gripperURDFFile, basePosition=[0, 0, 100], physicsClientId=self.clientId)
+
+    def __isCollide(self, bodyID):
+        closestPoints = pybullet.getClosestPoints(self.gripperID, bodyID, distance=0, physicsClientId=self.clientId)
+        return any(point[8] < - self.indentationDepth for point in closestPoints)
+
+    def check(self, position, orientation):
+        """
+        :param position: gripper base position
+        :param orientation: gripper base orientation as quaternion x, y, z, w
+
+        :return: status code, 1 for collision with ground, 2 for collision with object, -1 if there is no collision
+        """
+        pybullet.resetBasePositionAndOrientation(self.gripperID, position, orientation, physicsClientId=self.clientId)
+        if self.__isCollide(self.planeID):
+            return STATUS_COLLIDE_WITH_GROUND
+        if self.__isCollide(self.objectID):
+            return STATUS_COLLIDE_WITH_OBJECT
+        return -1
+
+    def close(self):
+        pybullet.disconnect(physicsClientId=self.clientId)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def cluster_near_duplicates(annotations, positionTolerance, angleTolerance):
+    """
+    Clusters grasps whose positions and orientations are both within the tolerances of each other. The grasps are
+    processed in the given order (i.e. by rank), each grasp which does not belong to a cluster yet starts a new one and
+    becomes its representative, the remaining grasps within the tolerances of it join its cluster.
+
+    :param annotations: (n, 8) array of annotations (length, position x y z, quaternion x y z w)
+    :param positionTolerance: maximum distance of the positions in m
+    :param angleTolerance: maximum rotation angle between the orientations in degrees
+
+    :return: (n,) array with the index of the representative of each grasp
+    """
+    annotations = np.asarray(annotations, dtype=float).reshape(-1, 8)
+    positions = annotations[:, 1:4]
+    quaternions = annotations[:, 4:8] / np.linalg.norm(annotations[:, 4:8], axis=1, keepdims=True)
+    # the rotation angle between two orientations is 2 * arccos(|q1 . q2|)
+    minDot = np.cos(np.deg2rad(angleTolerance) / 2)
+    representatives = np.full(len(annotations), -1, dtype=int)
+    for i in range(len(annotations)):
+        if representatives[i] >= 0:
+            continue
+        candidates = np.flatnonzero(representatives[i:] < 0) + i
+        close = (np.linalg.norm(positions[candidates] - positions[i], axis=1) <= positionTolerance) & \
+                (np.abs(quaternions[candidates] @ quaternions[i]) >= minDot)
+        representatives[candidates[close]] = i
+    return representatives
+
+
+def prescreen_agreement(flagDict, statusDict, status):
+    """
+    Measures how well a pre-screen agrees with the status codes from the physics simulation.
+
+    :param flagDict: dict with objId as key and bool array (ordered by annotation index) as value, True if flagged
+    :param statusDict: dict with objId as key and array of simulated status codes as value
+    :param status: the status code which the pre-screen predicts for flagged grasps
+
+    :return: dict with number of grasps, flagged grasps, grasps with the status in simulation, false positives
+             (flagged, but different status in simulation), false negatives (not flagged, but status in simulation)
+             and the agreement rate
+    """
+    flags = np.concatenate([flagDict[objId] for objId in statusDict.keys()] + [np.empty(0, dtype=bool)])
+    actual = np.concatenate([statusDict[objId] for objId in statusDict.keys()] + [np.empty(0, dtype=int)]) == status
+    agreement = {
+        'grasps': len(flags),
+        'flagged': int(np.sum(flags)),
+        'actual': int(np.sum(actual)),
+        'false positives': int(np.sum(flags & ~actual)),
+        'false negatives': int(np.sum(~flags & actual))
+    }
+    agreement['agreement rate'] = np.mean(flags == actual) if len(flags) > 0 else 1.0
+    return agreement
@@ -0,0 +1,326 @@
+import json
+import os
+
+import numpy as np
+
+# record of the binary results store, annotation is (length, position x y z, quaternion x y z w) as in the csv log
+RESULT_DTYPE = np.dtype([
+    ('annotationIndex', np.int64),
+    ('status', np.int8),
+    ('annotation', np.float64, (8,))
+])
+
+
+def format_log_line(objId, annotationIndex, status, annotation):
+    """
+    Creates a line of the csv log file: objId, annotationIndex, status, followed by the annotation
+    (length, position x y z, quaternion x y z w).
+    """
+    simulatorParamStrList = [str(i) for i in annotation]
+    logInfo = [objId, str(annotationIndex), str(status)]
+    return ','.join(logInfo + simulatorParamStrList) + '\n'
+
+
+def results_store_files(logFile):
+    """
+    The binary results store of a csv log file consists of a .npy file with all records and a .json file with the
+    object id index, both next to the log file.
+
+    :return: filename of records, filename of index
+    """
+    base = os.path.splitext(logFile)[0]
+    return base + '.npy', base + '.json'
+
+
+def remove_results_store(logFile):
+    for fn in results_store_files(logFile):
+        if os.path.isfile(fn):
+            os.remove(fn)
+
+
+def find_results_store(logFile):
+    """
+    Checks whether there is an up-to-date results store for the given log file.
+
+    :param logFile: path to the csv log file or to the .npy file of the results store
+
+    :return: filename of the store's records, or None if there is none (or it is older than the csv log file)
+    """
+    recordsFile, indexFile = results_store_files(logFile)
+    if not (os.path.isfile(recordsFile) and os.path.isfile(indexFile)):
+        return None
+    if logFile != recordsFile and os.path.isfile(logFile) and os.path.getmtime(logFile) > os.path.getmtime(recordsFile):
+        return None
+    return recordsFile
+
+
+def write_results_store(logFile, objIdList, statusDict, annotationDict):
+    """
+    Writes the results of a simulation run to the binary results store of the log file.
+    The records are grouped by object (in order of objIdList) and sorted by annotation index, so the records of an
+    object can be accessed as a view. Objects without simulated grasps are skipped, as they are not in the log file.
+
+    :param logFile: path to the csv log file, the store is written next to it
+    :param objIdList: list of objIds, in order of their first line in the log file (see LogWriter.objIds), so that
+                      the store lists the objects in the same order as reading the log file does
+    :param statusDict: dict with objId as key and array of status codes (ordered by annotation index) as value,
+                       grasps with status -1 have not been simulated and are skipped
+    :param annotationDict: dict with objId as key and (n, 8) array of annotations as value
+    """
+    objIdList = [objId for objId in objIdList if np.any(statusDict[objId] >= 0)]
+    simulated = [np.flatnonzero(statusDict[objId] >= 0) for objId in objIdList]
+    offsets = np.cumsum([0] + [len(indices) for indices in simulated])
+    records = np.empty(offsets[-1], dtype=RESULT_DTYPE)
+    for objId, indices, start, stop in zip(objIdList, simulated, offsets[:-1], offsets[1:]):
+        records['annotationIndex'][start:stop] = indices
+        records['status'][start:stop] = statusDict[objId][indices]
+        records['annotation'][start:stop] = annotationDict[objId][indices]
+
+    recordsFile, indexFile = results_store_files(logFile)
+    np.save(recordsFile, records)
+    with open(indexFile, 'w') as f:
+        json.dump({'objIds': list(objIdList), 'offsets': offsets.tolist()}, f)
+
+
+def load_results(logFile):
+    """
+    Reads the results of a simulation run, from the binary results store if there is an up-to-date one, otherwise
+    from the csv log file.
+
+    :param logFile: path to the csv log file or to the .npy file of the results store
+
+    :return: SimulationResults
+    """
+    if find_results_store(logFile) is not None:
+        return SimulationResults.load_store(logFile)
+    return SimulationResults.from_csv(logFile)
+
+
+def load_completed_results(logFile):
+    """
+    Reads the results of an interrupted simulation run, e.g. to resume it. An incomplete last line, which is left
+    if the run was killed while writing, is removed from the log file.
+
+    :param logFile: path to the csv log file
+
+    :return: SimulationResults of all complete lines, None if there is no log file
+    """
+    if not os.path.isfile(logFile):
+        return None
+    with open(logFile, 'r') as f:
+        lines = f.readlines()
+    completeNum = len(lines)
+    if completeNum > 0 and (not lines[-1].endswith('\n') or len(lines[-1].split(',')) != 11):
+        completeNum -= 1
+        with open(logFile, 'w') as f:
+            f.writelines(lines[:completeNum])
+    return SimulationResults.from_csv(logFile)
+
+
+class SimulationResults(object):
+    """
+    Columnar simulation results, i.e. one record array with fields as in RESULT_DTYPE, in which the records are grouped
+    by object and sorted by annotation index. results[objId] returns the records of an object without copying them.
+    All statistics are computed from these columns, so the results only need to be read once.
+    """
+    def __init__(self, objIdList, offsets, records):
+        self.objIdList = objIdList
+        self.offsets = offsets
+        self.records = records
+        self.__objIndex = {objId: i for i, objId in enumerate(objIdList)}
+
+    @classmethod
+    def load_store(cls, logFile, mmap=True):
+        """
+        :param logFile: path to the csv log file or to the .npy file of the results store
+        :param mmap: if True, the records are memory-mapped, otherwise they are read into memory
+        """
+        recordsFile, indexFile = results_store_files(logFile)
+        with open(indexFile, 'r') as f:
+            index = json.load(f)
+        records = np.load(recordsFile, mmap_mode='r' if mmap else None)
+        return cls(index['objIds'], index['offsets'], records)
+
+    @classmethod
+    def from_csv(cls, logFile):
+        """
+        Parses the csv log file in one pass, objects are ordered by their first appearance in the file.
+        """
+        with open(logFile, 'r') as f:
+            rows = [line.strip().split(',', 1) for line in f if line.strip()]
+
+        objIndex = {}
+        objCodes = np.array([objIndex.setdefault(row[0], len(objIndex)) for row in rows], dtype=np.int64)
+        values = np.fromstring(','.join(row[1] for row in rows), dtype=float, sep=',')
+        if len(values) != len(rows) * 10:
+            raise ValueError(f'could not parse {logFile}, expected objId followed by 10 values per line')
+        values = values.reshape(-1, 10)
+
+        records = np.empty(len(rows), dtype=RESULT_DTYPE)
+        records['annotationIndex'] = values[:, 0]
+        records['status'] = values[:, 1]
+        records['annotation'] = values[:, 2:]
+        order = np.lexsort((records['annotationIndex'], objCodes))
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(objCodes, minlength=len(objIndex)))])
+        return cls(list(objIndex.keys()), offsets.tolist(), records[order])
+
+    def __getitem__(self, objId):
+        i = self.__objIndex[objId]
+        return self.records[self.offsets[i]:self.offsets[i + 1]]
+
+    def __contains__(self, objId):
+        return objId in self.__objIndex
+
+    def __len__(self):
+        return len(self.objIdList)
+
+    def items(self):
+        for objId in self.objIdList:
+            yield objId, self[objId]
+
+    def __flags_by_annotation_index(self, flags):
+        """
+        Distributes a flag per record to a bool vector per object, indexed by annotation index.
+        Annotation indices without record are False.
+        """
+        flagDict = {}
+        for objId, start, stop in zip(self.objIdList, self.offsets[:-1], self.offsets[1:]):
+            annotationIndices = self.records['annotationIndex'][start:stop]
+            flagDict[objId] = np.full(shape=annotationIndices[-1] + 1 if stop > start else 0, fill_value=False)
+            flagDict[objId][annotationIndices] = flags[start:stop]
+        return flagDict
+
+    def success_vectors(self):
+        """
+        :return: dict with objId as key and bool array (indexed by annotation index) as value, True if successful
+        """
+        return self.__flags_by_annotation_index(self.records['status'] == 0)
+
+    def collision_vectors(self):
+        """
+        :return: dict with objId as key and bool array (indexed by annotation index) as value, True if the gripper
+                 collided with ground or object
+        """
+        status = self.records['status']
+        return self.__flags_by_annotation_index((status == 1) | (status == 2))
+
+    def status_frequencies(self, statusNum=7):
+        """
+        :return: array with the number of grasps for each status code
+        """
+        return np.bincount(self.records['status'], minlength=statusNum)[:statusNum]
+
+
+# percentages of the highest ranked grasps of an object for which success rates are computed
+TOPK_PERCENTAGES = [10, 30, 50, 100]
+
+
+def topk_grasp_numbers(counts):
+    """
+    :param counts: array with the number of grasps of each object
+
+    :return: (4, n) array with the number of grasps in the top 10%, 30%, 50% and 100% of the n objects
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    return np.stack([
+        np.maximum((0.1 * counts).astype(np.int64), 1),
+        np.maximum(np.round(0.3 * counts).astype(np.int64), 1),
+        np.maximum(np.round(0.5 * counts).astype(np.int64), 1),
+        counts
+    ])
+
+
+def wilson_half_width(successNum, sampleNum, populationNum, z=1.96):
+    """
+    Half width of the Wilson score interval of a success rate estimated from a sample drawn without replacement,
+    including the finite population correction, i.e. it is 0 if the whole population has been sampled.
+
+    :param successNum: number of successes in the sample
+    :param sampleNum: size of the sample
+    :param populationNum: size of the population
+    :param z: quantile of the standard normal distribution for the confidence level (1.96 for 95%)
+
+    :return: half width of the confidence interval
+    """
+    if sampleNum == 0:
+        return 1.0
+    if sampleNum >= populationNum:
+        return 0.0
+    rate = successNum / sampleNum
+    halfWidth = z * np.sqrt(rate * (1 - rate) / sampleNum + z ** 2 / (4 * sampleNum ** 2)) / (1 + z ** 2 / sampleNum)
+    return halfWidth * np.sqrt((populationNum - sampleNum) / (populationNum - 1))
+
+
+def topk_success_rates(successVectors):
+    """
+    Computes the success rates of the top 10%, 30%, 50% and 100% grasps of each object, all objects at once.
+
+    :param successVectors: list of bool arrays (one per object, ordered by annotation index, i.e. by grasp rank)
+
+    :return: (4, n) array with top 10, top 30, top 50 and top 100 success rates of the n objects, nan for objects
+             without grasps
+    """
+    counts = np.array([len(successVector) for successVector in successVectors], dtype=np.int64)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+    cumulativeSuccess = np.concatenate([[0], np.cumsum(np.concatenate(
+        [np.asarray(successVector, dtype=bool) for successVector in successVectors] + [np.empty(0, dtype=bool)]))])
+    topNums = topk_grasp_numbers(counts)
+    rates = np.empty((4, len(counts)))
+    for i, topNum in enumerate(topNums):
+        stops = starts + np.minimum(topNum, counts)
+        with np.errstate(invalid='ignore'):
+            rates[i] = (cumulativeSuccess[stops] - cumulativeSuccess[starts]) / topNum
+    rates[:, counts == 0] = np.nan
+    return rates
+
+
+class LogWriter(object):
+    """
+    Collects simulation results and writes them to the csv log file in batches.
+    There should only be one writer per log file, i.e. results are sent from the workers to the main process
+    which then writes them. The results of each finished chunk should be flushed right away, so that an interrupted
+    run loses no finished results and can be resumed from the log file.
+    """
+    def __init__(self, logFile, batchSize=1000, append=False):
+        """
+        :param logFile: path to the csv log file, if None, results are not written at all
+        :param batchSize: number of buffered lines that triggers writing to the file
+        :param append: if False, the log file will be erased
+        """
+        self.batchSize = batchSize
+        self.buffer = []
+        # objIds in order of their first line written by this writer
+        self.objIds = {}
+        self.logFileHandle = None
+        if logFile is not None:
+            # the log file changes, so a results store of a previous run is outdated
+            remove_results_store(logFile)
+            self.logFileHandle = open(logFile, 'a' if append else 'w')
+
+    def add(self, objId, annotationIndex, status, annotation):
+        if self.logFileHandle is None:
+            return
+        if objId not in self.objIds:
+            self.objIds[objId] = None
+        self.buffer.append(format_log_line(objId, annotationIndex, status, annotation))
+        if len(self.buffer) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        if self.logFileHandle is None or not self.buffer:
+            return
+        self.logFileHandle.writelines(self.buffer)
+        self.logFileHandle.flush()
+        self.buffer = []
+
+    def close(self):
+        if self.logFileHandle is not None:
+            self.flush()
+            self.logFileHandle.close()
+            self.logFileHandle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
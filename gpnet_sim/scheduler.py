@@ -0,0 +1,311 @@
+import collections
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+
+import numpy as np
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:
+    # python < 3.8, task arguments are pickled instead
+    shared_memory = None
+
+# process:  each worker is a process of its own (default)
+# thread:   each worker is a thread of the calling process, which saves the memory of the processes. physics worlds
+#           use explicit physics clients, so several can be driven in one process
+BACKENDS = ['process', 'thread']
+
+# if no chunk size is given, the grasps of each worker are split into about this many chunks (for progress updates)
+CHUNKS_PER_WORKER = 20
+MAX_CHUNK_SIZE = 100
+
+# adaptive chunks are sized to take about this long in s, which makes the overhead of dispatching them negligible
+TARGET_CHUNK_DURATION = 1.0
+MAX_ADAPTIVE_CHUNK_SIZE = 10000
+# number of adaptive chunks submitted to a worker at a time, so it has the next chunk as soon as it finishes one
+CHUNKS_IN_FLIGHT = 2
+
+# shared arrays attached in this (worker) process, by name
+_attachedMemory = {}
+
+
+def plan_object_chunks(annotationCounts, workerNum, chunkSize=None):
+    """
+    Distributes the grasps of all objects to the workers, such that each worker processes the grasps of an object
+    consecutively and therefore only needs to load each object once.
+    Objects with more grasps than half the fair share of a worker are split into several pieces, which can be
+    distributed to different workers. The pieces are assigned largest first to the least loaded worker, so that all
+    workers get about the same number of grasps.
+
+    :param annotationCounts: list with the number of grasps for each object (index corresponds to objIndex)
+    :param workerNum: number of workers
+    :param chunkSize: maximum number of grasps per chunk, if None it is chosen automatically
+
+    :return: list with one entry per worker, each entry is a list of chunks (objIndex, start, stop), where start and
+             stop refer to the annotation indices of the object. All chunks of an object are consecutive.
+    """
+    totalCount = sum(annotationCounts)
+    plan = [[] for _ in range(workerNum)]
+    if totalCount == 0:
+        return plan
+
+    share = math.ceil(totalCount / workerNum)
+    # limiting the pieces to half the share leaves enough room for balancing
+    maxPieceSize = math.ceil(share / 2)
+    pieces = []
+    for objIndex, count in enumerate(annotationCounts):
+        pieceNum = math.ceil(count / maxPieceSize)
+        for i in range(pieceNum):
+            pieces.append((objIndex, i * count // pieceNum, (i + 1) * count // pieceNum))
+
+    # longest processing time first
+    pieces.sort(key=lambda piece: piece[2] - piece[1], reverse=True)
+    workerLoads = [0] * workerNum
+    workerPieces = [[] for _ in range(workerNum)]
+    for piece in pieces:
+        workerIndex = workerLoads.index(min(workerLoads))
+        workerPieces[workerIndex].append(piece)
+        workerLoads[workerIndex] += piece[2] - piece[1]
+
+    if chunkSize is None:
+        chunkSize = min(MAX_CHUNK_SIZE, max(1, math.ceil(share / CHUNKS_PER_WORKER)))
+
+    for workerIndex in range(workerNum):
+        # sorting groups the pieces by object and keeps the order of annotations
+        for objIndex, start, stop in sorted(workerPieces[workerIndex]):
+            for chunkStart in range(start, stop, chunkSize):
+                plan[workerIndex].append((objIndex, chunkStart, min(stop, chunkStart + chunkSize)))
+    return plan
+
+
+class ChunkSizer(object):
+    """
+    Chooses chunk sizes such that a chunk takes about targetDuration, based on the measured cost per item.
+    Starts with minSize and at most doubles the size from one chunk to the next, so that a few cheap items at the
+    start do not lead to a huge chunk.
+    """
+    def __init__(self, targetDuration=TARGET_CHUNK_DURATION, minSize=1, maxSize=MAX_ADAPTIVE_CHUNK_SIZE, smoothing=0.3):
+        """
+        :param smoothing: weight of the latest measurement in the exponential moving average of the cost per item
+        """
+        self.targetDuration = targetDuration
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.smoothing = smoothing
+        self.costPerItem = None
+        self.size = minSize
+
+    def next_size(self):
+        return self.size
+
+    def record(self, itemNum, duration):
+        """
+        :param itemNum: number of items of a finished chunk
+        :param duration: time in s it took to process the chunk
+        """
+        cost = duration / max(itemNum, 1)
+        if self.costPerItem is None:
+            self.costPerItem = cost
+        else:
+            self.costPerItem = (1 - self.smoothing) * self.costPerItem + self.smoothing * cost
+        targetSize = self.targetDuration / max(self.costPerItem, 1e-9)
+        self.size = int(min(max(min(targetSize, 2 * self.size), self.minSize), self.maxSize))
+
+
+class SharedArray(object):
+    """
+    Numpy array in shared memory. When pickled, only its name, shape and dtype are transferred, so tasks which
+    receive it attach to the memory instead of receiving a copy of the array.
+    The process which created it must close() it. A worker process keeps only the most recently attached array open,
+    i.e. tasks must not use a shared array after a newer one has been attached in their process, and tasks should
+    read a single shared array, as they would attach anew in every task otherwise.
+    """
+    def __init__(self, array):
+        array = np.ascontiguousarray(array)
+        self.shape = array.shape
+        self.dtype = array.dtype.str
+        self.memory = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        self.name = self.memory.name
+        self.array = np.ndarray(self.shape, self.dtype, buffer=self.memory.buf)
+        self.array[...] = array
+
+    def __getstate__(self):
+        return {'name': self.name, 'shape': self.shape, 'dtype': self.dtype}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.memory = None
+        self.array = None
+
+    def get(self, start, stop):
+        """
+        :return: copy of the rows start:stop of the array
+        """
+        if self.array is None:
+            if self.name not in _attachedMemory:
+                for memory in _attachedMemory.values():
+                    memory.close()
+                _attachedMemory.clear()
+                _attachedMemory[self.name] = shared_memory.SharedMemory(name=self.name)
+            array = np.ndarray(self.shape, self.dtype, buffer=_attachedMemory[self.name].buf)
+            # the copy makes sure that no view on the memory outlives the task
+            return np.array(array[start:stop])
+        return np.array(self.array[start:stop])
+
+    def close(self):
+        if self.memory is not None:
+            self.array = None
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+
+def _timed_call(fn, *args):
+    startTime = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - startTime
+
+
+class WorkerPool(object):
+    """
+    Pool of worker processes (or threads, see BACKENDS) in which each worker has its own task queue.
+    Tasks submitted to the same worker are executed in order of submission, so the state of a worker (e.g. the
+    object loaded in its physics world) can be exploited by the following tasks.
+    With a single worker, all tasks are executed in the calling process (e.g. for visualisation), unless inline is
+    False.
+    """
+    def __init__(self, workerNum, inline=None, backend='process'):
+        """
+        :param workerNum: number of workers
+        :param inline: if True, tasks are executed in the calling process, if None only for a single worker
+        :param backend: one of BACKENDS
+        """
+        assert backend in BACKENDS, f'unknown backend {backend}, use one of {BACKENDS}'
+        self.workerNum = workerNum
+        self.backend = backend
+        if inline is None:
+            inline = workerNum == 1
+        if not inline and backend == 'thread':
+            self.executors = [ThreadPoolExecutor(max_workers=1) for _ in range(workerNum)]
+        elif not inline:
+            if shared_memory is not None:
+                # workers share the resource tracker of this process, so shared arrays they attach to are not
+                # considered leaked by a tracker of their own when they exit
+                resource_tracker.ensure_running()
+            self.executors = [ProcessPoolExecutor(max_workers=1) for _ in range(workerNum)]
+        else:
+            self.executors = None
+
+    def submit(self, workerIndex, fn, *args, **kwargs):
+        """
+        Submits a task to the given worker.
+
+        :return: a concurrent.futures.Future of the task's result
+        """
+        if self.executors is not None:
+            return self.executors[workerIndex].submit(fn, *args, **kwargs)
+
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def run_on_all(self, fn, *args, **kwargs):
+        """
+        Executes a task once on every worker, e.g. to start the worker processes and import modules in advance.
+
+        :return: list of the results, one per worker
+        """
+        futures = [self.submit(workerIndex, fn, *args, **kwargs) for workerIndex in range(self.workerNum)]
+        return [future.result() for future in futures]
+
+    def map_unordered(self, tasks):
+        """
+        Executes all tasks and yields their results as soon as they are finished.
+
+        :param tasks: iterable of tuples (workerIndex, fn, args)
+        """
+        if self.executors is None:
+            # run lazily, so the caller can process each result before the next task is started
+            for _, fn, args in tasks:
+                yield fn(*args)
+            return
+
+        futures = [self.submit(workerIndex, fn, *args) for workerIndex, fn, args in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+    @property
+    def inline(self):
+        return self.executors is None
+
+    def map_adaptive(self, workerPieces, make_task, chunkSizer):
+        """
+        Executes the pieces of work of each worker in chunks whose size is adapted to the measured cost per item (see
+        ChunkSizer), and yields the results of the chunks as soon as they are finished.
+
+        :param workerPieces: list with one entry per worker, each a list of pieces (key, start, stop) which the worker
+                             processes in this order, e.g. from plan_object_chunks()
+        :param make_task: function(key, start, stop), returns fn and args of the task for the items start:stop of key
+        :param chunkSizer: ChunkSizer, is updated with the measured durations of the chunks
+        """
+        remaining = [collections.deque(pieces) for pieces in workerPieces]
+
+        def next_chunk(workerIndex):
+            pieces = remaining[workerIndex]
+            if not pieces:
+                return None
+            key, start, stop = pieces[0]
+            chunkStop = min(stop, start + chunkSizer.next_size())
+            if chunkStop == stop:
+                pieces.popleft()
+            else:
+                pieces[0] = (key, chunkStop, stop)
+            return key, start, chunkStop
+
+        if self.inline:
+            for workerIndex in range(len(remaining)):
+                chunk = next_chunk(workerIndex)
+                while chunk is not None:
+                    fn, args = make_task(*chunk)
+                    result, duration = _timed_call(fn, *args)
+                    chunkSizer.record(chunk[2] - chunk[1], duration)
+                    yield result
+                    chunk = next_chunk(workerIndex)
+            return
+
+        running = {}
+
+        def submit_next(workerIndex):
+            chunk = next_chunk(workerIndex)
+            if chunk is not None:
+                fn, args = make_task(*chunk)
+                future = self.executors[workerIndex].submit(_timed_call, fn, *args)
+                running[future] = (workerIndex, chunk[2] - chunk[1])
+
+        for workerIndex in range(len(remaining)):
+            for _ in range(CHUNKS_IN_FLIGHT):
+                submit_next(workerIndex)
+        while running:
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                workerIndex, itemNum = running.pop(future)
+                result, duration = future.result()
+                chunkSizer.record(itemNum, duration)
+                submit_next(workerIndex)
+                yield result
+
+    def shutdown(self):
+        if self.executors is not None:
+            for executor in self.executors:
+                executor.shutdown()
+            self.executors = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
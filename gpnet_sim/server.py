@@ -0,0 +1,265 @@
+import argparse
+import os
+import queue
+import signal
+import socketserver
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from attrdict import AttrDict
+
+from . import scheduler
+from .AutoGraspShapeCoreUtil import AutoGraspUtil
+from .client import decode_grasps, encode_results, receive_message, send_message
+from .simulator import _simulate_direct, default_conf, parser
+
+
+def _warm_up_worker():
+    """ runs in a worker process, unpickling this task already imports gpnet_sim (and thus pybullet) there """
+    return os.getpid()
+
+
+class SimulationServer(object):
+    """
+    Session for repeated direct simulations, e.g. within a training loop. Unlike simulate_direct(), which starts and
+    stops a pool of worker processes in every call, the server keeps its workers running between calls, and with them
+    the imported modules and the physics worlds of the previous call.
+    As fresh worlds would be discarded after each grasp, the server simulates with the reuse world mode instead, which
+    gives identical results. A persistent world mode in the config is kept.
+
+    Usage:
+        with SimulationServer(cfg) as server:
+            for shape, centers, quats in batches:
+                success, summary = server.simulate(shape, centers, quats)
+    """
+    def __init__(self, cfg=None, warmUp=True, inline=None):
+        """
+        :param cfg: config as for simulate_direct(), default_conf() if None. cfg.processNum workers are started
+        :param warmUp: if True, the worker processes are started (and modules imported) right away instead of in the
+                       first call
+        :param inline: see scheduler.WorkerPool, by default a single worker runs in this process
+        """
+        if cfg is None:
+            cfg = default_conf()
+        elif isinstance(cfg, argparse.Namespace):
+            cfg = AttrDict(vars(cfg))
+        self.cfg = cfg
+        self.worldMode = 'reuse' if cfg.worldMode == 'fresh' else cfg.worldMode
+        self.pool = scheduler.WorkerPool(cfg.processNum, inline, cfg.backend)
+        if warmUp:
+            self.pool.run_on_all(_warm_up_worker)
+
+    def simulate(self, shape, centers, quats, widths=None, resultCallback=None):
+        """
+        Simulates the grasps for one object with the warm workers, see simulate_direct().
+
+        :param shape: the object id
+        :param centers: np array with grasp centers
+        :param quats: np array with grasp quaternions
+        :param widths: np array with predicted gripper opening lengths in m, optional, see simulate_direct()
+        :param resultCallback: function(annotationIndices, statusList), called as soon as grasps are finished
+
+        :return: binary success array, dict with error types
+        """
+        if self.pool is None:
+            raise RuntimeError('the simulation server has been shut down')
+        return _simulate_direct(self.cfg, shape, centers, quats, widths, workerPool=self.pool,
+                                worldMode=self.worldMode, resultCallback=resultCallback)
+
+    def shutdown(self):
+        """
+        Disconnects the worlds kept in the workers and stops the worker processes.
+        """
+        if self.pool is not None:
+            try:
+                self.pool.run_on_all(AutoGraspUtil.closeKeptWorlds)
+            except BrokenProcessPool:
+                # workers have been terminated already, e.g. by ctrl+c, which interrupts the whole process group
+                pass
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+class _Request(object):
+    """ a simulate request waiting in the queue of the grasp evaluation server """
+    def __init__(self, handler, header, payload):
+        self.handler = handler
+        self.id = header.get('id')
+        self.shape = header['shape']
+        self.centers, self.quats, self.widths = decode_grasps(payload, header['count'], header.get('widths', False))
+        self.receiveTime = time.time()
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    """ reads the requests of one client connection, simulate requests are put into the queue of the server """
+    def setup(self):
+        # results of this connection's requests are sent from the dispatching thread
+        self.sendLock = threading.Lock()
+
+    def send(self, header, payload=b''):
+        with self.sendLock:
+            send_message(self.request, header, payload)
+
+    def handle(self):
+        service = self.server.service
+        while True:
+            try:
+                header, payload = receive_message(self.request)
+            except ConnectionError:
+                return
+            if header['type'] == 'simulate':
+                try:
+                    service.enqueue(_Request(self, header, payload))
+                except (KeyError, ValueError) as e:
+                    self.send({'type': 'error', 'id': header.get('id'), 'message': f'invalid request: {e}'})
+            elif header['type'] == 'stats':
+                self.send(dict(service.statistics(), type='stats'))
+            else:
+                self.send({'type': 'error', 'id': header.get('id'), 'message': f'unknown request {header["type"]}'})
+
+
+class GraspEvaluationService(object):
+    """
+    Serves simulate requests of out-of-process clients (see gpnet_sim.client) on a unix domain socket or a localhost
+    port. Connections are read in their own threads, requests of all clients are queued and run one after the other
+    on a SimulationServer, i.e. on the same warm worker processes, and results are streamed back as they finish.
+    """
+    def __init__(self, cfg, socketPath=None, port=None):
+        """
+        :param cfg: config as for SimulationServer
+        :param socketPath: path of the unix domain socket, if None, the service listens on localhost:port
+        :param port: tcp port
+        """
+        assert (socketPath is None) != (port is None), 'either a socket path or a port must be given'
+        self.socketPath = socketPath
+        if socketPath is not None:
+            if os.path.exists(socketPath):
+                os.remove(socketPath)
+            self.socketServer = socketserver.ThreadingUnixStreamServer(socketPath, _RequestHandler)
+        else:
+            socketserver.ThreadingTCPServer.allow_reuse_address = True
+            self.socketServer = socketserver.ThreadingTCPServer(('127.0.0.1', port), _RequestHandler)
+        self.socketServer.daemon_threads = True
+        self.socketServer.service = self
+        self.simulationServer = SimulationServer(cfg)
+        self.requests = queue.Queue()
+        self.statisticsLock = threading.Lock()
+        self.stats = {'queue depth': 0, 'max queue depth': 0, 'received': 0, 'completed': 0, 'failed': 0,
+                      'grasps': 0, 'total wait': 0.0, 'max wait': 0.0, 'total latency': 0.0, 'max latency': 0.0}
+
+    def enqueue(self, request):
+        with self.statisticsLock:
+            self.requests.put(request)
+            self.stats['received'] += 1
+            self.stats['queue depth'] = self.requests.qsize()
+            self.stats['max queue depth'] = max(self.stats['max queue depth'], self.stats['queue depth'])
+
+    def statistics(self):
+        """
+        :return: dict with queue depth and numbers of requests, see gpnet_sim.client.SimulationClient.statistics()
+        """
+        with self.statisticsLock:
+            stats = dict(self.stats)
+        finishedNum = stats['completed'] + stats['failed']
+        stats['mean wait'] = stats.pop('total wait') / finishedNum if finishedNum > 0 else 0.0
+        stats['mean latency'] = stats.pop('total latency') / finishedNum if finishedNum > 0 else 0.0
+        return stats
+
+    def __process(self, request):
+        wait = time.time() - request.receiveTime
+        with self.statisticsLock:
+            self.stats['queue depth'] = self.requests.qsize()
+        reply = None
+        try:
+            sim_success, summary = self.simulationServer.simulate(
+                request.shape, request.centers, request.quats, request.widths,
+                resultCallback=lambda annotationIndices, statusList: request.handler.send(
+                    {'type': 'results', 'id': request.id, 'count': len(annotationIndices)},
+                    encode_results(annotationIndices, statusList)))
+            outcome = 'completed'
+            reply = {'type': 'done', 'id': request.id, 'summary': {key: int(value) for key, value in summary.items()}}
+        except OSError:
+            # the client has disconnected
+            outcome = 'failed'
+        except Exception as e:
+            outcome = 'failed'
+            reply = {'type': 'error', 'id': request.id, 'message': repr(e)}
+        latency = time.time() - request.receiveTime
+
+        # statistics are updated before the reply, so the client sees its request in them
+        with self.statisticsLock:
+            self.stats[outcome] += 1
+            if outcome == 'completed':
+                self.stats['grasps'] += len(request.centers)
+            self.stats['total wait'] += wait
+            self.stats['max wait'] = max(self.stats['max wait'], wait)
+            self.stats['total latency'] += latency
+            self.stats['max latency'] = max(self.stats['max latency'], latency)
+        print(f'request {request.id} ({request.shape}, {len(request.centers)} grasps) {outcome}: '
+              f'waited {wait:.3f} s, latency {latency:.3f} s, queue depth {self.requests.qsize()}')
+        if reply is not None:
+            if reply['type'] == 'done':
+                reply.update(wait=wait, latency=latency)
+            try:
+                request.handler.send(reply)
+            except OSError:
+                pass
+
+    def serve_forever(self):
+        """
+        Serves until interrupted (ctrl+c or SIGTERM), then shuts down.
+        """
+        listener = threading.Thread(target=self.socketServer.serve_forever, daemon=True)
+        listener.start()
+        print(f'serving on {self.socketPath or self.socketServer.server_address}')
+        try:
+            while True:
+                # a timeout keeps the main thread responsive to signals
+                try:
+                    request = self.requests.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                self.__process(request)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self.socketServer.shutdown()
+        self.socketServer.server_close()
+        if self.socketPath is not None and os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+        self.simulationServer.shutdown()
+
+
+def serve_parser():
+    serveParser = parser()
+    serveParser.prog = 'python -m gpnet_sim serve'
+    serveParser.description = 'grasp evaluation server, the simulation options apply to all requests'
+    serveGroup = serveParser.add_mutually_exclusive_group(required=True)
+    serveGroup.add_argument('--socket', type=str, metavar='PATH', help='unix domain socket to listen on')
+    serveGroup.add_argument('--port', type=int, metavar='N', help='localhost port to listen on')
+    return serveParser
+
+
+def serve(args=None):
+    """
+    Entry point of python -m gpnet_sim serve.
+
+    :param args: list of command line arguments following serve
+    """
+    cfg = AttrDict(vars(serve_parser().parse_args(args)))
+
+    def terminate(signalNumber, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, terminate)
+    GraspEvaluationService(cfg, socketPath=cfg.socket, port=cfg.port).serve_forever()
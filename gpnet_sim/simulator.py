@@ -2,10 +2,17 @@ import argparse
 import os
 import numpy as np
 import quaternion
-import tempfile
 from attrdict import AttrDict
 
 from . import AutoGraspShapeCoreUtil
+from .AutoGraspSimpleShapeCore import CLOSING_MODES, DEFAULT_CLOSING_SPEED, DEFAULT_WIDTH_MARGIN, PHYSICS_PROFILES, \
+    WORLD_MODES
+from .assets import ASSET_KINDS, DEFAULT_ASSET_ROOT, asset_mesh_root
+from .cache import DEFAULT_MAX_SIZE, DEFAULT_POSE_TOLERANCE
+from .meshes import DEFAULT_MESH_MEMORY_BUDGET
+from .prescreen import DEFAULT_DUPLICATE_ANGLE_TOLERANCE, DEFAULT_DUPLICATE_POSITION_TOLERANCE, PRESCREEN_MODES
+from .results import TOPK_PERCENTAGES, load_results
+from .scheduler import BACKENDS
 
 
 def parser():
@@ -14,6 +21,8 @@ def parser():
                         default=os.path.join(os.path.dirname(__file__), '../gpnet_data/prediction/nms_poses_view0.txt'),
                         type=str, metavar='FILE', help='testFile path')
     parser.add_argument('-p', '--processNum', default=10, type=int, metavar='N', help='process num using')
+    parser.add_argument('--backend', default='process', choices=BACKENDS,
+                        help='whether the processNum workers are processes or threads of one process')
     parser.add_argument('-w', "--width", action="store_true", dest="width", default=False,
                         help="turn on this param if test file contains width.")
     parser.add_argument('--gripperFile',
@@ -21,6 +30,18 @@ def parser():
                         type=str, metavar='FILE', help='gripper file')
     parser.add_argument('--objMeshRoot', default=os.path.join(os.path.dirname(__file__), '../gpnet_data/urdf'),
                         type=str, metavar='PATH', help='obj mesh path')
+    parser.add_argument('--collisionAssets', default=None, choices=ASSET_KINDS,
+                        help='simulate with these collision assets of the objects instead of the original meshes, ' +
+                             'see python -m gpnet_sim preprocess')
+    parser.add_argument('--assetRoot', default=DEFAULT_ASSET_ROOT, type=str, metavar='PATH',
+                        help='directory of the collision assets')
+    parser.add_argument('--meshRegistry', action='store_true',
+                        help='create objects from convex collision shapes of their parts kept per world instead of ' +
+                             'loading their urdf for every grasp, only faster for objects with few parts (e.g. ' +
+                             '--collisionAssets convex) and may change the outcome of a few grasps')
+    parser.add_argument('--meshMemoryBudget', default=DEFAULT_MESH_MEMORY_BUDGET, type=float, metavar='MB',
+                        help='memory of the vertices of the collision shapes of a kept world, beyond which ' +
+                             'it is rebuilt')
     parser.add_argument('-v', '--visual', default=False, type=bool, metavar='VIS',
                         help='switch for visual inspection of grasps (processNum will be overridden)')
     parser.add_argument('-d', '--dir', default=None, type=str, metavar='PATH',
@@ -29,6 +50,61 @@ def parser():
     parser.add_argument('-z', '--z_move', default=False, type=bool,
                         help='if True, all grasp centers will be moved -15mm in their respective z-direction')
     parser.add_argument('--verbose', action='store_true', help='prints some output on console')
+    parser.add_argument('--worldMode', default='fresh', choices=WORLD_MODES,
+                        help='fresh: new physics world for every grasp; reuse: keep one world per worker and reload ' +
+                             'gripper and object only (identical results); persistent: also keep gripper and object ' +
+                             'and reset their states only (fastest, outcome of some unstable grasps may differ)')
+    parser.add_argument('--resultsStore', action='store_true',
+                        help='additionally write the results to a binary store next to the log file (.npy/.json), ' +
+                             'which is much faster to read than the csv log file')
+    parser.add_argument('--groundPrescreen', default='off', choices=PRESCREEN_MODES,
+                        help='on: grasps for which the gripper penetrates the ground are detected analytically and ' +
+                             'not simulated; validate: simulate all grasps and report agreement of the pre-screen')
+    parser.add_argument('--collisionScreen', default='off', choices=PRESCREEN_MODES,
+                        help='on: check grasps for collisions with ground and object in a static world per object ' +
+                             'first and only simulate the others; validate: simulate all grasps and report agreement')
+    parser.add_argument('--fastControl', action='store_true',
+                        help='solve inverse kinematics once per gripper width instead of in every simulation step ' +
+                             'and drive all joints with one call per step (faster, outcome of some unstable grasps ' +
+                             'may differ)')
+    parser.add_argument('--closingMode', default='stepwise', choices=CLOSING_MODES,
+                        help='stepwise: close the gripper in steps of 1 mm and wait for the fingers to rest after ' +
+                             'each step; continuous: close with constant speed and check contact in every ' +
+                             'simulation step')
+    parser.add_argument('--closingSpeed', default=DEFAULT_CLOSING_SPEED, type=float, metavar='M/S',
+                        help='speed of the fingers for the continuous closing mode')
+    parser.add_argument('--widthWarmStart', action='store_true',
+                        help='close the gripper directly to the predicted width plus a safety margin before the ' +
+                             'fine-grained closing starts (requires --width)')
+    parser.add_argument('--widthMargin', default=DEFAULT_WIDTH_MARGIN, type=float, metavar='M',
+                        help='safety margin added to the predicted width for the warm start')
+    parser.add_argument('--physicsProfile', default='reference', choices=list(PHYSICS_PROFILES.keys()),
+                        help='time step, solver iterations and loop thresholds of the simulation; reference: ' +
+                             'original settings; fast/fastest: less accurate but faster, ' +
+                             'see examples/validate_physics_profile.py')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue an interrupted run: keep the log file and only simulate the grasps which are ' +
+                             'missing in it')
+    parser.add_argument('--outcomeCache', default=None, type=str, metavar='FILE',
+                        help='SQLite file caching simulated grasp outcomes across runs, grasps found in it are not ' +
+                             'simulated')
+    parser.add_argument('--cacheTolerance', default=DEFAULT_POSE_TOLERANCE, type=float, metavar='TOL',
+                        help='grasp poses are quantised to this tolerance for the outcome cache')
+    parser.add_argument('--cacheMaxSize', default=DEFAULT_MAX_SIZE, type=float, metavar='MB',
+                        help='maximum size of the outcome cache in megabytes, least recently used entries are evicted')
+    parser.add_argument('--collapseDuplicates', action='store_true',
+                        help='simulate only the highest ranked grasp of each cluster of near-duplicate grasps and ' +
+                             'assign its outcome to the whole cluster')
+    parser.add_argument('--duplicatePositionTolerance', default=DEFAULT_DUPLICATE_POSITION_TOLERANCE, type=float,
+                        metavar='M', help='maximum distance of near-duplicate grasps')
+    parser.add_argument('--duplicateAngleTolerance', default=DEFAULT_DUPLICATE_ANGLE_TOLERANCE, type=float,
+                        metavar='DEG', help='maximum rotation angle between near-duplicate grasps')
+    parser.add_argument('--topK', nargs='+', default=None, type=int, choices=TOPK_PERCENTAGES, metavar='K',
+                        help='only compute the top k%% success rates for these k (of 10 30 50 100) and only simulate ' +
+                             'the grasps needed for them, the other rates are reported as nan')
+    parser.add_argument('--confidenceHalfWidth', default=None, type=float, metavar='W',
+                        help='simulate the grasps of each object in random order and stop as soon as the 95%% ' +
+                             'confidence intervals of its top k%% success rates are narrower than +- W')
 
     return parser
 
@@ -41,51 +117,65 @@ def default_conf():
     return AttrDict(vars(parser().parse_args([])))
 
 
-def getObjStatusAndAnnotation(testFile, haveWidth=False):
+def getObjStatusAndAnnotation(testFile, haveWidth=False, returnWidth=False):
+    """
+    Parses a file with grasp predictions, see readme for the format.
+    The file is scanned once to find the object lines, then all grasp lines are converted to numbers at once.
+
+    :param testFile: path to the file
+    :param haveWidth: if True, each grasp line starts with the predicted width, followed by position and quaternion.
+                      The width is given relative to the maximum gripper opening of 0.085 m
+    :param returnWidth: if True, a dict with the predicted gripper opening lengths in m is returned as well (the
+                        widths scaled to the gripper and capped at its maximum opening, zeros if haveWidth is False)
+
+    :return: quaternionDict, centerDict (objId as key and (n, 4) w, x, y, z / (n, 3) arrays as value), objIdList,
+             and widthDict (objId as key and (n,) array as value) if returnWidth is True
+    """
     with open(testFile, 'r') as testData:
         lines = testData.readlines()
-        objIdList = []
-        quaternionDict = {}
-        centerDict = {}
-        # 0: scaling    1~3: position   4~7: orientation    8: staticFrictionCoeff
-        objId = 'invalid'
-        objCounter = -1
-        annotationCounter = -1
-        for line in lines:
-            # new object
-            msg = line.strip()
-            if len(msg.split(',')) < 2:
-                objId = msg.strip()
-                # skip invalid
-                # begin
-                objCounter += 1
-                objIdList.append(objId)
-                quaternionDict[objId] = np.empty(shape=(0, 4), dtype=float)
-                centerDict[objId] = np.empty(shape=(0, 3), dtype=float)
-                annotationCounter = -1
-            # read annotation
-            else:
-                # skip invalid object
-                if objId == 'invalid':
-                    continue
-                # begin
-                annotationCounter += 1
-                pose = msg.split(',')
-                # print(objId, annotationCounter)
-                if haveWidth:
-                    length = float(pose[0]) * 0.085  # arbitrary value, will not be used in AutoGrasp
-                    length = length if length < 0.085 else 0.085
-                    position = np.array([float(pose[1]), float(pose[2]), float(pose[3])])
-                    quaternion = np.array([float(pose[4]), float(pose[5]), float(pose[6]), float(pose[7])])
-                    # quaternion = quaternion[[1, 2, 3, 0]]
-                else:
-                    length = 0.000  # arbitrary value, will not be used in AutoGrasp
-                    position = np.array([float(pose[0]), float(pose[1]), float(pose[2])])
-                    quaternion = np.array([float(pose[3]), float(pose[4]), float(pose[5]), float(pose[6])])
-                    # quaternion = quaternion[[1, 2, 3, 0]]
-                # print(objCounter, annotationCounter)
-                quaternionDict[objId] = np.concatenate((quaternionDict[objId], quaternion[None, :]), axis=0)
-                centerDict[objId] = np.concatenate((centerDict[objId], position[None, :]), axis=0)
+
+    objIdList = []
+    objBlocks = []  # objId, first and last+1 grasp line
+    graspLines = []
+    objId = 'invalid'
+    for line in lines:
+        msg = line.strip()
+        # new object
+        if ',' not in msg:
+            objId = msg
+            objIdList.append(objId)
+            objBlocks.append([objId, len(graspLines), len(graspLines)])
+        # skip grasps of invalid object
+        elif objId != 'invalid':
+            graspLines.append(msg)
+            objBlocks[-1][2] = len(graspLines)
+
+    # 0: width (optional)    1~3: position   4~7: orientation
+    columnNum = 8 if haveWidth else 7
+    grasps = np.empty(shape=(len(graspLines), columnNum), dtype=float)
+    if graspLines:
+        fieldNum = graspLines[0].count(',') + 1
+        if any(line.count(',') + 1 != fieldNum for line in graspLines):
+            # lines have different numbers of values, only keep the ones we need
+            fieldNum = columnNum
+            graspLines = [','.join(line.split(',')[:columnNum]) for line in graspLines]
+        values = np.fromstring(','.join(graspLines), dtype=float, sep=',')
+        if len(values) != len(graspLines) * fieldNum or fieldNum < columnNum:
+            raise ValueError(f'could not parse grasps in {testFile}, expected {columnNum} values per line')
+        grasps[:] = values.reshape(-1, fieldNum)[:, :columnNum]
+
+    widths = np.minimum(grasps[:, 0] * 0.085, 0.085) if haveWidth else np.zeros(len(grasps))
+    centers = grasps[:, -7:-4]
+    quaternions = grasps[:, -4:]
+    quaternionDict = {}
+    centerDict = {}
+    widthDict = {}
+    for objId, start, stop in objBlocks:
+        quaternionDict[objId] = np.ascontiguousarray(quaternions[start:stop])
+        centerDict[objId] = np.ascontiguousarray(centers[start:stop])
+        widthDict[objId] = widths[start:stop].copy()
+    if returnWidth:
+        return quaternionDict, centerDict, objIdList, widthDict
     return quaternionDict, centerDict, objIdList
 
 
@@ -129,7 +219,6 @@ def simulate(cfg):
         for key, value in cfg.items():
             print(f'\t{key}:\t{value}')
 
-    objMeshRoot = cfg.objMeshRoot
     processNum = cfg.processNum
     gripperFile = cfg.gripperFile
     haveWidth = cfg.width
@@ -152,13 +241,14 @@ def simulate(cfg):
         if cfg.verbose:
             print('parsing test file: ', testInfoFile)
         logFile = testInfoFile[:-4] + '_log.csv'
-        quaternionDict, centerDict, objIdList = getObjStatusAndAnnotation(testInfoFile, haveWidth)
+        quaternionDict, centerDict, objIdList, widthDict = getObjStatusAndAnnotation(testInfoFile, haveWidth,
+                                                                                     returnWidth=True)
+        objMeshRoot = asset_mesh_root(cfg, objIdList)
 
         # print(f'objects: {objIdList}')
         # print(f'quaternions: {quaternionDict}')
         # print(f'centers: {centerDict}')
 
-        open(logFile, 'w').close()
         simulator = AutoGraspShapeCoreUtil.AutoGraspUtil()
 
         for objId in objIdList:
@@ -170,7 +260,8 @@ def simulate(cfg):
             simulator.addObject2(
                 objId=objId,
                 quaternion=q,
-                translation=c
+                translation=c,
+                width=widthDict[objId] if haveWidth else None
             )
 
         simulator.parallelSimulation(
@@ -178,11 +269,39 @@ def simulate(cfg):
             objMeshRoot=objMeshRoot,
             processNum=processNum,
             gripperFile=gripperFile,
-            visual=visual
+            visual=visual,
+            worldMode=cfg.worldMode,
+            resultsStore=cfg.resultsStore,
+            groundPrescreen=cfg.groundPrescreen,
+            collisionScreen=cfg.collisionScreen,
+            fastControl=cfg.fastControl,
+            closingMode=cfg.closingMode,
+            closingSpeed=cfg.closingSpeed,
+            widthWarmStart=cfg.widthWarmStart,
+            widthMargin=cfg.widthMargin,
+            physicsProfile=cfg.physicsProfile,
+            resume=cfg.resume,
+            outcomeCache=cfg.outcomeCache,
+            cacheTolerance=cfg.cacheTolerance,
+            cacheMaxSize=cfg.cacheMaxSize,
+            collapseDuplicates=cfg.collapseDuplicates,
+            duplicatePositionTolerance=cfg.duplicatePositionTolerance,
+            duplicateAngleTolerance=cfg.duplicateAngleTolerance,
+            topK=cfg.topK,
+            confidenceHalfWidth=cfg.confidenceHalfWidth,
+            backend=cfg.backend,
+            meshRegistry=cfg.meshRegistry,
+            meshMemoryBudget=cfg.meshMemoryBudget
         )
 
-        annotationSuccessDict = simulator.getSuccessData(logFile=logFile)
-        top10, top30, top50, top100 = simulator.getStatistic(annotationSuccessDict)
+        # read the results only once for all statistics
+        results = load_results(logFile)
+        annotationSuccessDict = simulator.getSuccessData(logFile=results)
+        if cfg.topK is None and cfg.confidenceHalfWidth is None:
+            top10, top30, top50, top100 = simulator.getStatistic(annotationSuccessDict)
+        else:
+            # not all grasps have been simulated, so the rates are only known to the simulator
+            top10, top30, top50, top100 = simulator.topkSuccessRates.mean(axis=1)
 
         if cfg.verbose:
             print('results per object:')
@@ -192,7 +311,7 @@ def simulate(cfg):
             print('overall success rates:')
             print('\ttop10:\t', top10, '\n\ttop30:\t', top30, '\n\ttop50:\t', top50, '\n\ttop100:\t', top100)
 
-        details, summary = simulator.get_simulation_summary(logFile)
+        details, summary = simulator.get_simulation_summary(results)
         if cfg.verbose:
             print('absolute numbers by outcome:')
             for key, value in summary.items():
@@ -215,16 +334,17 @@ def simulate(cfg):
         return top10, top30, top50, top100
 
 
-def simulate_direct(cfg, shape, centers, quats):
+def simulate_direct(cfg, shape, centers, quats, widths=None):
     """
     This is a direct simulation method that does not require writing things into a file.
-    It does not produce a log file (although a temporary file is used) and is only capable of processing grasps
-    for one specific object.
+    It does not produce a log file and is only capable of processing grasps for one specific object.
 
     :param cfg: a config file as in simulate method, except some attributes are not used
     :param shape: the object id
     :param centers: np array with grasp centers
     :param quats: np array with grasp quaternions
+    :param widths: np array with predicted gripper opening lengths in m, i.e. widths of a prediction file scaled by
+                   0.085 (see getObjStatusAndAnnotation()), optional (used with cfg.widthWarmStart)
 
     :return: binary success array, dict with error types
     """
@@ -233,15 +353,21 @@ def simulate_direct(cfg, shape, centers, quats):
         cfg = AttrDict(vars(cfg))
     for key, value in cfg.items():
         print(f'\t{key}:\t{value}')
+    return _simulate_direct(cfg, shape, centers, quats, widths)
+
 
-    objMeshRoot = cfg.objMeshRoot
+def _simulate_direct(cfg, shape, centers, quats, widths=None, workerPool=None, worldMode=None, resultCallback=None):
+    """
+    simulate_direct() without printing the config, optionally with an existing scheduler.WorkerPool (see
+    gpnet_sim.server.SimulationServer)
+
+    :param worldMode: overrides cfg.worldMode if given
+    :param resultCallback: function(annotationIndices, statusList), called as soon as grasps are finished
+    """
+    objMeshRoot = asset_mesh_root(cfg, [shape])
     processNum = cfg.processNum
     gripperFile = cfg.gripperFile
 
-    # this creates a logfile in the tmp dir of the operating system
-    logFileHandle, logFile = tempfile.mkstemp(suffix='.log', text=True)
-
-    open(logFile, 'w').close()
     simulator = AutoGraspShapeCoreUtil.AutoGraspUtil()
 
     if cfg.z_move:
@@ -250,20 +376,40 @@ def simulate_direct(cfg, shape, centers, quats):
     simulator.addObject2(
         objId=shape,
         quaternion=quats,
-        translation=centers
+        translation=centers,
+        width=widths
     )
 
-    simulator.parallelSimulation(
-        logFile=logFile,
+    statusDict = simulator.parallelSimulation(
+        logFile=None,
         objMeshRoot=objMeshRoot,
         processNum=processNum,
-        gripperFile=gripperFile
+        gripperFile=gripperFile,
+        worldMode=worldMode or cfg.worldMode,
+        groundPrescreen=cfg.groundPrescreen,
+        collisionScreen=cfg.collisionScreen,
+        fastControl=cfg.fastControl,
+        closingMode=cfg.closingMode,
+        closingSpeed=cfg.closingSpeed,
+        widthWarmStart=cfg.widthWarmStart,
+        widthMargin=cfg.widthMargin,
+        physicsProfile=cfg.physicsProfile,
+        outcomeCache=cfg.outcomeCache,
+        cacheTolerance=cfg.cacheTolerance,
+        cacheMaxSize=cfg.cacheMaxSize,
+        collapseDuplicates=cfg.collapseDuplicates,
+        duplicatePositionTolerance=cfg.duplicatePositionTolerance,
+        duplicateAngleTolerance=cfg.duplicateAngleTolerance,
+        backend=cfg.backend,
+        meshRegistry=cfg.meshRegistry,
+        meshMemoryBudget=cfg.meshMemoryBudget,
+        workerPool=workerPool,
+        resultCallback=None if resultCallback is None else
+        lambda objId, annotationIndices, statusList: resultCallback(annotationIndices, statusList)
     )
 
-    result_dict = AutoGraspShapeCoreUtil.read_sim_csv_file(logFile, initial_array_size=len(centers))
-    grasps = result_dict[shape]
-    sim_outcome = grasps[:, 8]
-    sim_success = grasps[:, 9]
+    sim_outcome = statusDict[shape]
+    sim_success = (sim_outcome == 0).astype(float)
 
     if cfg.verbose:
         print('simulation results for shape', shape)
@@ -279,9 +425,6 @@ def simulate_direct(cfg, shape, centers, quats):
         for key, value in summary.items():
             print(f'\t{key}: {value}')
 
-    os.close(logFileHandle)
-    os.remove(logFile)
-
     return sim_success, summary
 
 
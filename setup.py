@@ -12,8 +12,7 @@ requirements_default = [
     'numpy-quaternion',  # numpy integration for quaternions
     'tqdm',  # progress bars
     'pybullet',  # for the simulation module
-    'attrdict',
-    'joblib'
+    'attrdict'
 ]
 
 setuptools.setup(
@@ -21,7 +20,7 @@ setuptools.setup(
     version='0.1',
     python_requires=python_versions,
     install_requires=requirements_default,
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['benchmarks', 'benchmarks.*']),
     url='',
     license='',
     author='GPNet authors: Chaozheng Wu, Jian Chen, Qiaoyu Cao, Jianchi Zhang, Yunxin Tai, Lin Sun, and Kui Jia;' +
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from gpnet_sim.simulator import getObjStatusAndAnnotation
+
+PROJECT_DIR = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(PROJECT_DIR, 'examples'))
+from benchmark_parser import legacy_parser, write_test_file  # noqa: E402
+
+
+def assert_same_grasps(new_result, old_result):
+    new_quaternions, new_centers, new_obj_ids = new_result[:3]
+    old_quaternions, old_centers, old_obj_ids = old_result
+    assert new_obj_ids == old_obj_ids
+    for obj_id in old_obj_ids:
+        assert np.array_equal(new_quaternions[obj_id], old_quaternions[obj_id])
+        assert np.array_equal(new_centers[obj_id], old_centers[obj_id])
+
+
+def test_parser_matches_legacy_parser_on_bundled_predictions():
+    test_file = os.path.join(PROJECT_DIR, 'gpnet_data/prediction/nms_poses_view0.txt')
+    assert_same_grasps(getObjStatusAndAnnotation(test_file), legacy_parser(test_file))
+
+
+@pytest.mark.parametrize('have_width', [False, True])
+def test_parser_matches_legacy_parser_on_generated_predictions(tmp_path, have_width):
+    test_file = str(tmp_path / 'predictions.txt')
+    write_test_file(test_file, 4, 50, have_width)
+    assert_same_grasps(getObjStatusAndAnnotation(test_file, have_width), legacy_parser(test_file, have_width))
+
+
+def test_parser_scales_and_caps_widths(tmp_path):
+    test_file = tmp_path / 'predictions.txt'
+    test_file.write_text('box\n0.5,0,0,0,1,0,0,0\n2.0,0,0,0,1,0,0,0\nempty\n')
+    quaternions, centers, obj_ids, widths = getObjStatusAndAnnotation(str(test_file), haveWidth=True, returnWidth=True)
+    assert obj_ids == ['box', 'empty']
+    assert np.allclose(widths['box'], [0.0425, 0.085])
+    assert quaternions['empty'].shape == (0, 4) and centers['empty'].shape == (0, 3)
+
+
+def test_parser_rejects_short_lines(tmp_path):
+    test_file = tmp_path / 'predictions.txt'
+    test_file.write_text('box\n0,0,0,1,0,0\n')
+    with pytest.raises(ValueError):
+        getObjStatusAndAnnotation(str(test_file))
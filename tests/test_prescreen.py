@@ -0,0 +1,45 @@
+import numpy as np
+
+from gpnet_sim.prescreen import cluster_near_duplicates
+
+
+def annotation(position, axis_angle_degrees, axis=(0, 0, 1), length=0.05):
+    """ annotation (length, position x y z, quaternion x y z w) of a rotation about axis """
+    half_angle = np.deg2rad(axis_angle_degrees) / 2
+    return [length, *position, *(np.sin(half_angle) * np.asarray(axis, dtype=float)), np.cos(half_angle)]
+
+
+def test_clusters_within_position_and_angle_tolerance():
+    annotations = np.array([
+        annotation([0, 0, 0], 0),
+        annotation([0.0005, 0, 0], 1),      # close to 0
+        annotation([0.002, 0, 0], 0),       # too far from 0
+        annotation([0, 0, 0], 5),           # rotated too much
+        annotation([0.0025, 0, 0], 0.5),    # close to 2, which represents it although 0 comes first
+    ])
+    representatives = cluster_near_duplicates(annotations, 0.001, 2.0)
+    assert representatives.tolist() == [0, 0, 2, 3, 2]
+
+
+def test_opposite_quaternions_are_the_same_orientation():
+    first = annotation([0, 0, 0], 30)
+    second = list(first)
+    second[4:8] = [-value for value in first[4:8]]
+    assert cluster_near_duplicates(np.array([first, second]), 0.001, 2.0).tolist() == [0, 0]
+
+
+def test_higher_ranked_grasp_represents_its_cluster():
+    rng = np.random.default_rng(0)
+    annotations = np.array([annotation(rng.uniform(-0.05, 0.05, 3), rng.uniform(0, 360)) for _ in range(200)])
+    annotations = np.concatenate([annotations, annotations + [0, 1e-4, 0, 0, 0, 0, 0, 0]])
+    representatives = cluster_near_duplicates(annotations, 0.001, 2.0)
+    assert np.all(representatives <= np.arange(len(annotations)))
+    # representatives represent themselves
+    assert np.all(representatives[representatives] == representatives)
+    assert np.array_equal(representatives[200:], representatives[:200])
+
+
+def test_zero_tolerance_keeps_distinct_grasps():
+    annotations = np.array([annotation([i * 0.01, 0, 0], 0) for i in range(5)])
+    assert cluster_near_duplicates(annotations, 0.0, 0.0).tolist() == list(range(5))
+    assert cluster_near_duplicates(np.empty((0, 8)), 0.001, 2.0).tolist() == []
@@ -0,0 +1,164 @@
+import os
+
+import numpy as np
+import pytest
+
+from gpnet_sim.results import LogWriter, SimulationResults, find_results_store, format_log_line, \
+    load_completed_results, load_results, topk_grasp_numbers, topk_success_rates, wilson_half_width, \
+    write_results_store
+
+
+@pytest.fixture
+def simulated_log(tmp_path):
+    """
+    Writes a log file as a simulation run does, with chunks finishing out of order and an object without simulated
+    grasps.
+
+    :return: log file, statusDict, annotationDict and the objIds in order of their first line
+    """
+    rng = np.random.default_rng(0)
+    status_dict = {
+        'first': np.array([0, 3, 0, -1, 5, 0]),
+        'second': np.array([1, 0, 6, 2]),
+        'unsimulated': np.array([-1, -1])
+    }
+    annotation_dict = {obj_id: rng.uniform(-1, 1, size=(len(status), 8)) for obj_id, status in status_dict.items()}
+    log_file = str(tmp_path / 'predictions_log.csv')
+    chunks = [('second', [2, 3]), ('first', [4, 5]), ('second', [0, 1]), ('first', [0, 1, 2])]
+    with LogWriter(log_file) as writer:
+        for obj_id, annotation_indices in chunks:
+            for i in annotation_indices:
+                writer.add(obj_id, i, status_dict[obj_id][i], annotation_dict[obj_id][i])
+            writer.flush()
+    return log_file, status_dict, annotation_dict, list(writer.objIds)
+
+
+def test_csv_and_store_give_the_same_results(simulated_log):
+    log_file, status_dict, annotation_dict, obj_ids = simulated_log
+    from_csv = SimulationResults.from_csv(log_file)
+    write_results_store(log_file, obj_ids, status_dict, annotation_dict)
+    from_store = SimulationResults.load_store(log_file)
+
+    assert from_csv.objIdList == from_store.objIdList == ['second', 'first']
+    assert from_csv.offsets == from_store.offsets
+    assert np.array_equal(from_csv.records, from_store.records)
+    for obj_id, records in from_store.items():
+        simulated = np.flatnonzero(status_dict[obj_id] >= 0)
+        assert np.array_equal(records['annotationIndex'], simulated)
+        assert np.array_equal(records['status'], status_dict[obj_id][simulated])
+        assert np.array_equal(records['annotation'], annotation_dict[obj_id][simulated])
+    assert 'unsimulated' not in from_store
+
+
+def test_load_results_prefers_an_up_to_date_store(simulated_log):
+    log_file, status_dict, annotation_dict, obj_ids = simulated_log
+    assert find_results_store(log_file) is None
+    write_results_store(log_file, obj_ids, status_dict, annotation_dict)
+    records_file = find_results_store(log_file)
+    assert records_file is not None
+    assert isinstance(load_results(log_file).records, np.memmap)
+
+    # a log file which changed after the store was written is read instead of the outdated store
+    os.utime(log_file, (os.path.getmtime(records_file) + 10, os.path.getmtime(records_file) + 10))
+    assert find_results_store(log_file) is None
+    assert not isinstance(load_results(log_file).records, np.memmap)
+
+
+def test_success_and_collision_vectors(simulated_log):
+    log_file = simulated_log[0]
+    results = SimulationResults.from_csv(log_file)
+    assert results.success_vectors()['first'].tolist() == [True, False, True, False, False, True]
+    assert results.collision_vectors()['second'].tolist() == [True, False, False, True]
+    assert results.status_frequencies().tolist() == [4, 1, 1, 1, 0, 1, 1]
+
+
+def test_topk_success_rates_of_objects_without_grasps_are_nan():
+    rates = topk_success_rates([np.array([True, False, True, True]), np.empty(0, dtype=bool)])
+    assert np.allclose(rates[:, 0], [1.0, 1.0, 0.5, 0.75])
+    assert np.all(np.isnan(rates[:, 1]))
+
+
+def test_resume_drops_a_truncated_last_line(simulated_log):
+    log_file = simulated_log[0]
+    with open(log_file, 'r') as f:
+        lines = f.readlines()
+    with open(log_file, 'a') as f:
+        f.write('first,3,5,0.1,0.2')
+    completed = load_completed_results(log_file)
+    with open(log_file, 'r') as f:
+        assert f.readlines() == lines
+    assert np.array_equal(completed.records, SimulationResults.from_csv(log_file).records)
+    assert 3 not in completed['first']['annotationIndex']
+
+
+def test_resume_keeps_a_complete_log(simulated_log):
+    log_file = simulated_log[0]
+    with open(log_file, 'r') as f:
+        content = f.read()
+    completed = load_completed_results(log_file)
+    with open(log_file, 'r') as f:
+        assert f.read() == content
+    assert sum(len(records) for _, records in completed.items()) == 9
+
+
+def test_resume_without_log(tmp_path):
+    assert load_completed_results(str(tmp_path / 'missing_log.csv')) is None
+
+
+def test_topk_grasp_numbers():
+    numbers = topk_grasp_numbers([1, 4, 10, 25, 101])
+    assert numbers.tolist() == [
+        [1, 1, 1, 2, 10],
+        [1, 1, 3, 8, 30],
+        [1, 2, 5, 12, 50],
+        [1, 4, 10, 25, 101]
+    ]
+
+
+def wilson_bounds(success_num, sample_num, z=1.96):
+    """ bounds of the Wilson score interval without finite population correction (i.e. an infinite population) """
+    half_width = wilson_half_width(success_num, sample_num, 10 ** 12, z)
+    rate = success_num / sample_num
+    center = (rate + z ** 2 / (2 * sample_num)) / (1 + z ** 2 / sample_num)
+    return center - half_width, center + half_width
+
+
+@pytest.mark.parametrize('sample_num', [1, 5, 40, 1000])
+def test_wilson_bounds_at_zero_and_all_successes(sample_num):
+    lower, upper = wilson_bounds(0, sample_num)
+    assert lower == pytest.approx(0, abs=1e-12) and 0 < upper < 1
+    lower, upper = wilson_bounds(sample_num, sample_num)
+    assert upper == pytest.approx(1, abs=1e-12) and 0 < lower < 1
+
+
+def test_wilson_half_width_with_finite_population():
+    assert wilson_half_width(0, 0, 10) == 1.0
+    assert wilson_half_width(3, 10, 10) == 0.0
+    # sampling more of the population narrows the interval
+    half_widths = [wilson_half_width(sample_num // 2, sample_num, 100) for sample_num in [10, 50, 90, 99]]
+    assert all(a > b > 0 for a, b in zip(half_widths[:-1], half_widths[1:]))
+    assert wilson_half_width(5, 10, 100) < wilson_half_width(5, 10, 10 ** 12)
+
+
+def test_log_writer_flushes_finished_chunks_and_appends(tmp_path):
+    log_file = str(tmp_path / 'predictions_log.csv')
+    annotation = np.arange(8) / 10
+    writer = LogWriter(log_file)
+    writer.add('second', 0, 1, annotation)
+    writer.add('first', 2, 0, annotation)
+    writer.flush()
+    # flushed lines are on disk while the writer is still open, so an interrupted run can be resumed
+    with open(log_file, 'r') as f:
+        assert f.readlines() == [format_log_line('second', 0, 1, annotation),
+                                 format_log_line('first', 2, 0, annotation)]
+    writer.add('first', 3, 4, annotation)
+    writer.close()
+    assert list(writer.objIds) == ['second', 'first']
+
+    with LogWriter(log_file, append=True) as writer:
+        writer.add('third', 0, 0, annotation)
+    assert SimulationResults.from_csv(log_file).objIdList == ['second', 'first', 'third']
+
+    with LogWriter(None) as writer:
+        writer.add('first', 0, 0, annotation)
+    assert not writer.objIds
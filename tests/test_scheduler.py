@@ -0,0 +1,103 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from gpnet_sim.scheduler import ChunkSizer, SharedArray, WorkerPool, plan_object_chunks, shared_memory
+
+
+def covered_grasps(plan, annotation_counts):
+    """ number of times each grasp of each object appears in the chunks of the plan """
+    coverage = [np.zeros(count, dtype=int) for count in annotation_counts]
+    for chunks in plan:
+        for obj_index, start, stop in chunks:
+            coverage[obj_index][start:stop] += 1
+    return coverage
+
+
+@pytest.mark.parametrize('worker_num', [1, 2, 3, 7])
+@pytest.mark.parametrize('chunk_size', [None, 1, 5])
+def test_plan_covers_every_grasp_once(worker_num, chunk_size):
+    annotation_counts = [0, 1, 6, 13, 100, 4, 37]
+    plan = plan_object_chunks(annotation_counts, worker_num, chunk_size)
+    assert len(plan) == worker_num
+    for coverage in covered_grasps(plan, annotation_counts):
+        assert np.all(coverage == 1)
+
+
+def test_plan_keeps_chunks_of_an_object_consecutive():
+    plan = plan_object_chunks([50, 3, 80, 20], 3, chunkSize=4)
+    for chunks in plan:
+        assert all(stop - start <= 4 for _, start, stop in chunks)
+        obj_indices = [obj_index for obj_index, _, _ in chunks]
+        # each object forms one run of chunks, in order of the annotations
+        runs = [obj_index for i, obj_index in enumerate(obj_indices) if i == 0 or obj_indices[i - 1] != obj_index]
+        assert len(runs) == len(set(runs))
+        for (obj_a, _, stop_a), (obj_b, start_b, _) in zip(chunks[:-1], chunks[1:]):
+            if obj_a == obj_b:
+                assert start_b >= stop_a
+
+
+def test_plan_balances_workers():
+    plan = plan_object_chunks([100, 90, 10, 5, 60, 35], 4)
+    loads = [sum(stop - start for _, start, stop in chunks) for chunks in plan]
+    assert max(loads) - min(loads) <= np.ceil(300 / 4 / 2)
+
+
+def test_plan_without_grasps():
+    assert plan_object_chunks([], 2) == [[], []]
+    assert plan_object_chunks([0, 0], 3) == [[], [], []]
+
+
+def test_chunk_sizer_grows_at_most_twofold_towards_the_target():
+    sizer = ChunkSizer(targetDuration=1.0, minSize=1, maxSize=1000, smoothing=1.0)
+    sizes = []
+    for _ in range(12):
+        size = sizer.next_size()
+        sizes.append(size)
+        sizer.record(size, 0.01 * size)
+    assert sizes[:8] == [1, 2, 4, 8, 16, 32, 64, 100]
+    assert sizes[-1] == 100
+
+
+def test_chunk_sizer_shrinks_and_respects_limits():
+    sizer = ChunkSizer(targetDuration=1.0, minSize=2, maxSize=50, smoothing=1.0)
+    sizer.record(10, 0.001)
+    sizer.record(10, 0.001)
+    assert sizer.next_size() <= 50
+    sizer.record(10, 100.0)
+    assert sizer.next_size() == 2
+
+
+def rows_of_chunk(key, start, stop):
+    return key, list(range(start, stop))
+
+
+@pytest.mark.parametrize('worker_num, backend', [(1, 'process'), (2, 'thread')])
+def test_adaptive_chunks_cover_every_grasp_once(worker_num, backend):
+    annotation_counts = [30, 7, 0, 55]
+    plan = plan_object_chunks(annotation_counts, worker_num)
+    coverage = [np.zeros(count, dtype=int) for count in annotation_counts]
+    with WorkerPool(worker_num, backend=backend) as pool:
+        for key, rows in pool.map_adaptive(plan, lambda *chunk: (rows_of_chunk, chunk), ChunkSizer(maxSize=8)):
+            coverage[key][rows] += 1
+    assert all(np.all(counts == 1) for counts in coverage)
+
+
+def shared_rows(shared, start, stop):
+    return shared.get(start, stop)
+
+
+@pytest.mark.skipif(shared_memory is None, reason='shared memory requires python 3.8')
+def test_shared_array_is_attached_instead_of_copied():
+    array = np.arange(3000, dtype=float).reshape(1000, 3)
+    shared = SharedArray(array)
+    try:
+        state = pickle.dumps(shared)
+        assert len(state) < array.nbytes
+        assert np.array_equal(shared.get(2, 5), array[2:5])
+        with WorkerPool(1, inline=False) as pool:
+            assert np.array_equal(pool.submit(0, shared_rows, shared, 1, 7).result(), array[1:7])
+    finally:
+        shared.close()
+    assert shared.memory is None